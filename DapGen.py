@@ -6,6 +6,11 @@ DapGen -- a Kenwood database generator.
 DapGen is a media file scanner that scans a path for all media files, and
 generates a database for Kenwood car stereos.
 
+Several locations (e.g. a number of USB sticks) can be processed at once;
+locations on the same device are processed one after another by a single
+worker, and the number of databases being written at the same time can be
+capped.
+
 This module defines the following classes:
     MediaLocation
 
@@ -21,43 +26,73 @@ This module defines the following classes:
 
 import sys
 import os
+import time
 import logging
+import threading
 from argparse import ArgumentParser
 from argparse import RawDescriptionHelpFormatter
 
-from kmeldb.KenwoodDatabase import KenwoodDatabase
-from kmeldb.mounts import get_fat_mounts
-
-if sys.platform.startswith('linux'):
-    from kmeldb.linux_dir_parser import DirWalker
-elif sys.platform == 'darwin':
-    from kmeldb.mac_dir_parser import DirWalker
-elif sys.platform == 'win32':
-    pass
+# Only what is needed to parse the command line is imported here. The
+# scanner, tag reader, database writer and the optional tools are imported
+# when first used, so that e.g. --help and --version start quickly.
+from kmeldb.mounts import get_fat_mounts, mount_table
+from kmeldb.watch import DEFAULT_INTERVAL, DEFAULT_DEBOUNCE
+from kmeldb.profiling import PROFILE_MODES
+from kmeldb.schedule import SCHEDULES
+from kmeldb.iopolicy import POLICIES
+from kmeldb.collation import COLLATIONS
 
 log = logging.getLogger(__name__)
 
+
 __all__ = []
 __version__ = 0.2
 __date__ = '2014-05-12'
 __updated__ = '2016-04-16'
 
-# Holds the list of all media locations
-MediaLocations = []
-
 
 class MediaLocation(object):
     """
     An object to hold the media files within a given directory path.
-    It instantiates a KenwoodDatabase and one MediaFile per file.
+    It scans the path with kmeldb.build, and writes its database on
+    finalise.
     """
 
-    def __init__(self, path):
+    def __init__(
+            self,
+            path,
+            stats=None,
+            scan_stats=None,
+            progress_stream=None,
+            quiet=False,
+            seed=False,
+            schedule=None,
+            io_policy=None,
+            collation=None,
+            split_albums=False):
         """
-        Store the path, create empty lists in which to store media files
-        and playlists.
+        Store the path, create the database directory if needed, and scan
+        the path (with kmeldb.build.scan_location) for its media files and
+        playlists.
+
+        If stats (a DatabaseStats) is given, the database build is
+        instrumented and the results recorded in it. If scan_stats (a
+        ScanStats) is given, the I/O performed by the scan is recorded in it.
+        If progress_stream is given, progress is also written to it as JSON
+        lines. If quiet is set, no progress is written to the terminal.
+        If seed is set, the tags of unchanged files are taken from the
+        existing database rather than read from the files. schedule (one of
+        kmeldb.schedule.SCHEDULES) sets the order in which tags are read,
+        and io_policy (one of kmeldb.iopolicy.POLICIES) how. collation (one
+        of kmeldb.collation.COLLATIONS) sets the alphabetical order of the
+        database, and if split_albums is set, albums of the same name in
+        different directories are kept apart.
         """
         self.topdir = path
+        self.stats = stats
+        self.scan_stats = scan_stats
+        self.collation = collation
+        self.split_albums = split_albums
 
         log.info("MediaLocation created at: {}".format(self.topdir))
 
@@ -69,51 +104,53 @@ class MediaLocation(object):
             log.info("Data directory does not exist - creating")
             os.mkdir(self.db_path)
 
-        # Create the database instance
-        self.database = KenwoodDatabase(self.db_path)
+        # The size of the previous database (if any) gives the progress ETA
+        from kmeldb.progress import ProgressReporter, expected_total
+        db_filename = os.path.join(self.db_path, "kenwood.dap")
+        self.progress = ProgressReporter(
+            label=self.topdir,
+            json_stream=progress_stream,
+            quiet=quiet,
+            total=expected_total(db_filename))
+
+        # The previous database is read before it is replaced
+        self.seed = None
+        if seed:
+            from kmeldb.seed import load_seed
+            self.seed = load_seed(db_filename)
+
+        # Scan now; the previous database is only replaced by finalise
+        from kmeldb.build import scan_location
+        scanned = scan_location(
+            self.topdir,
+            scan_stats=self.scan_stats,
+            progress=self.progress,
+            seed=self.seed,
+            schedule=schedule,
+            io_policy=io_policy)
 
         # The list of playlists
-        self.playlists = []
+        self.playlists = scanned.playlists
 
         # The list of media files
-        self.media_files = []
-
-        # Walk the directory tree
-        self.dir_walker = DirWalker(self.topdir, self.playlists, self.media_files)
-        self.dir_walker.walk()
-
-        # # Check to guard against missing fwalk (Mac)
-        # if hasattr(os, 'fwalk'):
-        #     for root, dirs, files, rootfd in os.fwalk(self.topdir):
-        #         self.get_directory_entries(self, root, rootfd, files)
-        # else:
-        #     for root, dirs, files in os.walk(self.topdir):
-        #         rootfd = open(root, 'r')
-        #         self.get_directory_entries(self, root, rootfd, files)
-        #         rootfd.close()
-        # print()
-
-        log.info("Number of media files: {}".format(len(self.media_files)))
-        log.info("Number of playlists: {}".format(len(self.playlists)))
-
-        # Read the playlists we found.
-        for pl in self.playlists:
-            pl.read()
-
-        # Iterate once through the media files and check if they're in any
-        # of the playlists.
-        for mf in self.media_files:
-            for pl in self.playlists:
-                if mf.fullname in pl.media_filenames:
-                    pl.add_media_file(mf)
+        self.media_files = scanned.media_files
 
     def finalise(self):
         """
         Write and finalise the database.
         """
         log.debug("MediaLocation finalised")
-        self.database.write_db(self.media_files, self.playlists)
-        self.database.finalise()
+        from kmeldb.build import write_database
+        from kmeldb.seed import write_file_stats
+        db_filename = os.path.join(self.db_path, "kenwood.dap")
+        write_database(
+            self.media_files,
+            db_filename,
+            self.playlists,
+            stats=self.stats,
+            collation=self.collation,
+            split_albums=self.split_albums)
+        write_file_stats(db_filename, self.media_files)
 
     def __str__(self):
         """
@@ -122,6 +159,264 @@ class MediaLocation(object):
         return "Location: {}".format(self.topdir)
 
 
+def process_location(
+        inpath,
+        stats=None,
+        scan_stats=None,
+        profile=None,
+        profile_dir='.',
+        progress_stream=None,
+        quiet=False,
+        writers=None,
+        verify=False,
+        seed=False,
+        schedule=None,
+        io_policy=None,
+        collation=None,
+        split_albums=False):
+    """
+    Scan a location and write its database, returning a summary dictionary.
+
+    The MediaLocation is dropped before returning, so its media files are
+    released as soon as the location is finished. If writers (a semaphore)
+    is given, it is held while the database is written. If verify is set,
+    the written database is checked with kmeldb.fsck. If seed is set, tags
+    are reused from the existing database (see kmeldb.seed). schedule and
+    io_policy set the order of tag reads and how files are read (see
+    kmeldb.schedule and kmeldb.iopolicy), and collation the alphabetical
+    order of the database (see kmeldb.collation). If split_albums is set,
+    albums of the same name in different directories are kept apart. Errors
+    are logged and recorded in the summary rather than raised, so that one
+    bad location does not stop the others.
+    """
+    log.debug("Processing path: {}".format(inpath))
+
+    summary = {
+        'path': inpath,
+        'files': 0,
+        'playlists': 0,
+        'scan': 0.0,
+        'write': 0.0,
+        'error': None}
+
+    try:
+        profiler = None
+        if profile:
+            from kmeldb.profiling import Profiler
+            profiler = Profiler(profile, profile_dir, inpath)
+
+        def run(phase, function, *args, **kwargs):
+            if profiler is None:
+                return function(*args, **kwargs)
+            return profiler.run(phase, function, *args, **kwargs)
+
+        start = time.monotonic()
+        ml = run(
+            'scan', MediaLocation, inpath,
+            stats=stats, scan_stats=scan_stats,
+            progress_stream=progress_stream, quiet=quiet, seed=seed,
+            schedule=schedule, io_policy=io_policy, collation=collation,
+            split_albums=split_albums)
+        summary['files'] = len(ml.media_files)
+        summary['playlists'] = len(ml.playlists)
+        summary['scan'] = time.monotonic() - start
+
+        # Write it out
+        if writers is None:
+            start = time.monotonic()
+            run('write', ml.finalise)
+        else:
+            with writers:
+                start = time.monotonic()
+                run('write', ml.finalise)
+        summary['write'] = time.monotonic() - start
+
+        if verify:
+            from kmeldb.fsck import fsck
+            result = fsck(os.path.join(ml.db_path, "kenwood.dap"))
+            if not result.ok:
+                log.error("Database check failed:\n{}".format(result))
+                summary['error'] = 'database check found {} problem(s)'.format(
+                    sum(result.counts.values()))
+
+    except Exception as e:
+        log.exception("Failed to process {}".format(inpath))
+        summary['error'] = str(e) or e.__class__.__name__
+
+    return summary
+
+
+def group_by_device(paths):
+    """
+    Return a list of lists of paths, one list per device, in the order
+    the devices were first seen.
+    """
+    groups = {}
+    for path in paths:
+        try:
+            device = os.stat(path).st_dev
+        except OSError:
+            # Let process_location report the error
+            device = path
+        groups.setdefault(device, []).append(path)
+    return list(groups.values())
+
+
+def format_summary(summaries):
+    """
+    Return a table of per-location summaries as a string.
+    """
+    lines = ['{:30s} {:>7s} {:>9s} {:>8s} {:>8s}  {}'.format(
+        'Location', 'Files', 'Playlists', 'Scan', 'Write', 'Status')]
+    for summary in summaries:
+        lines.append('{:30s} {:7d} {:9d} {:7.2f}s {:7.2f}s  {}'.format(
+            summary['path'],
+            summary['files'],
+            summary['playlists'],
+            summary['scan'],
+            summary['write'],
+            'FAILED: {}'.format(summary['error'])
+            if summary['error'] else 'ok'))
+    return '\n'.join(lines)
+
+
+def watch(args, progress_stream=None):
+    """
+    Build and rebuild locations as they appear and change, until
+    interrupted.
+    """
+    sleep = time.sleep
+    if args.paths:
+        def locations():
+            return args.paths
+    else:
+        def locations():
+            return [m[0] for m in get_fat_mounts()]
+
+        # Wake up as soon as something is mounted
+        table = mount_table()
+        if table is not None:
+            sleep = table.wait
+
+    def build(inpath):
+        summary = process_location(
+            inpath,
+            progress_stream=progress_stream,
+            verify=args.verify,
+            seed=True,
+            schedule=args.schedule,
+            io_policy=args.io_policy,
+            collation=args.collation,
+            split_albums=args.split_albums)
+        print(format_summary([summary]))
+
+    from kmeldb.watch import Watcher
+    watcher = Watcher(
+        build,
+        locations,
+        interval=args.watch_interval,
+        debounce=args.debounce,
+        sleep=sleep)
+    watcher.run()
+    return 0
+
+
+def sync(args, progress_stream=None):
+    """
+    Copy the source tree to each path, building each database from the data
+    copied rather than by scanning the path afterwards. The collation,
+    split albums, I/O policy and statistics options apply as to a scan.
+    """
+    from kmeldb.progress import ProgressReporter
+    from kmeldb.staging import sync as sync_location
+    if args.stats:
+        from kmeldb.stats import DatabaseStats
+
+    summaries = []
+    all_stats = {}
+    for inpath in args.paths:
+        summary = {
+            'path': inpath,
+            'files': 0,
+            'playlists': 0,
+            'scan': 0.0,
+            'write': 0.0,
+            'error': None}
+        try:
+            progress = ProgressReporter(
+                label=inpath, json_stream=progress_stream)
+            if args.stats:
+                all_stats[inpath] = DatabaseStats()
+            result = sync_location(
+                args.sync,
+                inpath,
+                stats=all_stats.get(inpath),
+                progress=progress,
+                io_policy=args.io_policy,
+                collation=args.collation,
+                split_albums=args.split_albums)
+            summary['files'] = result.build.titles
+            summary['playlists'] = result.build.playlists
+            summary['scan'] = result.build.scan_time
+            summary['write'] = result.build.write_time
+
+            if args.verify:
+                from kmeldb.fsck import fsck
+                checked = fsck(
+                    os.path.join(inpath, "kenwood.dap", "kenwood.dap"))
+                if not checked.ok:
+                    log.error("Database check failed:\n{}".format(checked))
+                    summary['error'] = \
+                        'database check found {} problem(s)'.format(
+                            sum(checked.counts.values()))
+        except Exception as e:
+            log.exception("Failed to sync {}".format(inpath))
+            summary['error'] = str(e) or e.__class__.__name__
+        summaries.append(summary)
+
+    print(format_summary(summaries))
+    if args.stats:
+        import json
+        with open(args.stats, 'w') as f:
+            json.dump(
+                {path: all_stats[path].as_dict() for path in all_stats},
+                f,
+                indent=2)
+    if any(s['error'] for s in summaries):
+        return 1
+    return 0
+
+
+def plan(args, paths):
+    """
+    Report the size of the database each path would get, and any limits of
+    the format it would exceed, without reading tags or writing anything.
+    """
+    from kmeldb.planner import plan_location
+
+    status = 0
+    for inpath in paths:
+        seed = None
+        if args.seed:
+            from kmeldb.seed import load_seed
+            seed = load_seed(
+                os.path.join(inpath, "kenwood.dap", "kenwood.dap"))
+        try:
+            result = plan_location(
+                inpath,
+                seed=seed,
+                collation=args.collation,
+                split_albums=args.split_albums)
+        except Exception:
+            log.exception("Failed to plan {}".format(inpath))
+            status = 1
+            continue
+        print(result)
+        if not result.ok:
+            status = 1
+    return status
+
+
 LGFMT = '%(levelname)-8s: %(filename)s:%(lineno)d - %(message)s'
 
 
@@ -153,8 +448,6 @@ def main(argv=None):  # IGNORE:C0111
 USAGE
 ''' % (program_shortdesc, str(__date__))
 
-    default_mounts = [m[0] for m in get_fat_mounts()]
-
     try:
         # Setup argument parser
         parser = ArgumentParser(
@@ -184,6 +477,172 @@ USAGE
                 [default: %(default)s]''',
             metavar="RE")
 
+        parser.add_argument(
+            "-s", "--stats",
+            dest="stats",
+            help='''Write per-table timings, sizes and entry counts for
+                each database to this file as JSON.
+                [default: %(default)s]''',
+            metavar="FILE")
+
+        parser.add_argument(
+            "--io-stats",
+            dest="io_stats",
+            help='''Count the I/O performed while scanning, print a latency
+                summary and write the per-file details to this file as JSON.
+                [default: %(default)s]''',
+            metavar="FILE")
+
+        parser.add_argument(
+            "--progress-fd",
+            dest="progress_fd",
+            type=int,
+            help='''Also write scanning progress to this file descriptor
+                as JSON lines. [default: %(default)s]''',
+            metavar="FD")
+
+        parser.add_argument(
+            "-p", "--profile",
+            dest="profile",
+            choices=PROFILE_MODES,
+            help='''Profile scanning and database writing with cProfile
+                (cpu), tracemalloc (mem) or both. Locations are then
+                processed one at a time, whatever --jobs is.
+                [default: %(default)s]''')
+
+        parser.add_argument(
+            "--profile-dir",
+            dest="profile_dir",
+            help='''Directory in which to write profile results.
+                [default: %(default)s]''',
+            metavar="DIR",
+            default=".")
+
+        parser.add_argument(
+            "-j", "--jobs",
+            dest="jobs",
+            type=int,
+            help='''The number of devices to process at once; paths on
+                the same device are always processed in turn. 0 means one
+                worker per device. Ignored with --profile.
+                [default: %(default)s]''',
+            metavar="N",
+            default=1)
+
+        parser.add_argument(
+            "--max-writers",
+            dest="max_writers",
+            type=int,
+            help='''The maximum number of databases written at once.
+                0 means no limit. [default: %(default)s]''',
+            metavar="N",
+            default=0)
+
+        parser.add_argument(
+            "--verify",
+            dest="verify",
+            action="store_true",
+            help='''Check the structure of each database after writing it.
+                [default: %(default)s]''')
+
+        parser.add_argument(
+            "--seed",
+            dest="seed",
+            action="store_true",
+            help='''Reuse the tags recorded in each location's existing
+                database for files whose size and modification time are
+                those recorded when it was written. [default: %(default)s]''')
+
+        parser.add_argument(
+            "--schedule",
+            dest="schedule",
+            choices=SCHEDULES,
+            help='''The order in which tags are read: as the files are
+                found (directory), or by where they are on the device
+                (physical), which is faster on slow or spinning drives.
+                [default: directory]''')
+
+        parser.add_argument(
+            "--io-policy",
+            dest="io_policy",
+            choices=POLICIES,
+            help='''How media files are read for their tags: buffered
+                (default), without read-ahead and dropped from the page
+                cache afterwards (fadvise), as fadvise with positioned
+                reads into a reused buffer (pread), or as pread with mp3
+                tags parsed in place in the buffer (header). With
+                --io-stats, the bytes fetched from the device per file are
+                reported. [default: default]''')
+
+        parser.add_argument(
+            "--collation",
+            dest="collation",
+            choices=COLLATIONS,
+            help='''The alphabetical order of titles, genres, performers
+                and albums: as earlier versions (legacy), with case and
+                accents folded as KMEL does (fold), or that of the locale
+                given by LC_COLLATE or LANG (locale).
+                [default: legacy]''')
+
+        parser.add_argument(
+            "--split-albums",
+            dest="split_albums",
+            action="store_true",
+            help='''Keep albums of the same name in different directories
+                apart, rather than merging them into one album (e.g. the
+                "Greatest Hits" of many performers). [default: %(default)s]''')
+
+        # Planning, watching and syncing are different ways of running
+        modes = parser.add_mutually_exclusive_group()
+
+        modes.add_argument(
+            "--plan",
+            dest="plan",
+            action="store_true",
+            help='''Write nothing, but list the media files of each
+                location without reading their tags (with --seed, taking
+                them from its existing database) and report the entry
+                counts and table sizes of its database, and any limits of
+                the format it would exceed. [default: %(default)s]''')
+
+        modes.add_argument(
+            "-w", "--watch",
+            dest="watch",
+            action="store_true",
+            help='''Keep running, building each location when it appears
+                and rebuilding it (reusing the tags in its database) when
+                its contents change. Without paths, FAT partitions are
+                watched as they are mounted. Not with --stats, --io-stats,
+                --profile or --jobs. [default: %(default)s]''')
+
+        parser.add_argument(
+            "--watch-interval",
+            dest="watch_interval",
+            type=float,
+            help='''Seconds between checks in watch mode.
+                [default: %(default)s]''',
+            metavar="SECONDS",
+            default=DEFAULT_INTERVAL)
+
+        parser.add_argument(
+            "--debounce",
+            dest="debounce",
+            type=float,
+            help='''Seconds a location must be unchanged before it is
+                rebuilt in watch mode. [default: %(default)s]''',
+            metavar="SECONDS",
+            default=DEFAULT_DEBOUNCE)
+
+        modes.add_argument(
+            "--sync",
+            dest="sync",
+            help='''Copy SOURCE to each path (an empty FAT partition),
+                reading the tags of the media files as they are copied and
+                the short names as they are created, and build each
+                database without scanning the path again. Not with
+                --io-stats, --profile or --jobs. [default: %(default)s]''',
+            metavar="SOURCE")
+
         parser.add_argument(
             '-V', '--version',
             action='version',
@@ -192,18 +651,44 @@ USAGE
         parser.add_argument(
             dest="paths",
             help='''Paths to folder(s) with media file(s).
-                Default is all FAT partitions: %(default)s''',
+                Default is all FAT partitions.''',
             metavar="path",
-            nargs='*',
-            default=default_mounts)
+            nargs='*')
 
         # Process arguments
         args = parser.parse_args()
 
+        # Watching and syncing process one location at a time, unprofiled
+        for mode, mode_option, options in (
+                ('watch', '-w/--watch', (
+                    ('stats', '-s/--stats'),
+                    ('io_stats', '--io-stats'),
+                    ('profile', '-p/--profile'),
+                    ('jobs', '-j/--jobs'))),
+                ('sync', '--sync', (
+                    ('io_stats', '--io-stats'),
+                    ('profile', '-p/--profile'),
+                    ('jobs', '-j/--jobs')))):
+            if not getattr(args, mode):
+                continue
+            for dest, option in options:
+                if getattr(args, dest) != parser.get_default(dest):
+                    parser.error(
+                        'argument {}: not allowed with argument {}'.format(
+                            option, mode_option))
+
         paths = args.paths
         verbose = args.verbose
         inpat = args.include
         expat = args.exclude
+        stats_file = args.stats
+        io_stats_file = args.io_stats
+        profile = args.profile
+        progress_stream = None
+        if args.progress_fd is not None:
+            from kmeldb.progress import open_progress_fd
+            progress_stream = open_progress_fd(args.progress_fd)
+        profile_dir = args.profile_dir
 
         # Set logging level
         if verbose >= 2:
@@ -224,18 +709,112 @@ USAGE
                 'Nothing will be processed.')
             return -1
 
-        for inpath in paths:
-            log.debug("Processing path: {}".format(inpath))
+        if args.collation == 'locale':
+            import locale
+            locale.setlocale(locale.LC_COLLATE, '')
+
+        if args.plan:
+            return plan(args, paths or [m[0] for m in get_fat_mounts()])
+
+        if args.watch:
+            return watch(args, progress_stream)
 
-            # Create a MediaLocation and store it in the list
-            ml = MediaLocation(inpath)
-            MediaLocations.append(ml)
+        if args.sync:
+            if not args.paths:
+                print('The path(s) to copy to must be given with --sync.')
+                return -1
+            return sync(args, progress_stream)
 
-            # Write it out
-            ml.finalise()
+        # Only look for mounts if no paths were given
+        if not paths:
+            paths = [m[0] for m in get_fat_mounts()]
 
-        log.info("Number of media locations: {}".format(len(MediaLocations)))
+        if stats_file:
+            from kmeldb.stats import DatabaseStats
+        if io_stats_file:
+            from kmeldb.scan_stats import ScanStats
 
+        all_stats = {}
+        all_scan_stats = {}
+        for inpath in paths:
+            if stats_file:
+                all_stats[inpath] = DatabaseStats()
+            if io_stats_file:
+                all_scan_stats[inpath] = ScanStats()
+
+        groups = group_by_device(paths)
+        jobs = min(args.jobs or len(groups), len(groups)) or 1
+        # tracemalloc and the peak it records are process wide, so
+        # profiled locations are processed one at a time
+        if profile and jobs > 1:
+            log.info("Profiling, so processing one location at a time")
+            jobs = 1
+        concurrent = jobs > 1
+        writers = None
+        if args.max_writers:
+            writers = threading.BoundedSemaphore(args.max_writers)
+
+        def process_group(group):
+            return [
+                process_location(
+                    inpath,
+                    stats=all_stats.get(inpath),
+                    scan_stats=all_scan_stats.get(inpath),
+                    profile=profile,
+                    profile_dir=profile_dir,
+                    progress_stream=progress_stream,
+                    quiet=concurrent,
+                    writers=writers,
+                    verify=args.verify,
+                    seed=args.seed,
+                    schedule=args.schedule,
+                    io_policy=args.io_policy,
+                    collation=args.collation,
+                    split_albums=args.split_albums)
+                for inpath in group]
+
+        summaries = []
+        if concurrent:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                for results in executor.map(process_group, groups):
+                    summaries.extend(results)
+        else:
+            for group in groups:
+                summaries.extend(process_group(group))
+
+        for inpath in paths:
+            if inpath in all_stats:
+                log.info("Database statistics for {}:\n{}".format(
+                    inpath, all_stats[inpath]))
+            if inpath in all_scan_stats:
+                print("\nScan I/O for {}:\n{}".format(
+                    inpath, all_scan_stats[inpath]))
+
+        log.info("Number of media locations: {}".format(len(summaries)))
+        if len(summaries) > 1 or any(s['error'] for s in summaries):
+            print(format_summary(summaries))
+
+        if stats_file or io_stats_file:
+            import json
+
+        if stats_file:
+            with open(stats_file, 'w') as f:
+                json.dump(
+                    {path: all_stats[path].as_dict() for path in all_stats},
+                    f,
+                    indent=2)
+
+        if io_stats_file:
+            with open(io_stats_file, 'w') as f:
+                json.dump(
+                    {path: all_scan_stats[path].as_dict()
+                        for path in all_scan_stats},
+                    f,
+                    indent=2)
+
+        if any(s['error'] for s in summaries):
+            return 1
         return 0
 
     except KeyboardInterrupt:
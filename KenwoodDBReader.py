@@ -1,8 +1,11 @@
 #!/usr/bin/env /usr/bin/python3
 
+import io
+import sys
 import argparse
 import logging
 import struct
+from array import array
 
 log = logging.getLogger(__name__)
 FORMAT = '%(levelname)s: %(message)s'
@@ -130,6 +133,41 @@ STRING_ENCODING = "utf_16_le"
 INDEX_FORMAT = "<HHHHIIIHHIHHIHHIHHIHHII"
 
 
+class StringTable(object):
+    '''
+    A table of strings, decoded in one go.
+
+    Strings are sliced out of the decoded table where the byte offsets map
+    directly onto character offsets; otherwise (e.g. surrogate pairs in
+    utf_16_le, or undecodable data) each string is decoded on its own.
+    '''
+
+    def __init__(self, bfr, start, end, encoding):
+        self._bfr = bfr
+        self._start = start
+        self._encoding = encoding
+        self._width = 2 if encoding == STRING_ENCODING else 1
+        self._size = max(end - start, 0)
+        try:
+            self._text = bytes(bfr[start:start + self._size]).decode(encoding)
+        except UnicodeDecodeError:
+            self._text = None
+        if self._text is not None and \
+                len(self._text) * self._width != self._size:
+            self._text = None
+
+    def get(self, offset, length):
+        '''Return the string of length bytes at offset in the table.'''
+        width = self._width
+        if self._text is not None and \
+                offset % width == 0 and \
+                length % width == 0 and \
+                offset + length <= self._size:
+            return self._text[offset // width:(offset + length) // width]
+        start = self._start + offset
+        return self._bfr[start:start + length].decode(self._encoding)
+
+
 def debug_title(debug):
     if DUMP_TITLE:
         log.debug(debug)
@@ -489,8 +527,64 @@ class SubIndexEntry(object):
             self.count)
 
 
+# The tables that can be parsed (each by the parse_<name> method), in file
+# order, and the tables each depends on.
+TABLES = (
+    'u2',
+    'u3',
+    'main_index',
+    'alpha_ordered_titles',
+    'genres',
+    'genre_ordered_titles',
+    'performers',
+    'performer_ordered_titles',
+    'albums',
+    'album_ordered_titles',
+    'u8',
+    'playlists',
+    'u9',
+    'u10',
+    'u11',
+    'u12',
+    'sub_index_entries',
+    'sub_indices')
+
+DEPENDENCIES = {
+    'alpha_ordered_titles': ('main_index',),
+    'genres': ('main_index',),
+    'genre_ordered_titles': ('main_index',),
+    'performers': ('main_index',),
+    'performer_ordered_titles': ('main_index',),
+    'albums': ('main_index',),
+    'album_ordered_titles': ('main_index',),
+    'playlists': ('main_index',),
+    'sub_indices': (
+        'main_index', 'genres', 'performers', 'sub_index_entries'),
+}
+
+# The tables needed for each kind of dump (including those whose debug
+# output is enabled by it)
+DUMP_TABLES = {
+    'title': ('main_index', 'alpha_ordered_titles'),
+    'genre': ('genres',),
+    'performer': ('performers',),
+    'album': ('albums', 'album_ordered_titles'),
+    'playlist': ('playlists',),
+}
+
+
 class DBfile(object):
-    def __init__(self, filename):
+    def __init__(self, filename, bulk=True, tables=TABLES):
+        '''
+        Read the database in filename and parse (and so check) the given
+        tables, plus the tables they depend on. Other tables can be parsed
+        later with parse().
+
+        If bulk is False, entries and title lists are unpacked one at a
+        time, as they used to be (kept for comparison in benchmarks).
+        '''
+        self.bulk = bulk
+        self.parsed = set()
 
         # Open the file, read it into a buffer, close it
         f = open(filename, 'rb')
@@ -508,23 +602,19 @@ class DBfile(object):
 
         debug_album('Album count: {}'.format(self.details[album_count][0]))
 
-        self.parse_u2()
-        self.parse_u3()
-        self.parse_main_index()
-        self.parse_alpha_ordered_titles()
-        self.parse_genres()
-        self.parse_genre_ordered_titles()
-        self.parse_performers()
-        self.parse_performer_ordered_titles()
-        self.parse_albums()
-        self.parse_album_ordered_titles()
-        self.parse_u8()
-        self.parse_playlists()
-        self.parse_u9()
-        self.parse_u10()
-        self.parse_u11()
-        self.parse_u12()
-        self.parse_sub_indices()
+        for name in tables:
+            self.parse(name)
+
+    def parse(self, name):
+        '''Parse the named table, and its dependencies, if not yet done.'''
+        if name in self.parsed:
+            return
+        if name not in TABLES:
+            raise ValueError('Unknown table: {}'.format(name))
+        for dependency in DEPENDENCIES.get(name, ()):
+            self.parse(dependency)
+        getattr(self, 'parse_' + name)()
+        self.parsed.add(name)
 
     def parse_u2(self):
         # log.debug("Parsing u2")
@@ -541,6 +631,9 @@ class DBfile(object):
         self.entries = []
         if self.details[title_entry_size][0] != struct.calcsize(INDEX_FORMAT):
             log.warning("Unexpected index size")
+        elif self.bulk:
+            self.parse_main_index_bulk()
+            return
         current = self.details[main_index_offset][0]
         for index in range(self.details[title_count][0]):
             value = struct.unpack_from(INDEX_FORMAT, self.db, current)
@@ -589,19 +682,74 @@ class DBfile(object):
             self.entries.append(main_index_entry)
             current += self.details[title_entry_size][0]
 
+    def parse_main_index_bulk(self):
+        '''Parse the main index with one iter_unpack and bulk decoded
+        string tables.'''
+        count = self.details[title_count][0]
+        start = self.details[main_index_offset][0]
+        end = start + count * self.details[title_entry_size][0]
+
+        def table(offset, next_offset, encoding):
+            return StringTable(
+                self.db,
+                self.details[offset][0],
+                self.details[next_offset][0],
+                encoding)
+
+        titles = table(title_offset, shortdir_offset, STRING_ENCODING)
+        shortdirs = table(shortdir_offset, shortfile_offset, 'ascii')
+        shortfiles = table(shortfile_offset, longdir_offset, 'ascii')
+        longdirs = table(longdir_offset, longfile_offset, STRING_ENCODING)
+        longfiles = table(
+            longfile_offset, alpha_title_order_offset, STRING_ENCODING)
+
+        entries = self.entries
+        for values in struct.iter_unpack(
+                INDEX_FORMAT, memoryview(self.db)[start:end]):
+            entry = MainIndexEntry(values, len(entries))
+            entry.set_title(titles.get(
+                entry.title_offset,
+                entry.title_length - entry.title_char))
+            entry.set_shortdir(shortdirs.get(
+                entry.shortdir_offset,
+                entry.shortdir_length - entry.shortdir_char))
+            entry.set_shortfile(shortfiles.get(
+                entry.shortfile_offset,
+                entry.shortfile_length - entry.shortfile_char))
+            entry.set_longdir(longdirs.get(
+                entry.longdir_offset,
+                entry.longdir_length - entry.longdir_char))
+            entry.set_longfile(longfiles.get(
+                entry.longfile_offset,
+                entry.longfile_length - entry.longfile_char))
+            entries.append(entry)
+
+    def read_shorts(self, offset, count):
+        '''Return a list of count short ints starting at offset.'''
+        if not self.bulk:
+            increment = struct.calcsize("<H")
+            return [
+                struct.unpack_from("<H", self.db, offset + index * increment)[0]
+                for index in range(count)]
+        values = array('H')
+        values.frombytes(self.db[offset:offset + count * values.itemsize])
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return values.tolist()
+
     def parse_alpha_ordered_titles(self):
         debug_title("Parsing alpha_ordered_titles")
         # log.debug("alpha_ordered_titles offset: {:08x}".format(
         #     self.details[alpha_title_order_offset][0]))
         current = self.details[alpha_title_order_offset][0]
-        increment = struct.calcsize("<H")
-        for index in range(self.details[title_count][0]):
-            value = struct.unpack_from("<H", self.db, current)
-            debug_title("\tT(alpha)- {}: {}".format(
-                value[0],
-                self.entries[value[0]]))
-            # TODO: Check alpha order
-            current += increment
+        count = self.details[title_count][0]
+        if DUMP_TITLE:
+            for value in self.read_shorts(current, count):
+                debug_title("\tT(alpha)- {}: {}".format(
+                    value,
+                    self.entries[value]))
+        # TODO: Check alpha order
+        current += count * struct.calcsize("<H")
         if current != self.details[genre_index_offset][0]:
             log.warning("Unexpected alpha_ordered_titles end offset")
 
@@ -623,12 +771,10 @@ class DBfile(object):
                 self.details[genre_name_offset][0] + genre_index_entry.name_offset + genre_index_entry.name_length - genre_index_entry.NAME_CHAR_LENGTH].decode(STRING_ENCODING)
             genre_index_entry.set_name(name)
 
-            titles = []
-            titles_current = self.details[genre_title_offset][0] + genre_index_entry.titles_offset
-            titles_increment = struct.calcsize("<H")
-            for titles_index in range(genre_index_entry.titles_count):
-                titles.append(struct.unpack_from("<H", self.db, titles_current)[0])
-                titles_current += titles_increment
+            titles = self.read_shorts(
+                self.details[genre_title_offset][0] +
+                genre_index_entry.titles_offset,
+                genre_index_entry.titles_count)
             genre_index_entry.set_titles(titles, self.entries)
             #log.debug("Titles: ", titles)
 
@@ -640,24 +786,19 @@ class DBfile(object):
         # log.debug("genre_ordered_titles offset: {:08x}".format(
         #     self.details[genre_title_order_offset][0]))
         current = self.details[genre_title_order_offset][0]
-        increment = struct.calcsize("<H")
+        count = self.details[title_count][0]
         verify = 0
-        for index in range(self.details[title_count][0]):
-
-            value = struct.unpack_from(
-                "<H",
-                self.db,
-                current)
+        for value in self.read_shorts(current, count):
 
             # log.debug("\tT(G)- {} {}".format(
-            #     value[0],
-            #     self.entries[value[0]]))
+            #     value,
+            #     self.entries[value]))
 
-            if self.entries[value[0]].genre >= verify:
-                verify = self.entries[value[0]].genre
+            if self.entries[value].genre >= verify:
+                verify = self.entries[value].genre
             else:
                 log.warning("genre_ordered_titles out of order")
-            current += increment
+        current += count * struct.calcsize("<H")
         if current != self.details[performer_index_offset][0]:
             log.warning("Unexpected genre_ordered_titles end offset")
 
@@ -676,12 +817,10 @@ class DBfile(object):
                 self.details[performer_name_offset][0] + performer_index_entry.name_offset + performer_index_entry.name_length - performer_index_entry.NAME_CHAR_LENGTH].decode(STRING_ENCODING)
             performer_index_entry.set_name(name)
 
-            titles = []
-            titles_current = self.details[performer_title_offset][0] + performer_index_entry.titles_offset
-            titles_increment = struct.calcsize("<H")
-            for titles_index in range(performer_index_entry.titles_count):
-                titles.append(struct.unpack_from("<H", self.db, titles_current)[0])
-                titles_current += titles_increment
+            titles = self.read_shorts(
+                self.details[performer_title_offset][0] +
+                performer_index_entry.titles_offset,
+                performer_index_entry.titles_count)
             performer_index_entry.set_titles(titles, self.entries)
             #log.debug("Titles: ", titles)
 
@@ -693,17 +832,16 @@ class DBfile(object):
         # log.debug("performer_ordered_titles offset: {:08x}".format(
         #     self.details[performer_title_order_offset][0]))
         current = self.details[performer_title_order_offset][0]
-        increment = struct.calcsize("<H")
+        count = self.details[title_count][0]
         verify = 0
-        for index in range(self.details[title_count][0]):
-            value = struct.unpack_from("<H", self.db, current)
+        for value in self.read_shorts(current, count):
             # log.debug("\tT(P)- {} {}".format(
-            #     value[0], self.entries[value[0]]))
-            if self.entries[value[0]].performer >= verify:
-                verify = self.entries[value[0]].performer
+            #     value, self.entries[value]))
+            if self.entries[value].performer >= verify:
+                verify = self.entries[value].performer
             else:
                 log.warning("performer_ordered_titles out of order")
-            current += increment
+        current += count * struct.calcsize("<H")
 
         # Check that we end up where we expect to be
         if current != self.details[album_index_offset][0]:
@@ -741,15 +879,12 @@ class DBfile(object):
 
             debug_album('Created album with name: {}'.format(name))
 
-            titles = []
             titles_current = self.details[album_title_offset][0] + \
                 album_index_entry.titles_offset
-            for titles_index in range(album_index_entry.titles_count):
-                titles.append(struct.unpack_from(
-                    "<H",
-                    self.db,
-                    titles_current)[0])
-                titles_current += titles_increment
+            titles = self.read_shorts(
+                titles_current, album_index_entry.titles_count)
+            titles_current += album_index_entry.titles_count * \
+                titles_increment
             album_index_entry.set_titles(titles, self.entries)
 
             debug_album('\tSet album titles to {}'.format(titles))
@@ -770,16 +905,9 @@ class DBfile(object):
 
             # Check for differences with the first time around.
             for album_index_entry in self.albums:
-                titles = []
-                second_current = titles_current + \
-                    album_index_entry.titles_offset
-
-                for titles_index in range(album_index_entry.titles_count):
-                    titles.append(struct.unpack_from(
-                        "<H",
-                        self.db,
-                        second_current)[0])
-                    second_current += titles_increment
+                titles = self.read_shorts(
+                    titles_current + album_index_entry.titles_offset,
+                    album_index_entry.titles_count)
                 if titles != album_index_entry.titles:
                     log.warning('Differences in: {}'.format(
                         album_index_entry.name))
@@ -802,15 +930,10 @@ class DBfile(object):
 
         # Get the offset
         current = self.details[album_title_order_offset][0]
-
-        increment = struct.calcsize("<H")
+        count = self.details[title_count][0]
 
         verify = 0
-        for index in range(self.details[title_count][0]):
-            title_index = struct.unpack_from(
-                "<H",
-                self.db,
-                current)[0]
+        for title_index in self.read_shorts(current, count):
 
             title = self.entries[title_index]
 
@@ -824,7 +947,7 @@ class DBfile(object):
             else:
                 log.warning("album_ordered_titles out of order")
 
-            current += increment
+        current += count * struct.calcsize("<H")
 
         # Check that we end up where we expect to be
         if current != self.details[playlist_index_offset][0]:
@@ -858,13 +981,10 @@ class DBfile(object):
 
             playlist_index_entry.set_name(name)
 
-            titles = []
-            titles_current = self.details[playlist_title_offset][0] + \
-                playlist_index_entry.titles_offset
-            titles_increment = struct.calcsize("<H")
-            for titles_index in range(playlist_index_entry.titles_count):
-                titles.append(struct.unpack_from("<H", self.db, titles_current)[0])
-                titles_current += titles_increment
+            titles = self.read_shorts(
+                self.details[playlist_title_offset][0] +
+                playlist_index_entry.titles_offset,
+                playlist_index_entry.titles_count)
             playlist_index_entry.set_titles(titles, self.entries)
 
             self.playlists.append(playlist_index_entry)
@@ -928,7 +1048,7 @@ class DBfile(object):
         if current != self.details[sub_index_offset][0]:
             log.warning("Unexpected u12 end offset")
 
-    def parse_sub_indices(self):
+    def parse_sub_index_entries(self):
         # log.debug("Parsing sub indices")
         # log.debug("sub_index_offset: {:08x}".format(
         #     self.details[sub_index_offset][0]))
@@ -964,6 +1084,7 @@ class DBfile(object):
             current += increment
             num += 1
 
+    def parse_sub_indices(self):
         self.parse_subindex_t0()
         self.parse_subindex_t1()
         self.parse_subindex_t2()
@@ -1466,49 +1587,43 @@ Album wrong 0x{:04x} != 0x{:04x}'''.format(
         if self.sub_index_entries[12].count != self.details[title_count][0]:
             log.warning("Unexpected sub index count 12")
 
-    def show_titles(self):
-        print("\nTitles:")
-        for index in range(self.details[title_count][0]):
-            print("\t{}".format(self.entries[index]))
-
-    def show_genres(self):
-        print("\nGenres:")
-        for index in range(self.details[genre_count][0]):
-            print(self.genres[index])
-            for title_index in range(self.genres[index].titles_count):
-                print("\t\t0x{:04x}: {}".format(
-                    index,
-                    self.entries[self.genres[index].titles[title_index]]))
-
-    def show_performers(self):
-        print("\nPerformers:")
-        for index in range(self.details[performer_count][0]):
-            print(self.performers[index])
-            for title_index in range(self.performers[index].titles_count):
-                print("\t\t0x{:04x}: {}".format(
-                    index,
-                    self.entries[self.performers[index].titles[title_index]]))
-
-    def show_albums(self):
-        print("\nAlbums:")
-        for index in range(self.details[album_count][0]):
-            print(self.albums[index])
-            for title_index in range(self.albums[index].titles_count):
-                print("\t\t0x{:04x}: {}".format(
-                    index,
-                    self.entries[self.albums[index].titles[title_index]]))
-
-    def show_playlists(self):
-        print("\nPlaylists:")
-        for index in range(self.details[playlist_count][0]):
-            print("\tPlaylist- 0x{:04x}: '{}'".format(
-                index, self.playlists[index].name))
-            for title_index in range(self.playlists[index].titles_count):
-                print("\t\t0x{:04x}: {}".format(
-                    index,
-                    self.entries[self.playlists[index].titles[title_index]]))
+    def show_titles(self, out=sys.stdout):
+        self.parse('main_index')
+        out.write("\nTitles:\n")
+        out.writelines("\t{}\n".format(entry) for entry in self.entries)
+
+    def _show_index(self, heading, entries, out):
+        out.write("\n{}:\n".format(heading))
+        for index, entry in enumerate(entries):
+            out.write("{}\n".format(entry))
+            out.writelines(
+                "\t\t0x{:04x}: {}\n".format(index, self.entries[title])
+                for title in entry.titles)
+
+    def show_genres(self, out=sys.stdout):
+        self.parse('genres')
+        self._show_index("Genres", self.genres, out)
+
+    def show_performers(self, out=sys.stdout):
+        self.parse('performers')
+        self._show_index("Performers", self.performers, out)
+
+    def show_albums(self, out=sys.stdout):
+        self.parse('albums')
+        self._show_index("Albums", self.albums, out)
+
+    def show_playlists(self, out=sys.stdout):
+        self.parse('playlists')
+        out.write("\nPlaylists:\n")
+        for index, playlist in enumerate(self.playlists):
+            out.write("\tPlaylist- 0x{:04x}: '{}'\n".format(
+                index, playlist.name))
+            out.writelines(
+                "\t\t0x{:04x}: {}\n".format(index, self.entries[title])
+                for title in playlist.titles)
 
     def __str__(self):
+        self.parse('sub_index_entries')
         contents = "\n"
         for index in range(title_count, main_index_offset):
             contents += "{:30s}: 0x{:08x}\n".format(
@@ -1553,6 +1668,17 @@ if __name__ == "__main__":
         default=[],
         help="specify what to dump to stdout " +
         "(title, genre, performer, album, playlist)")
+    parser.add_argument(
+        "-c",
+        "--check",
+        dest="check",
+        action="store",
+        nargs="*",
+        default=[],
+        choices=TABLES + ('all',),
+        metavar="TABLE",
+        help="also parse and check these tables when dumping " +
+        "({}, or all)".format(", ".join(TABLES)))
     parser.add_argument(
         "-i", "--input",
         dest="inputfile",
@@ -1579,17 +1705,35 @@ if __name__ == "__main__":
     if dump_all or "playlist" in args.dump:
         DUMP_PLAYLIST = True
 
-    db = DBfile(args.inputfile)
+    # Only parse what is to be dumped or checked
+    if dump_all or "all" in args.check:
+        tables = TABLES
+    else:
+        tables = []
+        for dump in args.dump:
+            tables.extend(DUMP_TABLES.get(dump, ()))
+        tables.extend(args.check)
+
+    db = DBfile(args.inputfile, tables=tables)
+
+    out = open(
+        sys.stdout.fileno(),
+        'w',
+        buffering=io.DEFAULT_BUFFER_SIZE * 8,
+        encoding=sys.stdout.encoding,
+        closefd=False)
 
     if dump_all or DUMP_TITLE:
-        db.show_titles()
+        db.show_titles(out)
     if dump_all or DUMP_GENRE:
-        db.show_genres()
+        db.show_genres(out)
     if dump_all or DUMP_PERFORMER:
-        db.show_performers()
+        db.show_performers(out)
     if dump_all or DUMP_ALBUM:
-        db.show_albums()
+        db.show_albums(out)
     if dump_all or DUMP_PLAYLIST:
-        db.show_playlists()
+        db.show_playlists(out)
+
+    out.flush()
 
     log.debug(db)
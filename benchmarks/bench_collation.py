@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+'''
+Benchmark sorting titles, genres, performers and albums under each
+collation.
+
+A library of random Unicode names (accented letters, apostrophes and mixed
+case) is generated, and the four sorts the database writer makes are timed
+with the key function it used before kmeldb.collation (a regular
+expression substitution per title) and with a fresh Collator for each
+collation, which computes its keys as it goes.
+
+    python3 -m benchmarks.bench_collation [--titles N]
+'''
+
+import re
+import sys
+import time
+import random
+import argparse
+
+from kmeldb.collation import Collator, COLLATIONS
+
+SYLLABLES = [
+    'ba', 'bä', 'ce', 'çe', 'di', 'dï', 'fo', 'fö',
+    'gu', 'gú', 'la', 'lå', 'me', 'mé', 'no', 'ñó',
+    'pi', 'pì', 'ro', 'rø', 'su', 'sü', 'ta', 'tâ',
+    "o'", "d'", 'Zo', 'Ka', 'Ma', 'Ne']
+
+
+def word(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4)))
+
+
+def name(rng, words):
+    text = ' '.join(word(rng) for _ in range(words))
+    return text.title() if rng.random() < 0.5 else text
+
+
+def make_library(number_of_titles, seed=1):
+    '''Return the titles, genres, performers and albums of a library.'''
+    rng = random.Random(seed)
+    genres = [name(rng, 1) for _ in range(50)]
+    performers = [name(rng, 2) for _ in range(number_of_titles // 50)]
+    albums = [name(rng, 3) for _ in range(number_of_titles // 10)]
+    titles = [name(rng, rng.randint(1, 5)) for _ in range(number_of_titles)]
+    return titles, set(genres), set(performers), set(albums)
+
+
+def sort_before(titles, genres, performers, albums):
+    for names in (genres, performers, albums):
+        sorted(names, key=str.lower)
+    sorted(titles, key=lambda t: re.sub("'", "", t.lower()))
+
+
+def sort_collated(collator, titles, genres, performers, albums):
+    for names in (genres, performers, albums):
+        sorted(names, key=collator.key)
+    sorted(titles, key=collator.title_key)
+
+
+def best_of(repeat, function, *args):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--titles', type=int, default=60000,
+        help='the number of titles to generate (default %(default)s)')
+    parser.add_argument(
+        '--repeat', type=int, default=5,
+        help='number of runs; the best is reported (default %(default)s)')
+    args = parser.parse_args(argv)
+
+    library = make_library(args.titles)
+    print('{} titles, {} genres, {} performers, {} albums'.format(
+        *[len(names) for names in library]))
+
+    print('{:10s} {:8.1f}ms'.format(
+        'before', best_of(args.repeat, sort_before, *library) * 1000))
+    for collation in COLLATIONS:
+        elapsed = best_of(
+            args.repeat,
+            lambda: sort_collated(Collator(collation), *library))
+        print('{:10s} {:8.1f}ms'.format(collation, elapsed * 1000))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+'''
+Benchmark reading tags under each I/O policy.
+
+The tags of every media file of a library are read under each policy of
+kmeldb.iopolicy, starting with the files dropped from the page cache, and
+the time taken, the bytes read by the tag readers and the bytes fetched
+from the device (including read-ahead) are reported per file. A library is
+generated unless an existing tree is given.
+
+    python3 -m benchmarks.bench_io_policy [--path DIR] [--files N]
+'''
+
+import sys
+import time
+import argparse
+import tempfile
+
+from kmeldb.iopolicy import IOPolicy, POLICIES
+from kmeldb.scan_stats import ScanStats
+from benchmarks.bench_schedule import make_library, directory_order, drop_cache
+
+
+def run(top):
+    fullnames = directory_order(top)
+    print('{} files under {}'.format(len(fullnames), top))
+    print('{:10s} {:>9s} {:>14s} {:>16s}'.format(
+        'policy', 'time', 'read/file', 'device/file'))
+    for name in POLICIES:
+        policy = IOPolicy(name)
+        stats = ScanStats()
+        drop_cache(fullnames)
+        start = time.perf_counter()
+        for fullname in fullnames:
+            stats.read_tags(fullname, policy)
+        elapsed = time.perf_counter() - start
+        device = stats.device_bytes
+        print('{:10s} {:8.3f}s {:14.0f} {:>16s}'.format(
+            name,
+            elapsed,
+            stats.bytes_read / len(fullnames),
+            'unknown' if device is None else
+            '{:.0f}'.format(device / len(fullnames))))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--path',
+        help='an existing tree to read, rather than a generated one')
+    parser.add_argument(
+        '--files', type=int, default=2000,
+        help='the number of files to generate (default %(default)s)')
+    parser.add_argument(
+        '--frames', type=int, default=2000,
+        help='MPEG frames per generated file (default %(default)s)')
+    args = parser.parse_args(argv)
+
+    if args.path:
+        run(args.path)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            make_library(directory, args.files, args.frames)
+            run(directory)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+'''
+Benchmark the parsing of a kenwood.dap file.
+
+Compares KenwoodDBReader.DBfile unpacking entries one at a time (the old
+behaviour) with its bulk path, with parsing only the tables needed to dump
+the titles, and with opening the lazy DatabaseReader.
+
+    python3 -m benchmarks.bench_reader [--titles N] [--input FILE]
+'''
+
+import os
+import sys
+import time
+import logging
+import tempfile
+import argparse
+
+import KenwoodDBReader
+from kmeldb.reader import DatabaseReader
+from benchmarks.synthetic import write_database, MAX_TITLES
+
+
+def best_of(repeat, function):
+    '''Return the best time of repeat calls to function.'''
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def run(filename, repeat):
+    def open_reader():
+        with DatabaseReader(filename) as reader:
+            reader.title(reader.title_count - 1).title
+
+    results = [
+        ('DBfile (per entry)',
+            best_of(repeat, lambda: KenwoodDBReader.DBfile(
+                filename, bulk=False))),
+        ('DBfile (bulk)',
+            best_of(repeat, lambda: KenwoodDBReader.DBfile(filename))),
+        ('DBfile (titles only)',
+            best_of(repeat, lambda: KenwoodDBReader.DBfile(
+                filename,
+                tables=KenwoodDBReader.DUMP_TABLES['title']))),
+        ('DatabaseReader open', best_of(repeat, open_reader))]
+
+    baseline = results[0][1]
+    for name, elapsed in results:
+        print('{:24s} {:10.4f}s {:8.1f}x'.format(
+            name, elapsed, baseline / elapsed))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--titles', type=int, default=MAX_TITLES,
+        help='size of the synthetic database (default %(default)s)')
+    parser.add_argument(
+        '--input', help='benchmark this database instead of a synthetic one')
+    parser.add_argument(
+        '--repeat', type=int, default=3,
+        help='number of runs; the best is reported (default %(default)s)')
+    args = parser.parse_args(argv)
+
+    # The reader logs every oddity it finds
+    logging.disable(logging.WARNING)
+
+    if args.input:
+        print('Database: {}'.format(args.input))
+        run(args.input, args.repeat)
+        return 0
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = write_database(directory, args.titles)
+        print('Database: {} titles, {} bytes'.format(
+            args.titles, os.path.getsize(filename)))
+        run(filename, args.repeat)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+'''
+Benchmark reading tags in directory order and in physical order.
+
+A fragmented library is made by writing the files of many albums in a
+shuffled order, so that the order in which directories list their files
+has little to do with where the files are on the device; alternatively an
+existing tree (e.g. a mounted, well used FAT image) can be given. Before
+each run the files are dropped from the page cache, so the tags are read
+from the device.
+
+    python3 -m benchmarks.bench_schedule [--path DIR] [--files N]
+'''
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+from kmeldb.MediaFile import valid_media_files
+from kmeldb.schedule import physical_order
+from kmeldb.tags import read_tags
+from tests.create_media_files import write_mp3
+
+TRACKS_PER_ALBUM = 10
+
+
+def make_library(directory, number_of_files, number_of_frames):
+    '''Write a library of number_of_files mp3 files, in a shuffled order.'''
+    files = []
+    for index in range(number_of_files):
+        album = os.path.join(
+            directory, 'Album {:04d}'.format(index // TRACKS_PER_ALBUM))
+        files.append((album, os.path.join(
+            album, '{:02d} Track.mp3'.format(index % TRACKS_PER_ALBUM + 1))))
+    random.Random(1).shuffle(files)
+    for album, fullname in files:
+        os.makedirs(album, exist_ok=True)
+        write_mp3(
+            fullname,
+            number_of_frames=number_of_frames,
+            title=os.path.basename(fullname),
+            album=os.path.basename(album))
+    os.sync()
+
+
+def directory_order(top):
+    '''Return the media files under top in the order a walk finds them.'''
+    fullnames = []
+    for root, dirs, files in os.walk(top):
+        fullnames.extend(
+            os.path.join(root, f) for f in files
+            if f.lower().endswith(valid_media_files))
+    return fullnames
+
+
+def drop_cache(fullnames):
+    for fullname in fullnames:
+        fd = os.open(fullname, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def time_reads(fullnames, order):
+    '''Return the time taken to read the tags of the files, in order.'''
+    drop_cache(fullnames)
+    start = time.perf_counter()
+    if order == 'physical':
+        fullnames = physical_order(fullnames)
+    for fullname in fullnames:
+        read_tags(fullname)
+    return time.perf_counter() - start
+
+
+def run(top, repeat):
+    fullnames = directory_order(top)
+    print('{} files under {}'.format(len(fullnames), top))
+    results = {}
+    for order in ('directory', 'physical'):
+        results[order] = min(
+            time_reads(fullnames, order) for _ in range(repeat))
+        print('{:10s} {:8.3f}s {:10.1f} files/s'.format(
+            order, results[order], len(fullnames) / results[order]))
+    print('speed up   {:8.2f}x'.format(
+        results['directory'] / results['physical']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--path',
+        help='an existing tree to read, rather than a generated one')
+    parser.add_argument(
+        '--files', type=int, default=2000,
+        help='the number of files to generate (default %(default)s)')
+    parser.add_argument(
+        '--frames', type=int, default=200,
+        help='MPEG frames per generated file (default %(default)s)')
+    parser.add_argument(
+        '--repeat', type=int, default=3,
+        help='number of runs; the best is reported (default %(default)s)')
+    args = parser.parse_args(argv)
+
+    if args.path:
+        run(args.path, args.repeat)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            make_library(directory, args.files, args.frames)
+            run(directory, args.repeat)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
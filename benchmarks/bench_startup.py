@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+'''
+Benchmark the start up time of the command line tools.
+
+Each module is imported in a fresh interpreter under python -X importtime,
+and the best cumulative import time is compared with a budget. Budgets are
+for the time on top of importing the standard library modules every tool
+needs (argparse and logging), which is measured the same way, so that they
+hold on slower machines. Sources are byte compiled first, so that stale
+or missing .pyc files (e.g. with PYTHONDONTWRITEBYTECODE set) are not
+measured as start up time. The modules that should only be imported when
+first used are checked for too. Exits non-zero if a budget is exceeded or
+a deferred module was imported.
+
+    python3 -m benchmarks.bench_startup [--repeat N]
+'''
+
+import os
+import sys
+import argparse
+import compileall
+import subprocess
+
+# The standard library modules imported by every tool
+BASELINE = ('argparse', 'logging')
+
+# The best cumulative import time allowed on top of the baseline, in
+# microseconds
+BUDGETS = {
+    'DapGen': 5000,
+    'KenwoodDBReader': 5000,
+}
+
+# Modules that should not be imported just to start up
+DEFERRED = (
+    'hsaudiotag',
+    'psutil',
+    'configparser',
+    'urllib.parse',
+    'fcntl',
+    'concurrent.futures',
+    'kmeldb.KenwoodDatabase',
+    'kmeldb.linux_dir_parser',
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(modules):
+    '''
+    Import modules in a fresh interpreter. Returns a dictionary of the
+    cumulative import time of each module imported, in microseconds.
+    '''
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c',
+         'import ' + ', '.join(modules)],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            times[fields[2].strip()] = int(fields[1])
+        except (IndexError, ValueError):
+            # The header line
+            continue
+    return times
+
+
+def best_of(repeat, modules):
+    '''
+    Return the total import time of modules and the import_times of the
+    fastest of repeat imports.
+    '''
+    best = None
+    for _ in range(repeat):
+        times = import_times(modules)
+        total = sum(times[m] for m in modules)
+        if best is None or total < best[0]:
+            best = (total, times)
+    return best
+
+
+def run(repeat):
+    compileall.compile_dir(ROOT, quiet=1)
+
+    baseline = best_of(repeat, BASELINE)[0]
+    print('{:20s} {:8.1f}ms'.format(', '.join(BASELINE), baseline / 1000))
+
+    ok = True
+    for module, budget in sorted(BUDGETS.items()):
+        total, best = best_of(repeat, (module,))
+        extra = total - baseline
+        deferred = [m for m in DEFERRED if m in best]
+        within = extra <= budget and not deferred
+        ok = ok and within
+        print('{:20s} {:8.1f}ms (+{:.1f}ms, budget +{:.1f}ms) {}'.format(
+            module, total / 1000, extra / 1000, budget / 1000,
+            'ok' if within else 'OVER'))
+        if deferred:
+            print('    imports {}'.format(', '.join(deferred)))
+
+        # The slowest direct imports of the module
+        slowest = sorted(
+            ((t, m) for m, t in best.items()
+             if m != module and not m.startswith('_')),
+            reverse=True)[:5]
+        for elapsed, name in slowest:
+            print('    {:8.1f}ms {}'.format(elapsed / 1000, name))
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--repeat', type=int, default=10,
+        help='number of runs; the best is reported (default %(default)s)')
+    args = parser.parse_args(argv)
+    return 0 if run(args.repeat) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
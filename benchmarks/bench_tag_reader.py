@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+'''
+Benchmark the cost in CPU and memory of reading tags under each I/O policy.
+
+The tags of every media file of a library are read with the files in the
+page cache, so that the time is spent parsing rather than waiting on the
+device. For each policy of kmeldb.iopolicy the time per file and (in a
+second, traced run) the peak memory allocated while reading a file are
+reported. A library is generated unless an existing tree is given.
+
+    python3 -m benchmarks.bench_tag_reader [--path DIR] [--files N]
+'''
+
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+from kmeldb.iopolicy import IOPolicy, POLICIES
+from kmeldb.tags import read_tags
+from benchmarks.bench_schedule import make_library, directory_order
+
+
+def read_all(fullnames, policy):
+    for fullname in fullnames:
+        with policy.open(fullname) as fp:
+            read_tags(fullname, fp, policy.header_reader)
+
+
+def run(top, repeat):
+    fullnames = directory_order(top)
+    print('{} files under {}'.format(len(fullnames), top))
+    print('{:10s} {:>12s} {:>16s}'.format(
+        'policy', 'us/file', 'peak bytes/file'))
+    for name in POLICIES:
+        policy = IOPolicy(name)
+        # Warm the page cache
+        read_all(fullnames, policy)
+
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            read_all(fullnames, policy)
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+
+        tracemalloc.start()
+        allocated = 0
+        for fullname in fullnames:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            with policy.open(fullname) as fp:
+                read_tags(fullname, fp, policy.header_reader)
+            allocated += tracemalloc.get_traced_memory()[1] - before
+        tracemalloc.stop()
+
+        print('{:10s} {:12.1f} {:16.0f}'.format(
+            name,
+            best * 1e6 / len(fullnames),
+            allocated / len(fullnames)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--path',
+        help='an existing tree to read, rather than a generated one')
+    parser.add_argument(
+        '--files', type=int, default=2000,
+        help='the number of files to generate (default %(default)s)')
+    parser.add_argument(
+        '--frames', type=int, default=20,
+        help='MPEG frames per generated file (default %(default)s)')
+    parser.add_argument(
+        '--repeat', type=int, default=3,
+        help='number of runs; the best is reported (default %(default)s)')
+    args = parser.parse_args(argv)
+
+    if args.path:
+        run(args.path, args.repeat)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            make_library(directory, args.files, args.frames)
+            run(directory, args.repeat)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
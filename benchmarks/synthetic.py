@@ -0,0 +1,62 @@
+'''
+Synthetic media libraries and databases for the benchmarks.
+
+The library is deterministic for a given size: titles are spread over
+performers, albums (ten tracks each) and genres so that every index and
+sub-index table has realistic fan-out.
+
+The genre, performer and album indices hold the byte offset of their title
+lists in a short int, so the writer cannot produce databases of much more
+than 32000 titles; MAX_TITLES is the largest size used by the benchmarks.
+
+This module defines the following functions:
+    media_files
+    write_database
+'''
+
+import os
+
+from kmeldb.MediaFile import MediaFile
+from kmeldb.KenwoodDatabase import KenwoodDatabase
+
+TRACKS_PER_ALBUM = 10
+ALBUMS_PER_PERFORMER = 4
+NUMBER_OF_GENRES = 25
+MAX_TITLES = 32000
+
+
+def media_files(number_of_titles):
+    '''Return a list of number_of_titles MediaFile objects.'''
+    files = []
+    for index in range(number_of_titles):
+        album = index // TRACKS_PER_ALBUM
+        performer = album // ALBUMS_PER_PERFORMER
+        genre = (album * 7) % NUMBER_OF_GENRES
+        longdir = '/Performer {:05d}/Album {:05d}'.format(performer, album)
+        longfile = '{:02d} Track {:06d}.mp3'.format(
+            index % TRACKS_PER_ALBUM + 1, index)
+        files.append(MediaFile(
+            index=index,
+            fullname=os.path.join(longdir, longfile),
+            shortdir='/PERFOR~{}/ALBUM~{}'.format(performer % 10, album % 10),
+            shortfile='{:08d}.MP3'.format(index),
+            longdir=longdir,
+            longfile=longfile,
+            title='Track {:06d} of album {:05d}'.format(index, album),
+            performer='Performer {:05d}'.format(performer),
+            album='Album {:05d}'.format(album),
+            genre='Genre {:02d}'.format(genre),
+            tracknumber=index % TRACKS_PER_ALBUM + 1,
+            discnumber=1))
+    return files
+
+
+def write_database(directory, number_of_titles):
+    '''
+    Write a synthetic database of number_of_titles titles into directory
+    and return the path of the kenwood.dap file.
+    '''
+    db = KenwoodDatabase(directory)
+    db.write_db(media_files(number_of_titles), [])
+    db.finalise()
+    return os.path.join(directory, 'kenwood.dap')
@@ -1,6 +1,31 @@
 '''Defines a subclass of BaseIndexEntry to handle Albums.'''
+import logging
 from .BaseIndexEntry import BaseIndexEntry
 
+log = logging.getLogger(__name__)
+
+
+def _first_free(taken, discnumber):
+    '''
+    Return the first disc at or after discnumber that is not in taken, and
+    take it.
+
+    Args:
+        taken (dict): Maps each disc taken to a disc at or after it that
+            may be free, and is updated.
+        discnumber (int): The disc to start from.
+    '''
+    free = discnumber
+    while free in taken:
+        free = taken[free]
+    # Point the discs passed over straight at the free disc
+    while discnumber != free:
+        next_disc = taken[discnumber]
+        taken[discnumber] = free
+        discnumber = next_disc
+    taken[free] = free + 1
+    return free
+
 
 class AlbumIndexEntry(BaseIndexEntry):
     '''A class to hold album information.
@@ -11,32 +36,34 @@ class AlbumIndexEntry(BaseIndexEntry):
 
         self._discs_and_tracks = {}
 
+        # For each track number, the discs it is taken on, each mapped to a
+        # later disc to try next: a union-find whose roots are the free
+        # discs. A title goes on the first disc at or after its own on
+        # which its track number is free.
+        taken = {}
+        modified = 0
+
         for title in self._titles:
             # Set the album number on each of the titles
             title.album_number = self._number
 
             # Store titles according to disc and track number
-            discnumber = title.discnumber
-            modified = False
-            new_location = False
-            while not new_location:
-                if discnumber not in self._discs_and_tracks:
-                    self._discs_and_tracks[discnumber] = {}
-                    new_location = True
-                    break
-                if title.tracknumber in self._discs_and_tracks[discnumber]:
-                    discnumber += 1
-                    modified = True
-                else:
-                    new_location = True
-
-            if modified:
-                print("Modified disc number for track {} '{}' to {}".format(
-                    title.tracknumber,
-                    title.title,
-                    discnumber))
-
-            self._discs_and_tracks[discnumber][title.tracknumber] = title
+            discnumber = _first_free(
+                taken.setdefault(title.tracknumber, {}), title.discnumber)
+            if discnumber != title.discnumber:
+                modified += 1
+                log.debug(
+                    "Modified disc number for track {} '{}' to {}".format(
+                        title.tracknumber,
+                        title.title,
+                        discnumber))
+
+            self._discs_and_tracks.setdefault(
+                discnumber, {})[title.tracknumber] = title
+
+        if modified:
+            log.info("Modified the disc numbers of {} of {} titles of "
+                     "album '{}'".format(modified, len(self._titles), name))
 
         self._freeze()
 
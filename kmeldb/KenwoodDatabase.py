@@ -1,4 +1,3 @@
-import re
 import os
 import logging
 import struct
@@ -9,6 +8,7 @@ from .PerformerIndexEntry import PerformerIndexEntry
 from .playlist import PlaylistIndexEntry
 from .AlbumIndexEntry import AlbumIndexEntry
 from .SubIndexEntry import SubIndexEntry
+from .collation import Collator
 
 log = logging.getLogger(__name__)
 
@@ -18,17 +18,32 @@ class KenwoodDatabase(object):
     The class responsible for writing the Kendwood database file.
     """
 
-    def __init__(self, path):
+    def __init__(
+            self, path, stats=None, db_file=None, collation=None,
+            split_albums=False):
         """
         Stores the path to the database and opens the file for writing.
+
+        If stats (a kmeldb.stats.DatabaseStats) is given, the time taken,
+        bytes written and entries written for each table are recorded in it.
+        If db_file (a binary file object) is given, the database is written
+        to it instead, and it is left open by finalise. collation (one of
+        kmeldb.collation.COLLATIONS) sets the alphabetical order of the
+        indices [default: legacy]. If split_albums is set, albums of the
+        same name in different directories are kept apart.
         """
 
         log.info("KenwoodDatabase created at: {}".format(path))
 
         self.db_path = path
-        # Open a file for writing
-        self.db_file = open(
-            os.path.join(self.db_path, "kenwood.dap"), mode='wb')
+        self._owns_file = db_file is None
+        if db_file is None:
+            # Open a file for writing
+            db_file = open(
+                os.path.join(self.db_path, "kenwood.dap"), mode='wb')
+        self.db_file = db_file
+        self.collator = Collator(collation or 'legacy')
+        self.split_albums = split_albums
 
         # Create the empty list of offsets
         self.offsets = []
@@ -39,6 +54,17 @@ class KenwoodDatabase(object):
         for sub in range(constants.end_subindex_offsets):
             self.subIndex.append(SubIndexEntry())
 
+        self.stats = stats
+
+    def _write_table(self, name, group, write, entries=0):
+        """
+        Call write, recording its cost if statistics are being collected.
+        """
+        if self.stats is None:
+            write()
+        else:
+            self.stats.record(name, group, self.db_file, write, entries)
+
     def write_signature(self):
         """
         Writes the first eight bytes of the database file (signature block).
@@ -178,7 +204,7 @@ class KenwoodDatabase(object):
 
         start_of_shortfiles = self.db_file.tell()
 
-        shortfiles = {}
+        shortfiles = self.shortfiles = {}
         for miEntry in self.mainIndex:
             short_filename = miEntry.encodedShortfile
             if short_filename in shortfiles:
@@ -220,7 +246,7 @@ class KenwoodDatabase(object):
 
         start_of_longfiles = self.db_file.tell()
 
-        longfiles = {}
+        longfiles = self.longfiles = {}
         for miEntry in self.mainIndex:
 
             long_filename = miEntry.encodedLongfile
@@ -254,17 +280,26 @@ class KenwoodDatabase(object):
         """
         """
 
+        number_of_genres = len(self.genreIndex)
+
         self.offsets[constants.genre_index_offset] = self.db_file.tell()
-        self.write_genre_index()
+        self._write_table(
+            'genre_index', 'genre', self.write_genre_index, number_of_genres)
 
         self.offsets[constants.genre_name_offset] = self.db_file.tell()
-        self.write_genre_name_table()
+        self._write_table(
+            'genre_names', 'genre', self.write_genre_name_table,
+            number_of_genres)
 
         self.offsets[constants.genre_title_offset] = self.db_file.tell()
-        self.write_genre_title_table()
+        self._write_table(
+            'genre_titles', 'genre', self.write_genre_title_table,
+            lambda: self.genre_title_table_length)
 
         self.offsets[constants.genre_title_order_offset] = self.db_file.tell()
-        self.write_genre_title_order_table()
+        self._write_table(
+            'genre_title_order', 'genre', self.write_genre_title_order_table,
+            lambda: self.genre_title_order_table_length)
 
     def write_genre_index(self):
         """
@@ -340,18 +375,28 @@ class KenwoodDatabase(object):
     # PERFORMER
 
     def write_all_performer_tables(self):
+        number_of_performers = len(self.performerIndex)
+
         self.offsets[constants.performer_index_offset] = self.db_file.tell()
-        self.write_performer_index()
+        self._write_table(
+            'performer_index', 'performer', self.write_performer_index,
+            number_of_performers)
 
         self.offsets[constants.performer_name_offset] = self.db_file.tell()
-        self.write_performer_name_table()
+        self._write_table(
+            'performer_names', 'performer', self.write_performer_name_table,
+            number_of_performers)
 
         self.offsets[constants.performer_title_offset] = self.db_file.tell()
-        self.write_performer_title_table()
+        self._write_table(
+            'performer_titles', 'performer', self.write_performer_title_table,
+            lambda: self.performer_title_table_length)
 
         self.offsets[constants.performer_title_order_offset] = \
             self.db_file.tell()
-        self.write_performer_title_order_table()
+        self._write_table(
+            'performer_title_order', 'performer',
+            self.write_performer_title_order_table, len(self.mainIndex))
 
     def write_performer_index(self):
         ''''''
@@ -410,17 +455,27 @@ class KenwoodDatabase(object):
     # ALBUM
 
     def write_all_album_tables(self):
+        number_of_albums = len(self.albumIndex)
+
         self.offsets[constants.album_index_offset] = self.db_file.tell()
-        self.write_album_index()
+        self._write_table(
+            'album_index', 'album', self.write_album_index, number_of_albums)
 
         self.offsets[constants.album_name_offset] = self.db_file.tell()
-        self.write_album_name_table()
+        self._write_table(
+            'album_names', 'album', self.write_album_name_table,
+            number_of_albums)
 
+        # The album title table is written twice (see below)
         self.offsets[constants.album_title_offset] = self.db_file.tell()
-        self.write_album_title_table()
+        self._write_table(
+            'album_titles', 'album', self.write_album_title_table,
+            2 * len(self.mainIndex))
 
         self.offsets[constants.album_title_order_offset] = self.db_file.tell()
-        self.write_album_title_order_table()
+        self._write_table(
+            'album_title_order', 'album', self.write_album_title_order_table,
+            len(self.mainIndex))
 
     def write_album_index(self):
         for aiEntry in self.albumIndex:
@@ -470,14 +525,22 @@ class KenwoodDatabase(object):
         """
         Write all playlist tables to file.
         """
+        number_of_playlists = len(self.playlistIndex)
+
         self.offsets[constants.playlist_index_offset] = self.db_file.tell()
-        self.write_playlist_index()
+        self._write_table(
+            'playlist_index', 'playlist', self.write_playlist_index,
+            number_of_playlists)
 
         self.offsets[constants.playlist_name_offset] = self.db_file.tell()
-        self.write_playlist_name_table()
+        self._write_table(
+            'playlist_names', 'playlist', self.write_playlist_name_table,
+            number_of_playlists)
 
         self.offsets[constants.playlist_title_offset] = self.db_file.tell()
-        self.write_playlist_title_table()
+        self._write_table(
+            'playlist_titles', 'playlist', self.write_playlist_title_table,
+            sum(p.number_of_titles for p in self.playlistIndex))
 
     def write_playlist_index(self):
         ''''''
@@ -530,62 +593,92 @@ class KenwoodDatabase(object):
         temp_offset_1 = self.db_file.tell()
 
         # Write a filler for the relative offset to the first table
-        self.db_file.write(struct.pack("<I", 0x00000000))
+        self._write_table(
+            'sub_index_start', 'sub_index',
+            lambda: self.db_file.write(struct.pack("<I", 0x00000000)), 1)
 
         # Write the sub index entries (blank at this stage)
-        self.write_sub_index()
+        self._write_table(
+            'sub_index', 'sub_index', self.write_sub_index,
+            len(self.subIndex))
 
         # self.subIndex[constants.sub_0_genre_performers].offset = \
         #     self.db_file.tell()
-        self.write_sub_0()
+        self._write_table(
+            'sub_0', 'sub_index', self.write_sub_0,
+            lambda: self.subIndex[0].count)
 
         # self.subIndex[constants.sub_1_genre_performer_albums].offset = \
         #     self.db_file.tell()
-        self.write_sub_1()
+        self._write_table(
+            'sub_1', 'sub_index', self.write_sub_1,
+            lambda: self.subIndex[1].count)
 
         # self.subIndex[constants.sub_2_genre_performer_album_titles].offset = \
         #     self.db_file.tell()
-        self.write_sub_2()
+        self._write_table(
+            'sub_2', 'sub_index', self.write_sub_2,
+            lambda: self.subIndex[2].count)
 
         # self.subIndex[constants.sub_3_genre_ordered_titles].offset = \
         #     self.db_file.tell()
-        self.write_sub_3()
+        self._write_table(
+            'sub_3', 'sub_index', self.write_sub_3,
+            lambda: self.subIndex[3].count)
 
         # self.subIndex[constants.sub_4_genre_albums].offset = \
         #     self.db_file.tell()
-        self.write_sub_4()
+        self._write_table(
+            'sub_4', 'sub_index', self.write_sub_4,
+            lambda: self.subIndex[4].count)
 
         # self.subIndex[constants.sub_5_genre_album_titles].offset = \
         #     self.db_file.tell()
-        self.write_sub_5()
+        self._write_table(
+            'sub_5', 'sub_index', self.write_sub_5,
+            lambda: self.subIndex[5].count)
 
         # self.subIndex[constants.sub_6_genre_titles].offset = \
         #     self.db_file.tell()
-        self.write_sub_6()
+        self._write_table(
+            'sub_6', 'sub_index', self.write_sub_6,
+            lambda: self.subIndex[6].count)
 
         # self.subIndex[constants.sub_7_performer_albums].offset = \
         #     self.db_file.tell()
-        self.write_sub_7()
+        self._write_table(
+            'sub_7', 'sub_index', self.write_sub_7,
+            lambda: self.subIndex[7].count)
 
         # self.subIndex[constants.sub_8_performer_album_titles].offset = \
         #     self.db_file.tell()
-        self.write_sub_8()
+        self._write_table(
+            'sub_8', 'sub_index', self.write_sub_8,
+            lambda: self.subIndex[8].count)
 
         # self.subIndex[constants.sub_9_performer_titles].offset = \
         #     self.db_file.tell()
-        self.write_sub_9()
+        self._write_table(
+            'sub_9', 'sub_index', self.write_sub_9,
+            lambda: self.subIndex[9].count)
 
         # self.subIndex[constants.sub_10_genre_performers].offset = \
         #     self.db_file.tell()
-        self.write_sub_10()
+        self._write_table(
+            'sub_10', 'sub_index', self.write_sub_10,
+            lambda: self.subIndex[10].count)
 
         # self.subIndex[constants.sub_11_genre_performer_titles].offset = \
         #     self.db_file.tell()
-        self.write_sub_11()
+        self._write_table(
+            'sub_11', 'sub_index', self.write_sub_11,
+            lambda: self.subIndex[11].count)
 
         # self.subIndex[constants.sub_12_genre_ordered_titles].offset = \
         #     self.db_file.tell()
-        self.write_sub_12()
+        self._write_table(
+            'sub_12', 'sub_index', self.write_sub_12,
+            lambda: self.subIndex[12].count)
 
         # Remeber where we are
         temp_offset_2 = self.db_file.tell()
@@ -601,7 +694,8 @@ class KenwoodDatabase(object):
                 temp_offset_1))
 
         # Write the real data now
-        self.write_sub_index()
+        self._write_table(
+            'sub_index', 'fixup', self.write_sub_index, len(self.subIndex))
 
         # Go to the end
         self.db_file.seek(temp_offset_2)
@@ -1015,10 +1109,12 @@ class KenwoodDatabase(object):
         """
         pass
 
-    def write_db(self, media_files, playlist_files):
-        '''Constructs database from given media file list.'''
-
-        self.write_signature()
+    def create_indices(self, media_files, playlist_files):
+        '''
+        Builds the main, genre, performer, album and playlist indices from
+        the given media files and playlists, re-numbering the media files
+        in album order.
+        '''
 
         self.number_of_entries = len(media_files)
 
@@ -1027,7 +1123,8 @@ class KenwoodDatabase(object):
         # titles = []
         genres = {"": []}
         performers = {"": []}
-        albums = {"": []}
+        # Albums are keyed by name and, if they are split, directory
+        albums = {("", ""): []}
 
         # Collect all titles, genres, performers and albums
         self.mainIndex = []
@@ -1046,10 +1143,13 @@ class KenwoodDatabase(object):
             else:
                 performers[mf.performer] = [mf]
 
-            if mf.album in albums:
-                albums[mf.album].append(mf)
+            album = (mf.album, "")
+            if self.split_albums and mf.album:
+                album = (mf.album, mf.longdir)
+            if album in albums:
+                albums[album].append(mf)
             else:
-                albums[mf.album] = [mf]
+                albums[album] = [mf]
 
             miEntry = MainIndexEntry()
             miEntry.set_media_file(mf)
@@ -1059,7 +1159,7 @@ class KenwoodDatabase(object):
         self.genreIndex = []
         self.number_of_genres = len(genres)
         genre_number = 0
-        for key in sorted(genres, key=str.lower):
+        for key in sorted(genres, key=self.collator.key):
             # print ("Genre[{}] = {}".format(key, genres[key]))
             giEntry = GenreIndexEntry(
                 name=key,
@@ -1072,7 +1172,7 @@ class KenwoodDatabase(object):
         self.performerIndex = []
         self.number_of_performers = len(performers)
         performer_number = 0
-        for key in sorted(performers, key=str.lower):
+        for key in sorted(performers, key=self.collator.key):
             # print ("Performer[{}] = {}".format(key, performers[key]))
             piEntry = PerformerIndexEntry(
                 name=key,
@@ -1086,10 +1186,11 @@ class KenwoodDatabase(object):
         self.albumIndex = []
         self.number_of_albums = len(albums)
         album_number = 0
-        for key in sorted(albums, key=str.lower):
+        for key in sorted(
+                albums, key=lambda k: (self.collator.key(k[0]), k[1])):
             # print ("Album[{}] = {}".format(key, albums[key]))
             aiEntry = AlbumIndexEntry(
-                name=key,
+                name=key[0],
                 titles=albums[key],
                 number=album_number)
             self.albumIndex.append(aiEntry)
@@ -1132,43 +1233,80 @@ class KenwoodDatabase(object):
             print('\tNumber re-ordered', new_index)
         self.mainIndex.sort(key=lambda m: m.index)
 
-        # TODO: International characters not sorted properly.
-        # self.alpha_ordered_titles = [x[1] for x in sorted(
-        #     titles, key=lambda e: e[0])]
+        # International characters are sorted properly by the fold and
+        # locale collations
+        title_key = self.collator.title_key
         self.alpha_ordered_titles = [x.index for x in sorted(
-            self.mainIndex, key=lambda e: re.sub("'", "", e.title.lower()))]
+            self.mainIndex, key=lambda e: title_key(e.title))]
+
+    def write_db(self, media_files, playlist_files):
+        '''Constructs database from given media file list.'''
+
+        if self.stats is None:
+            self.create_indices(media_files, playlist_files)
+        else:
+            self.stats.record_elapsed(
+                'indices', 'prepare',
+                lambda: self.create_indices(media_files, playlist_files),
+                len(media_files))
+        self.write_tables()
+
+    def write_tables(self):
+        '''
+        Writes the database from the indices built by create_indices.
+
+        Counts, title numbers and most offsets are stored as unsigned 16 bit
+        values, so struct.error is raised if the indices are too large.
+        '''
+
+        number_of_titles = len(self.mainIndex)
+
+        self._write_table('signature', 'header', self.write_signature)
 
         # Write the counts
-        self.write_counts()
+        self._write_table('counts', 'header', self.write_counts)
 
         if self.db_file.tell() != constants.OFFSETS_OFFSET:
             log.warning("Not at correct offset for offsets table")
             self.db_file.seek(constants.OFFSETS_OFFSET)
 
         # These will be empty at the moment
-        self.write_offsets()
+        self._write_table(
+            'offsets', 'header', self.write_offsets, len(self.offsets))
 
         # Get the file offset, and store it as the main index offset
         self.offsets[constants.main_index_offset] = self.db_file.tell()
-        self.write_main_index()
+        self._write_table(
+            'main_index', 'main', self.write_main_index, number_of_titles)
 
         self.offsets[constants.title_offset] = self.db_file.tell()
-        self.write_title_table()
+        self._write_table(
+            'titles', 'main', self.write_title_table, number_of_titles)
 
         self.offsets[constants.shortdir_offset] = self.db_file.tell()
-        self.write_shortdir_table()
+        self._write_table(
+            'shortdirs', 'main', self.write_shortdir_table,
+            lambda: len(self.shortdirs))
 
         self.offsets[constants.shortfile_offset] = self.db_file.tell()
-        self.write_shortfile_table()
+        self._write_table(
+            'shortfiles', 'main', self.write_shortfile_table,
+            lambda: len(self.shortfiles))
 
         self.offsets[constants.longdir_offset] = self.db_file.tell()
-        self.write_longdir_table()
+        self._write_table(
+            'longdirs', 'main', self.write_longdir_table,
+            lambda: len(self.longdirs))
 
         self.offsets[constants.longfile_offset] = self.db_file.tell()
-        self.write_longfile_table()
+        self._write_table(
+            'longfiles', 'main', self.write_longfile_table,
+            lambda: len(self.longfiles))
 
         self.offsets[constants.alpha_title_order_offset] = self.db_file.tell()
-        self.write_alpha_ordered_title_table()
+        self._write_table(
+            'alpha_title_order', 'main', self.write_alpha_ordered_title_table,
+            number_of_titles)
 
         # GENRE TABLES
         self.write_all_genre_tables()
@@ -1188,19 +1326,20 @@ class KenwoodDatabase(object):
 
         # Was table 9
         self.offsets[constants.u24_offset] = self.db_file.tell()
-        self.write_u24()
+        self._write_table('u24', 'unknown', self.write_u24, 1)
 
         # Was table 10
         self.offsets[constants.u25_offset] = self.db_file.tell()
-        self.write_u25()
+        self._write_table('u25', 'unknown', self.write_u25, 1)
 
         # Was table 11
         self.offsets[constants.u26_offset] = self.db_file.tell()
-        self.write_u26()
+        self._write_table(
+            'u26', 'unknown', self.write_u26, len(self.albumIndex))
 
         # Was table 12
         self.offsets[constants.u27_offset] = self.db_file.tell()
-        self.write_u27()
+        self._write_table('u27', 'unknown', self.write_u27, number_of_titles)
 
         # UP TO HERE
 
@@ -1222,31 +1361,42 @@ class KenwoodDatabase(object):
 
         # Go back and write the offsets (now complete)
         self.db_file.seek(constants.OFFSETS_OFFSET)
-        self.write_offsets()
+        self._write_table(
+            'offsets', 'fixup', self.write_offsets, len(self.offsets))
 
         # Go back and write the main index (now complete)
         self.db_file.seek(self.offsets[constants.main_index_offset])
-        self.write_main_index()
+        self._write_table(
+            'main_index', 'fixup', self.write_main_index, number_of_titles)
 
         # Go back and write the genre index (now complete)
         self.db_file.seek(self.offsets[constants.genre_index_offset])
-        self.write_genre_index()
+        self._write_table(
+            'genre_index', 'fixup', self.write_genre_index,
+            len(self.genreIndex))
 
         # Go back and write the performer index (now complete)
         self.db_file.seek(self.offsets[constants.performer_index_offset])
-        self.write_performer_index()
+        self._write_table(
+            'performer_index', 'fixup', self.write_performer_index,
+            len(self.performerIndex))
 
         # Go back and write the album index (now complete)
         self.db_file.seek(self.offsets[constants.album_index_offset])
-        self.write_album_index()
+        self._write_table(
+            'album_index', 'fixup', self.write_album_index,
+            len(self.albumIndex))
 
         # Go back and write the playlist index (now complete)
         self.db_file.seek(self.offsets[constants.playlist_index_offset])
-        self.write_playlist_index()
+        self._write_table(
+            'playlist_index', 'fixup', self.write_playlist_index,
+            len(self.playlistIndex))
 
     def finalise(self):
         """
         Close the database file.
         """
         log.info("KenwoodDatabase finalised.")
-        self.db_file.close()
+        if self._owns_file:
+            self.db_file.close()
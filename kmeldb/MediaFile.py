@@ -85,11 +85,19 @@ class MediaFile(object):
         '''
         return self._shortdir
 
+    @shortdir.setter
+    def shortdir(self, shortdir):
+        self._shortdir = shortdir + "\x00"
+
     @property
     def shortfile(self):
         '''A string representing the FAT 8.3 file name.'''
         return self._shortfile
 
+    @shortfile.setter
+    def shortfile(self, shortfile):
+        self._shortfile = shortfile + "\x00"
+
     @property
     def longdir(self):
         '''A string representing the directory path for this file.
@@ -151,11 +159,19 @@ class MediaFile(object):
         ''''''
         return self._tracknumber
 
+    @tracknumber.setter
+    def tracknumber(self, tracknumber):
+        self._tracknumber = tracknumber
+
     @property
     def discnumber(self):
         ''''''
         return self._discnumber
 
+    @discnumber.setter
+    def discnumber(self, discnumber):
+        self._discnumber = discnumber
+
     def __repr__(self):
         return "\nMediaFile({},\n\t{},\n\t{},\n\t{},\n\t{},\n\t{},\n\t{},\n\t{},\n\t{},\n\t{},\n\t{})\n".format(
             self._index,
@@ -0,0 +1,225 @@
+'''
+Building Kenwood databases in-process.
+
+Scanning and writing are separate steps. scan_location walks a directory
+tree and returns the media files and playlists found; write_database writes
+a database for any media files (and playlists) to a path or to a binary
+file object, e.g. an io.BytesIO; build_database does both:
+
+    result = build_database('/media/usb', io.BytesIO())
+    print(result.titles, result.bytes_written)
+
+Nothing here keeps state between calls. The media files handed to
+write_database are copied before the writer numbers them, so the same
+media files can be written any number of times, from several threads at
+once.
+
+This module defines the following classes:
+    ScanResult
+    BuildResult
+'''
+
+import os
+import sys
+import copy
+import time
+import logging
+from collections import namedtuple
+
+from .KenwoodDatabase import KenwoodDatabase
+
+log = logging.getLogger(__name__)
+
+ScanResult = namedtuple('ScanResult', [
+    'path', 'media_files', 'playlists', 'elapsed'])
+
+BuildResult = namedtuple('BuildResult', [
+    'titles', 'genres', 'performers', 'albums', 'playlists',
+    'bytes_written', 'scan_time', 'write_time'])
+
+# What the writer needs of a playlist
+_Playlist = namedtuple('_Playlist', ['title', 'media_files'])
+
+
+def dir_walker_class():
+    '''Return the DirWalker class for this platform.'''
+    if sys.platform.startswith('linux'):
+        from .linux_dir_parser import DirWalker
+    elif sys.platform == 'darwin':
+        from .mac_dir_parser import DirWalker
+    else:
+        raise OSError('Scanning is not supported on {}'.format(sys.platform))
+    return DirWalker
+
+
+def scan_location(
+        path, scan_stats=None, progress=None, seed=None, walker_class=None,
+        schedule=None, io_policy=None):
+    '''
+    Find the media files and playlists under path.
+
+    Args:
+        path (str): The top of the directory tree, e.g. a mount point.
+        scan_stats (ScanStats): If given, the I/O performed is recorded.
+        progress (ProgressReporter): If given, progress is reported.
+        seed (DatabaseSeed): If given, tags are reused from it.
+        walker_class (callable): Makes the DirWalker, by default the one for
+            this platform.
+        schedule (str): The order of tag reads, one of
+            kmeldb.schedule.SCHEDULES. By default, directory order.
+        io_policy (str): How media files are read, one of
+            kmeldb.iopolicy.POLICIES. By default, with buffered reads.
+
+    Returns:
+        A ScanResult.
+    '''
+    start = time.monotonic()
+    media_files = []
+    playlists = []
+    if walker_class is None:
+        walker_class = dir_walker_class()
+    kwargs = {}
+    if schedule is not None:
+        kwargs['schedule'] = schedule
+    if io_policy is not None:
+        kwargs['io_policy'] = io_policy
+    walker = walker_class(
+        path,
+        playlists,
+        media_files,
+        scan_stats=scan_stats,
+        progress=progress,
+        seed=seed,
+        **kwargs)
+    walker.walk()
+    if progress is not None:
+        progress.finish()
+
+    if seed is not None:
+        seed.reconcile(media_files, walker.read_tags)
+        log.info("Reused the tags of {} of {} media files".format(
+            len(seed.reused), len(media_files)))
+
+    log.info("Number of media files: {}".format(len(media_files)))
+    log.info("Number of playlists: {}".format(len(playlists)))
+
+    # Read the playlists found, and find their media files
+    for pl in playlists:
+        pl.read()
+    for mf in media_files:
+        for pl in playlists:
+            if mf.fullname in pl.media_filenames:
+                pl.add_media_file(mf)
+
+    return ScanResult(path, media_files, playlists, time.monotonic() - start)
+
+
+def _copy_for_writer(media_files, playlists):
+    '''
+    Return copies of the media files, and the playlists of the copies, for
+    a KenwoodDatabase to number.
+    '''
+    copies = {}
+    for mf in media_files:
+        copies[id(mf)] = copy.copy(mf)
+    lists = [
+        _Playlist(pl.title, [
+            copies[id(mf)] for mf in pl.media_files if id(mf) in copies])
+        for pl in playlists]
+    return list(copies.values()), lists
+
+
+def write_database(
+        media_files, output, playlists=(), stats=None, collation=None,
+        split_albums=False):
+    '''
+    Write a database for media files.
+
+    Args:
+        media_files (iterable of MediaFile): The media files, which are not
+            modified.
+        output (str or file): The file name to write to, or an empty binary
+            file object open for writing and seeking. The offsets in the
+            database are file positions, so it must be written from the
+            start of the file.
+        playlists (iterable): Objects with a title and the list of their
+            media_files.
+        stats (DatabaseStats): If given, the cost of each table is recorded.
+        collation (str): The alphabetical order of the indices, one of
+            kmeldb.collation.COLLATIONS [default: legacy].
+        split_albums (bool): If set, albums of the same name in different
+            directories are kept apart.
+
+    Returns:
+        A BuildResult, with no scan time.
+    '''
+    start = time.monotonic()
+    tracks, lists = _copy_for_writer(media_files, playlists)
+
+    if hasattr(output, 'write'):
+        db_file = output
+    else:
+        db_file = open(output, 'wb')
+    try:
+        database = KenwoodDatabase(
+            None, stats=stats, db_file=db_file, collation=collation,
+            split_albums=split_albums)
+        database.write_db(tracks, lists)
+        # The writer finishes with the index fix ups, not at the end
+        bytes_written = db_file.seek(0, os.SEEK_END)
+    finally:
+        if db_file is not output:
+            db_file.close()
+
+    return BuildResult(
+        titles=len(database.mainIndex),
+        genres=database.number_of_genres,
+        performers=database.number_of_performers,
+        albums=database.number_of_albums,
+        playlists=database.number_of_playlists,
+        bytes_written=bytes_written,
+        scan_time=0.0,
+        write_time=time.monotonic() - start)
+
+
+def build_database(
+        source,
+        output,
+        playlists=(),
+        stats=None,
+        scan_stats=None,
+        progress=None,
+        seed=None,
+        schedule=None,
+        io_policy=None,
+        collation=None,
+        split_albums=False):
+    '''
+    Build a database for a directory tree or a collection of media files.
+
+    Args:
+        source (str or iterable of MediaFile): A directory to scan, or the
+            media files to include.
+        output (str or file): The file name to write to, or a binary file
+            object open for writing.
+        playlists (iterable): The playlists, if source is media files.
+            Playlists found by a scan are always included.
+        stats, scan_stats, progress, seed, schedule, io_policy, collation,
+        split_albums: As for write_database and scan_location.
+
+    Returns:
+        A BuildResult.
+    '''
+    scan_time = 0.0
+    if isinstance(source, (str, bytes, os.PathLike)):
+        scanned = scan_location(
+            source, scan_stats=scan_stats, progress=progress, seed=seed,
+            schedule=schedule, io_policy=io_policy)
+        source = scanned.media_files
+        playlists = list(playlists) + scanned.playlists
+        scan_time = scanned.elapsed
+
+    result = write_database(
+        source, output, playlists, stats=stats, collation=collation,
+        split_albums=split_albums)
+    return result._replace(scan_time=scan_time)
@@ -0,0 +1,299 @@
+'''
+A structural diff of two Kenwood database files.
+
+Titles are aligned by their long directory and file name, so the diff
+reports the media files added, removed and retagged (a changed title,
+genre, performer or album), and the albums and playlists whose titles
+changed, rather than the bytes that differ. Albums and playlists of the
+same name are told apart by their titles.
+
+Both databases are read through memory-mapped DatabaseReaders. Only the
+raw path of each title is held in memory; the titles of each database are
+sorted by path and the two sorted lists are merged, so the diff takes
+O(n log n) time. Strings are decoded only for the titles and names being
+compared. Run as a script, it exits non-zero if the databases differ:
+
+    python3 -m kmeldb.diff old/kenwood.dap new/kenwood.dap
+
+This module defines the following classes:
+    DatabaseDiff
+'''
+
+import sys
+import json
+import struct
+import argparse
+
+from . import constants
+from .reader import DatabaseReader
+from .MainIndexEntry import MainIndexEntry
+
+# The fields of a title compared between databases
+TITLE_FIELDS = ('title', 'genre', 'performer', 'album')
+
+
+def _path_keys(reader):
+    '''
+    Return a list of the raw (undecoded) long directory and file name of
+    each title, in title number order.
+    '''
+    bfr = reader.buffer
+    longdirs = reader.offsets[constants.longdir_offset]
+    longfiles = reader.offsets[constants.longfile_offset]
+    start = reader.offsets[constants.main_index_offset]
+    end = start + reader.title_count * reader.title_entry_size
+    keys = []
+    for values in struct.iter_unpack(MainIndexEntry.FORMAT, bfr[start:end]):
+        # Lengths include the terminating null character
+        dir_start = longdirs + values[18]
+        file_start = longfiles + values[21]
+        keys.append((
+            bfr[dir_start:dir_start + values[16] - values[17]],
+            bfr[file_start:file_start + values[19] - values[20]]))
+    return keys
+
+
+def _decode_key(key):
+    longdir, longfile = key
+    return (
+        longdir.decode(constants.STRING_ENCODING) +
+        longfile.decode(constants.STRING_ENCODING))
+
+
+def _names(entry, count):
+    return [entry(number).name for number in range(count)]
+
+
+class DatabaseDiff(object):
+    '''The differences between an old and a new database.'''
+
+    def __init__(self, old_filename, new_filename):
+        self.old_filename = old_filename
+        self.new_filename = new_filename
+
+        # Paths (long directory and file name) of media files
+        self.added = []
+        self.removed = []
+
+        # (path, {field: (old, new)}) for media files whose tags changed
+        self.retagged = []
+
+        # Names of albums and playlists
+        self.albums = {
+            'added': [], 'removed': [], 'changed': [], 'reordered': []}
+        self.playlists = {
+            'added': [], 'removed': [], 'changed': [], 'reordered': []}
+
+        # Names of genres and performers
+        self.genres = {'added': [], 'removed': []}
+        self.performers = {'added': [], 'removed': []}
+
+    @property
+    def identical(self):
+        '''bool: whether no differences were found.'''
+        return not (
+            self.added or self.removed or self.retagged or
+            any(self.albums.values()) or any(self.playlists.values()) or
+            any(self.genres.values()) or any(self.performers.values()))
+
+    def as_dict(self):
+        '''Return the diff as a dictionary suitable for JSON.'''
+        return {
+            'old': self.old_filename,
+            'new': self.new_filename,
+            'identical': self.identical,
+            'added': self.added,
+            'removed': self.removed,
+            'retagged': [
+                {'path': path, 'changes': {
+                    field: {'old': old, 'new': new}
+                    for field, (old, new) in changes.items()}}
+                for path, changes in self.retagged],
+            'albums': self.albums,
+            'playlists': self.playlists,
+            'genres': self.genres,
+            'performers': self.performers}
+
+    def to_json(self, **kwargs):
+        '''Return the diff as a JSON string.'''
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def __str__(self):
+        lines = []
+        for path in self.added:
+            lines.append('+ {}'.format(path))
+        for path in self.removed:
+            lines.append('- {}'.format(path))
+        for path, changes in self.retagged:
+            lines.append('~ {}'.format(path))
+            for field in TITLE_FIELDS:
+                if field in changes:
+                    lines.append("    {}: '{}' -> '{}'".format(
+                        field, *changes[field]))
+        for kind, groups in (
+                ('Genre', self.genres),
+                ('Performer', self.performers),
+                ('Album', self.albums),
+                ('Playlist', self.playlists)):
+            for change in ('added', 'removed', 'changed', 'reordered'):
+                for name in groups.get(change, ()):
+                    lines.append("{} {}: '{}'".format(kind, change, name))
+        if not lines:
+            lines.append('Databases are identical')
+        return '\n'.join(lines)
+
+
+def _diff_titles(result, old, new, old_keys, new_keys):
+    '''Merge the titles of both databases in path order.'''
+    old_order = sorted(range(len(old_keys)), key=old_keys.__getitem__)
+    new_order = sorted(range(len(new_keys)), key=new_keys.__getitem__)
+
+    old_genres = _names(old.genre, old.genre_count)
+    new_genres = _names(new.genre, new.genre_count)
+    old_performers = _names(old.performer, old.performer_count)
+    new_performers = _names(new.performer, new.performer_count)
+    old_albums = _names(old.album, old.album_count)
+    new_albums = _names(new.album, new.album_count)
+
+    i = j = 0
+    while i < len(old_order) or j < len(new_order):
+        old_key = old_keys[old_order[i]] if i < len(old_order) else None
+        new_key = new_keys[new_order[j]] if j < len(new_order) else None
+        if new_key is None or (old_key is not None and old_key < new_key):
+            result.removed.append(_decode_key(old_key))
+            i += 1
+        elif old_key is None or new_key < old_key:
+            result.added.append(_decode_key(new_key))
+            j += 1
+        else:
+            old_title = old.title(old_order[i])
+            new_title = new.title(new_order[j])
+            changes = {}
+            for field, old_value, new_value in (
+                    ('title', old_title.title, new_title.title),
+                    ('genre',
+                        old_genres[old_title.genre],
+                        new_genres[new_title.genre]),
+                    ('performer',
+                        old_performers[old_title.performer],
+                        new_performers[new_title.performer]),
+                    ('album',
+                        old_albums[old_title.album],
+                        new_albums[new_title.album])):
+                if old_value != new_value:
+                    changes[field] = (old_value, new_value)
+            if changes:
+                result.retagged.append((_decode_key(old_key), changes))
+            i += 1
+            j += 1
+
+    for groups, old_names, new_names in (
+            (result.genres, old_genres, new_genres),
+            (result.performers, old_performers, new_performers)):
+        old_set = set(old_names)
+        new_set = set(new_names)
+        groups['added'] = sorted(new_set - old_set)
+        groups['removed'] = sorted(old_set - new_set)
+
+
+def _groups_by_name(entry, count, keys):
+    '''
+    Return the titles of each album or playlist, as lists of paths, in
+    lists keyed by name.
+    '''
+    groups = {}
+    for number in range(count):
+        group = entry(number)
+        groups.setdefault(group.name, []).append(
+            [keys[t] for t in group.titles])
+    return groups
+
+
+def _diff_groups(groups, old_entry, old_count, new_entry, new_count,
+                 old_keys, new_keys):
+    '''
+    Compare the albums or playlists of both databases by name, as lists of
+    paths.
+
+    Several may share a name (e.g. with split albums), so those of a name
+    are paired by their titles: first those with the same titles, then
+    each old one with the new one it has the most titles in common with.
+    Any left over were added or removed.
+    '''
+    old_groups = _groups_by_name(old_entry, old_count, old_keys)
+    new_groups = _groups_by_name(new_entry, new_count, new_keys)
+
+    for name in sorted(set(old_groups) | set(new_groups)):
+        unmatched = new_groups.get(name, [])
+        changed = []
+        for old_paths in old_groups.get(name, ()):
+            members = frozenset(old_paths)
+            for index, new_paths in enumerate(unmatched):
+                if frozenset(new_paths) == members:
+                    del unmatched[index]
+                    if old_paths != new_paths:
+                        groups['reordered'].append(name)
+                    break
+            else:
+                changed.append(members)
+        for members in changed:
+            if not unmatched:
+                groups['removed'].append(name)
+                continue
+            best = max(
+                range(len(unmatched)),
+                key=lambda index: len(members.intersection(unmatched[index])))
+            del unmatched[best]
+            groups['changed'].append(name)
+        groups['added'].extend(name for _ in unmatched)
+
+
+def diff(old_filename, new_filename):
+    '''Return the DatabaseDiff between two database files.
+
+    Raises:
+        ValueError: if either file is not a Kenwood database.
+    '''
+    result = DatabaseDiff(old_filename, new_filename)
+    with DatabaseReader(old_filename) as old, \
+            DatabaseReader(new_filename) as new:
+        old_keys = _path_keys(old)
+        new_keys = _path_keys(new)
+        _diff_titles(result, old, new, old_keys, new_keys)
+        _diff_groups(
+            result.albums,
+            old.album, old.album_count, new.album, new.album_count,
+            old_keys, new_keys)
+        _diff_groups(
+            result.playlists,
+            old.playlist, old.playlist_count,
+            new.playlist, new.playlist_count,
+            old_keys, new_keys)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compare the contents of two Kenwood databases.')
+    parser.add_argument(
+        '--json',
+        action='store_true',
+        help='write the differences as JSON')
+    parser.add_argument('old', metavar='OLD', help='the old kenwood.dap')
+    parser.add_argument('new', metavar='NEW', help='the new kenwood.dap')
+    args = parser.parse_args(argv)
+
+    try:
+        result = diff(args.old, args.new)
+    except (IOError, OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 2
+    if args.json:
+        print(result.to_json())
+    else:
+        print(result)
+    return 0 if result.identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+'''
+Streaming export of a Kenwood database as JSON lines or CSV.
+
+Records are generated one at a time from a memory-mapped DatabaseReader and
+written as they are produced, so the memory used does not grow with the
+number of titles. Each title gives one record holding its names and paths,
+with the genre, performer and album numbers resolved to names. Optionally,
+each entry of each playlist gives one record too.
+
+    python3 -m kmeldb.export /media/usb/kenwood.dap/kenwood.dap --csv
+
+This module defines no classes.
+'''
+
+import sys
+import csv
+import json
+import argparse
+
+from .reader import DatabaseReader
+
+TITLE_FIELDS = (
+    'record', 'number', 'title', 'genre', 'performer', 'album',
+    'path', 'longdir', 'longfile', 'shortdir', 'shortfile')
+
+PLAYLIST_FIELDS = ('record', 'playlist', 'position', 'number', 'path')
+
+# The CSV columns, shared by title and playlist records
+CSV_FIELDS = TITLE_FIELDS + ('playlist', 'position')
+
+
+def title_records(reader):
+    '''Generate a dictionary for each title, in title number order.'''
+    # The names are few compared with the titles, so are looked up once
+    genres = [reader.genre(n).name for n in range(reader.genre_count)]
+    performers = [
+        reader.performer(n).name for n in range(reader.performer_count)]
+    albums = [reader.album(n).name for n in range(reader.album_count)]
+
+    for entry in reader.titles():
+        longdir = entry.longdir
+        longfile = entry.longfile
+        yield {
+            'record': 'title',
+            'number': entry.number,
+            'title': entry.title,
+            'genre': genres[entry.genre],
+            'performer': performers[entry.performer],
+            'album': albums[entry.album],
+            'path': longdir + longfile,
+            'longdir': longdir,
+            'longfile': longfile,
+            'shortdir': entry.shortdir,
+            'shortfile': entry.shortfile}
+
+
+def playlist_records(reader):
+    '''Generate a dictionary for each entry of each playlist.'''
+    for number in range(reader.playlist_count):
+        playlist = reader.playlist(number)
+        name = playlist.name
+        for position, title in enumerate(playlist.titles):
+            entry = reader.title(title)
+            yield {
+                'record': 'playlist',
+                'playlist': name,
+                'position': position,
+                'number': title,
+                'path': entry.longdir + entry.longfile}
+
+
+def records(reader, playlists=False):
+    '''Generate the title records and, optionally, the playlist records.'''
+    yield from title_records(reader)
+    if playlists:
+        yield from playlist_records(reader)
+
+
+def write_jsonl(records, out):
+    '''Write records to out as JSON lines. Returns the number written.'''
+    count = 0
+    for record in records:
+        out.write(json.dumps(record, ensure_ascii=False))
+        out.write('\n')
+        count += 1
+    return count
+
+
+def write_csv(records, out):
+    '''Write records to out as CSV. Returns the number written.'''
+    writer = csv.DictWriter(out, CSV_FIELDS, restval='')
+    writer.writeheader()
+    count = 0
+    for record in records:
+        writer.writerow(record)
+        count += 1
+    return count
+
+
+def export(filename, out, csv_format=False, playlists=False):
+    '''Export the database in filename to out.
+
+    Returns the number of records written.
+    '''
+    with DatabaseReader(filename) as reader:
+        if csv_format:
+            return write_csv(records(reader, playlists), out)
+        return write_jsonl(records(reader, playlists), out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Export the contents of a Kenwood database.')
+    parser.add_argument(
+        '--csv',
+        action='store_true',
+        help='write CSV rather than JSON lines')
+    parser.add_argument(
+        '-p', '--playlists',
+        action='store_true',
+        help='also write a record for each playlist entry')
+    parser.add_argument(
+        '-o', '--output',
+        metavar='FILE',
+        help='write to FILE rather than standard output')
+    parser.add_argument('file', metavar='FILE', help='the kenwood.dap file')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8', newline='') as out:
+                export(args.file, out, args.csv, args.playlists)
+        else:
+            export(args.file, sys.stdout, args.csv, args.playlists)
+    except (IOError, OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,646 @@
+'''
+A structural validator for generated Kenwood databases.
+
+fsck() makes a single pass over a memory-mapped kenwood.dap and checks:
+
+    - the signature, entry sizes and counts in the header
+    - that the table offsets are in order and within the file
+    - that every table fits before the next one
+    - the lengths, bounds and terminators of every string
+    - that genre, performer, album and title numbers are in range
+    - that the title lists of each index hold the titles they should
+    - that the ordered title lists hold every title once, in order
+    - the offsets, counts and contents of the sub-index tables
+
+Problems are collected in an FsckResult rather than logged. Run as a
+script, it checks the given files and exits non-zero if any has problems:
+
+    python3 -m kmeldb.fsck /media/usb/kenwood.dap/kenwood.dap
+
+This module defines the following classes:
+    Problem
+    FsckResult
+'''
+
+import sys
+import json
+import time
+import struct
+import argparse
+from array import array
+
+from . import constants
+from .reader import DatabaseReader
+from .MainIndexEntry import MainIndexEntry
+from .BaseIndexEntry import BaseIndexEntry
+
+# Stop recording problems for a table after this many
+MAX_PROBLEMS_PER_TABLE = 100
+
+# The values of the fixed fields of the header
+ENTRY_SIZES = (0x40, 0x10, 0x10, 0x10, 0x10)
+HEADER_UNKNOWN = (0x0001, 0x0014)
+
+# Offsets that are always zero
+ZERO_OFFSETS = (
+    constants.u20_offset,
+    constants.u29_offset,
+    constants.u30_offset,
+    constants.u31_offset,
+    constants.u32_offset)
+
+# The offsets of the tables present in the file, in file order
+TABLE_OFFSETS = tuple(
+    o for o in range(constants.end_offsets) if o not in ZERO_OFFSETS)
+
+OFFSET_NAMES = {
+    getattr(constants, name): name[:-len('_offset')]
+    for name in dir(constants)
+    if name.endswith('_offset') and name != 'OFFSETS_OFFSET'}
+
+# The expected size of each sub-index table entry
+SUB_INDEX_SIZES = (8, 8, 8, 2, 8, 8, 2, 8, 8, 2, 8, 8, 2)
+
+# The relative offset at the start of the sub-index to its first table
+SUB_INDEX_RELATIVE_OFFSET = 4 + constants.end_subindex_offsets * 8
+
+# The (length, character length, offset) positions of the strings of a
+# main index entry, their table, and their character length
+MAIN_INDEX_STRINGS = (
+    (7, constants.title_offset, 2),
+    (10, constants.shortdir_offset, 1),
+    (13, constants.shortfile_offset, 1),
+    (16, constants.longdir_offset, 2),
+    (19, constants.longfile_offset, 2))
+
+# The fixed fields of a main index entry
+MAIN_INDEX_FIXED = (
+    (3, 0x0000),
+    (4, 0xffffffff),
+    (5, 0x80000000),
+    (6, 0x80000000),
+    (22, 0x00000000))
+
+
+class Problem(object):
+    '''A problem found in one table of a database.'''
+
+    def __init__(self, table, message):
+        self.table = table
+        self.message = message
+
+    def as_dict(self):
+        return {'table': self.table, 'message': self.message}
+
+    def __str__(self):
+        return '{}: {}'.format(self.table, self.message)
+
+
+class FsckResult(object):
+    '''The problems found in a database.'''
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.problems = []
+        self.elapsed = 0.0
+        self.title_count = 0
+
+        # The number of problems found per table, including any not
+        # recorded
+        self.counts = {}
+
+    @property
+    def ok(self):
+        '''bool: whether no problems were found.'''
+        return not self.counts
+
+    def add(self, table, message):
+        '''Record a problem.'''
+        count = self.counts.get(table, 0) + 1
+        self.counts[table] = count
+        if count <= MAX_PROBLEMS_PER_TABLE:
+            self.problems.append(Problem(table, message))
+
+    def as_dict(self):
+        '''Return the result as a dictionary suitable for JSON.'''
+        return {
+            'file': self.filename,
+            'ok': self.ok,
+            'titles': self.title_count,
+            'elapsed': self.elapsed,
+            'counts': self.counts,
+            'problems': [p.as_dict() for p in self.problems]}
+
+    def to_json(self, **kwargs):
+        '''Return the result as a JSON string.'''
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def __str__(self):
+        if self.ok:
+            return '{}: ok ({} titles, {:.3f}s)'.format(
+                self.filename, self.title_count, self.elapsed)
+        lines = ['{}: {} problem(s)'.format(
+            self.filename, sum(self.counts.values()))]
+        for problem in self.problems:
+            lines.append('  {}'.format(problem))
+        for table in sorted(self.counts):
+            if self.counts[table] > MAX_PROBLEMS_PER_TABLE:
+                lines.append('  {}: ... and {} more'.format(
+                    table, self.counts[table] - MAX_PROBLEMS_PER_TABLE))
+        return '\n'.join(lines)
+
+
+class _Checker(object):
+    '''Runs the checks for one database, recording into an FsckResult.'''
+
+    def __init__(self, reader, result):
+        self.reader = reader
+        self.result = result
+        self.buffer = reader.buffer
+        self.size = len(self.buffer)
+        self.offsets = reader.offsets
+        self.title_count = reader.title_count
+
+        # The end of each table is the start of the next
+        self.ends = {}
+        starts = [self.offsets[o] for o in TABLE_OFFSETS] + [self.size]
+        for index, offset in enumerate(TABLE_OFFSETS):
+            self.ends[offset] = max(starts[index + 1], starts[index])
+
+        # Filled in by check_main_index
+        self.genres = self.performers = self.albums = None
+
+    def add(self, table, message, *args):
+        self.result.add(table, message.format(*args))
+
+    def shorts(self, start, count):
+        '''Return an array of count short ints at start.'''
+        values = array('H')
+        values.frombytes(self.buffer[start:start + count * 2])
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return values
+
+    def fits(self, table, offset, length):
+        '''Check that length bytes at offset fit within a table.'''
+        if self.offsets[table] + length > self.ends[table]:
+            self.add(
+                OFFSET_NAMES[table],
+                'needs {} bytes but has {}',
+                length, self.ends[table] - self.offsets[table])
+            return False
+        return True
+
+    def check_string(self, name, number, table, length, char, expected,
+                     offset):
+        '''Check the bounds and terminator of a string.'''
+        if char != expected:
+            self.add(name, 'entry {}: character length {}, expected {}',
+                     number, char, expected)
+            return
+        if length < char or length % char:
+            self.add(name, 'entry {}: bad string length {}', number, length)
+            return
+        start = self.offsets[table] + offset
+        end = start + length
+        if end > self.ends[table]:
+            self.add(name, 'entry {}: string at {} overruns {}',
+                     number, offset, OFFSET_NAMES[table])
+            return
+        if self.buffer[end - char:end].count(0) != char:
+            self.add(name, 'entry {}: string at {} is not terminated',
+                     number, offset)
+
+    def check_header(self):
+        reader = self.reader
+        sizes = (
+            reader.title_entry_size,
+            reader.genre_entry_size,
+            reader.performer_entry_size,
+            reader.album_entry_size,
+            reader.playlist_entry_size)
+        if sizes != ENTRY_SIZES:
+            self.add('header', 'entry sizes {}, expected {}',
+                     sizes, ENTRY_SIZES)
+            return False
+
+        unknown = struct.unpack_from('<HH', self.buffer, 0x1c)
+        if unknown != HEADER_UNKNOWN:
+            self.add('header', 'unknown values {}, expected {}',
+                     unknown, HEADER_UNKNOWN)
+
+        # Genres, performers and albums always have a null entry
+        for name, count in (
+                ('genre', reader.genre_count),
+                ('performer', reader.performer_count),
+                ('album', reader.album_count)):
+            if count < 1:
+                self.add('header', 'no {} entries', name)
+                return False
+        return True
+
+    def check_offsets(self):
+        ok = True
+        for offset in ZERO_OFFSETS:
+            if self.offsets[offset]:
+                self.add('offsets', '{} is 0x{:08x}, expected 0',
+                         OFFSET_NAMES[offset], self.offsets[offset])
+
+        previous = constants.OFFSETS_OFFSET + 4 * constants.end_offsets
+        for offset in TABLE_OFFSETS:
+            value = self.offsets[offset]
+            if value < previous:
+                self.add('offsets', '{} at 0x{:08x} is before 0x{:08x}',
+                         OFFSET_NAMES[offset], value, previous)
+                ok = False
+            if value > self.size:
+                self.add('offsets', '{} at 0x{:08x} is beyond the end',
+                         OFFSET_NAMES[offset], value)
+                ok = False
+            previous = max(previous, value)
+        return ok
+
+    def check_table_sizes(self):
+        '''Check the fixed size tables fit.'''
+        reader = self.reader
+        ok = True
+        for table, length in (
+                (constants.main_index_offset,
+                    self.title_count * reader.title_entry_size),
+                (constants.alpha_title_order_offset, self.title_count * 2),
+                (constants.genre_index_offset,
+                    reader.genre_count * reader.genre_entry_size),
+                (constants.genre_title_order_offset, self.title_count * 2),
+                (constants.performer_index_offset,
+                    reader.performer_count * reader.performer_entry_size),
+                (constants.performer_title_order_offset,
+                    self.title_count * 2),
+                (constants.album_index_offset,
+                    reader.album_count * reader.album_entry_size),
+                (constants.album_title_order_offset, self.title_count * 2),
+                (constants.playlist_index_offset,
+                    reader.playlist_count * reader.playlist_entry_size)):
+            ok = self.fits(table, 0, length) and ok
+        return ok
+
+    def check_main_index(self):
+        reader = self.reader
+        genres = self.genres = array('H')
+        performers = self.performers = array('H')
+        albums = self.albums = array('H')
+
+        start = self.offsets[constants.main_index_offset]
+        end = start + self.title_count * reader.title_entry_size
+        for number, values in enumerate(struct.iter_unpack(
+                MainIndexEntry.FORMAT, self.buffer[start:end])):
+
+            genre, performer, album = values[0:3]
+            if genre >= reader.genre_count:
+                self.add('main_index', 'title {}: genre {} out of range',
+                         number, genre)
+            if performer >= reader.performer_count:
+                self.add('main_index', 'title {}: performer {} out of range',
+                         number, performer)
+            if album >= reader.album_count:
+                self.add('main_index', 'title {}: album {} out of range',
+                         number, album)
+            genres.append(genre)
+            performers.append(performer)
+            albums.append(album)
+
+            for index, value in MAIN_INDEX_FIXED:
+                if values[index] != value:
+                    self.add('main_index',
+                             'title {}: field {} is 0x{:x}, expected 0x{:x}',
+                             number, index, values[index], value)
+
+            for index, table, char in MAIN_INDEX_STRINGS:
+                self.check_string(
+                    'main_index', number, table,
+                    values[index], values[index + 1], char,
+                    values[index + 2])
+
+    def check_index(self, name, count, entry_size, index_table, name_table,
+                    title_table, field):
+        '''
+        Check the entries of a genre, performer, album or playlist index,
+        and their title lists. If field (an array of the genre, performer
+        or album of each title) is given, each title must belong to the
+        entry listing it, and every title must be listed.
+        '''
+        start = self.offsets[index_table]
+        end = start + count * entry_size
+        total = 0
+        for number, values in enumerate(struct.iter_unpack(
+                BaseIndexEntry.FORMAT, self.buffer[start:end])):
+            (name_length, name_char, name_offset, zero1,
+             titles_count, titles_offset, zero2) = values
+
+            self.check_string(
+                name, number, name_table, name_length, name_char,
+                BaseIndexEntry.NAME_CHAR_LENGTH, name_offset)
+
+            if zero1 or zero2:
+                self.add(name, 'entry {}: reserved fields are not zero',
+                         number)
+
+            if titles_offset % 2:
+                self.add(name, 'entry {}: odd title list offset {}',
+                         number, titles_offset)
+                continue
+            titles_start = self.offsets[title_table] + titles_offset
+            if titles_start + titles_count * 2 > self.ends[title_table]:
+                self.add(name, 'entry {}: title list overruns {}',
+                         number, OFFSET_NAMES[title_table])
+                continue
+
+            total += titles_count
+            for title in self.shorts(titles_start, titles_count):
+                if title >= self.title_count:
+                    self.add(name, 'entry {}: title {} out of range',
+                             number, title)
+                elif field is not None and field[title] != number:
+                    self.add(name, 'entry {}: lists title {} of {} {}',
+                             number, title, name, field[title])
+
+        if field is not None and total != self.title_count:
+            self.add(name, 'lists {} titles, expected {}',
+                     total, self.title_count)
+
+    def check_ordered_titles(self, name, table, field):
+        '''
+        Check an ordered title list holds every title once and, if field
+        is given, that the field of the titles never decreases.
+        '''
+        titles = self.shorts(self.offsets[table], self.title_count)
+        seen = bytearray(self.title_count)
+        previous = 0
+        for position, title in enumerate(titles):
+            if title >= self.title_count:
+                self.add(name, 'position {}: title {} out of range',
+                         position, title)
+                continue
+            if seen[title]:
+                self.add(name, 'position {}: title {} listed twice',
+                         position, title)
+            seen[title] = 1
+            if field is not None:
+                if field[title] < previous:
+                    self.add(name, 'position {}: title {} is out of order',
+                             position, title)
+                previous = field[title]
+
+    def check_sub_indices(self):
+        reader = self.reader
+        start = self.offsets[constants.sub_index_offset]
+        if start + SUB_INDEX_RELATIVE_OFFSET > self.size:
+            self.add('sub_index', 'header overruns the file')
+            return
+
+        relative = struct.unpack_from('<I', self.buffer, start)[0]
+        if relative != SUB_INDEX_RELATIVE_OFFSET:
+            self.add('sub_index', 'relative offset 0x{:x}, expected 0x{:x}',
+                     relative, SUB_INDEX_RELATIVE_OFFSET)
+
+        entries = [reader.sub_index(t)
+                   for t in range(constants.end_subindex_offsets)]
+        ok = True
+        for table, (offset, size, count) in enumerate(entries):
+            name = 'sub_{}'.format(table)
+            if size != SUB_INDEX_SIZES[table]:
+                self.add(name, 'entry size {}, expected {}',
+                         size, SUB_INDEX_SIZES[table])
+                ok = False
+            elif offset + size * count > self.size:
+                self.add(name, 'overruns the file')
+                ok = False
+        if not ok:
+            return
+
+        genre_rows = reader.genre_count - 1
+        performer_rows = reader.performer_count - 1
+        for table, offset, count in (
+                (constants.sub_0_genre_performers, None, genre_rows),
+                (constants.sub_3_genre_ordered_titles,
+                    self.offsets[constants.genre_title_order_offset],
+                    self.title_count),
+                (constants.sub_4_genre_albums, None, genre_rows),
+                (constants.sub_6_genre_titles,
+                    self.offsets[constants.genre_title_offset],
+                    self.title_count),
+                (constants.sub_7_performer_albums, None, performer_rows),
+                (constants.sub_9_performer_titles,
+                    self.offsets[constants.performer_title_offset],
+                    self.title_count),
+                (constants.sub_10_genre_performers,
+                    entries[constants.sub_0_genre_performers][0],
+                    genre_rows),
+                (constants.sub_12_genre_ordered_titles,
+                    self.offsets[constants.genre_title_order_offset],
+                    self.title_count)):
+            name = 'sub_{}'.format(table)
+            if offset is not None and entries[table][0] != offset:
+                self.add(name, 'offset 0x{:08x}, expected 0x{:08x}',
+                         entries[table][0], offset)
+                ok = False
+            if entries[table][2] != count:
+                self.add(name, 'count {}, expected {}',
+                         entries[table][2], count)
+                ok = False
+        if not ok:
+            return
+
+        rows = {}
+        for table, (offset, size, count) in enumerate(entries):
+            if size == 8:
+                rows[table] = list(struct.iter_unpack(
+                    '<HHHH', self.buffer[offset:offset + size * count]))
+        titles = {
+            table: self.shorts(entries[table][0], entries[table][2])
+            for table in (3, 6, 9, 12)}
+
+        # The first titles of the title tables belong to genre or
+        # performer 0, which is not in the sub-indices
+        genre_0 = reader.genre(0).number_of_titles
+        performer_0 = reader.performer(0).number_of_titles
+
+        for parent, child, base, child_count in (
+                (0, 1, 0, len(rows[1])),
+                (1, 2, 0, len(rows[2])),
+                (2, 3, genre_0, self.title_count),
+                (4, 5, 0, len(rows[5])),
+                (5, 6, genre_0, self.title_count),
+                (7, 8, 0, len(rows[8])),
+                (8, 9, performer_0, self.title_count),
+                (10, 11, 0, len(rows[11])),
+                (11, 12, genre_0, self.title_count)):
+            if not self.check_rows(parent, rows[parent], base, child_count):
+                ok = False
+        if not ok:
+            return
+
+        for row, expected in zip(rows[0], range(1, reader.genre_count)):
+            if row[0] != expected:
+                self.add('sub_0', 'row for genre {} holds {}',
+                         expected, row[0])
+        for row, expected in zip(rows[7], range(1, reader.performer_count)):
+            if row[0] != expected:
+                self.add('sub_7', 'row for performer {} holds {}',
+                         expected, row[0])
+
+        self.check_chain(
+            'sub_0', [rows[0], rows[1], rows[2]], titles[3],
+            [self.genres, self.performers, self.albums])
+        self.check_chain(
+            'sub_4', [rows[4], rows[5]], titles[6],
+            [self.genres, self.albums])
+        self.check_chain(
+            'sub_7', [rows[7], rows[8]], titles[9],
+            [self.performers, self.albums])
+        self.check_chain(
+            'sub_10', [rows[10], rows[11]], titles[12],
+            [self.genres, self.performers])
+
+    def check_rows(self, table, rows, base, child_count):
+        '''Check the offsets of rows are running totals of their counts.'''
+        name = 'sub_{}'.format(table)
+        total = base
+        for index, (number, offset, count, zero) in enumerate(rows):
+            if offset != total:
+                self.add(name, 'row {}: offset {}, expected {}',
+                         index, offset, total)
+                return False
+            if zero:
+                self.add(name, 'row {}: reserved field is not zero', index)
+            total += count
+        if total != child_count:
+            self.add(name, 'rows cover {} entries, expected {}',
+                     total, child_count)
+            return False
+        return True
+
+    def check_chain(self, name, levels, titles, fields):
+        '''
+        Walk a chain of sub-index tables from the top. Row numbers must
+        ascend within their parent, and each title reached must have the
+        genre, performer or album of every row on its path.
+        '''
+        def walk(level, start, count, path):
+            previous = -1
+            for row in levels[level][start:start + count]:
+                number = row[0]
+                if number <= previous:
+                    self.add(name, '{} out of order after {} (path {})',
+                             number, previous, path)
+                previous = number
+                if level + 1 < len(levels):
+                    walk(level + 1, row[1], row[2], path + (number,))
+                    continue
+                expected = path + (number,)
+                for title in titles[row[1]:row[1] + row[2]]:
+                    if title >= self.title_count:
+                        self.add(name, 'title {} out of range', title)
+                        continue
+                    actual = tuple(field[title] for field in fields)
+                    if actual != expected:
+                        self.add(name, 'title {} is {}, listed under {}',
+                                 title, actual, expected)
+
+        walk(0, 0, len(levels[0]), ())
+
+    def run(self):
+        reader = self.reader
+        if not self.check_header():
+            return
+        if not self.check_offsets() or not self.check_table_sizes():
+            return
+
+        self.check_main_index()
+
+        self.check_ordered_titles(
+            'alpha_title_order', constants.alpha_title_order_offset, None)
+        self.check_ordered_titles(
+            'genre_title_order', constants.genre_title_order_offset,
+            self.genres)
+        self.check_ordered_titles(
+            'performer_title_order',
+            constants.performer_title_order_offset,
+            self.performers)
+        self.check_ordered_titles(
+            'album_title_order', constants.album_title_order_offset,
+            self.albums)
+
+        self.check_index(
+            'genre', reader.genre_count, reader.genre_entry_size,
+            constants.genre_index_offset,
+            constants.genre_name_offset,
+            constants.genre_title_offset,
+            self.genres)
+        self.check_index(
+            'performer', reader.performer_count, reader.performer_entry_size,
+            constants.performer_index_offset,
+            constants.performer_name_offset,
+            constants.performer_title_offset,
+            self.performers)
+        self.check_index(
+            'album', reader.album_count, reader.album_entry_size,
+            constants.album_index_offset,
+            constants.album_name_offset,
+            constants.album_title_offset,
+            self.albums)
+        self.check_index(
+            'playlist', reader.playlist_count, reader.playlist_entry_size,
+            constants.playlist_index_offset,
+            constants.playlist_name_offset,
+            constants.playlist_title_offset,
+            None)
+
+        self.check_sub_indices()
+
+
+def fsck(filename):
+    '''Check the database in filename and return an FsckResult.'''
+    result = FsckResult(filename)
+    start = time.perf_counter()
+    try:
+        reader = DatabaseReader(filename)
+    except (IOError, OSError) as e:
+        result.add('file', str(e))
+    except ValueError as e:
+        result.add('header', str(e))
+    else:
+        with reader:
+            result.title_count = reader.title_count
+            _Checker(reader, result).run()
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Check the structure of Kenwood databases.')
+    parser.add_argument(
+        '--json',
+        action='store_true',
+        help='write the results as JSON lines')
+    parser.add_argument(
+        'files',
+        nargs='+',
+        metavar='FILE',
+        help='kenwood.dap file(s) to check')
+    args = parser.parse_args(argv)
+
+    status = 0
+    for filename in args.files:
+        result = fsck(filename)
+        if args.json:
+            print(result.to_json())
+        else:
+            print(result)
+        if not result.ok:
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
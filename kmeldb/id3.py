@@ -0,0 +1,308 @@
+'''
+In place parsing of the ID3 tags of mp3 files.
+
+hsaudiotag reads an ID3v2 tag by copying it into a BytesIO, copying each
+frame out of that into another BytesIO, and decoding every frame it is
+asked about; it then looks for MPEG frames and a VBR header to work out a
+duration the database does not use. A HeaderReader instead reads the head
+of the file into a buffer it keeps for every file, walks the frame headers
+through memoryview slices of that buffer, and decodes only the five text
+frames the DirWalker reads (title, artist, album, genre and track). Frames
+beyond the buffer (after a large picture, say) are read into it as they are
+reached, and an ID3v1 tag is read into it from the end of the file.
+
+The results are those hsaudiotag gives, including its quirks: a v2.4 tag
+whose frame sizes look like iTunes' non syncsafe ones is read as v2.3,
+unsynchronisation and frame flags are ignored, and an ID3v2 tag hides an
+ID3v1 tag. Where the file is not an mp3, has an appended ID3v2 tag, or does
+not start (after any tag) with an MPEG frame that hsaudiotag would accept,
+no tags are returned and the caller falls back to hsaudiotag.
+
+This module defines the following classes:
+    HeaderTags
+    HeaderReader
+'''
+
+import os
+import re
+import collections
+
+from hsaudiotag.genres import genre_by_index
+from hsaudiotag.mpeg import MpegFrameHeader
+
+from .iopolicy import HEADER_SIZE, ID3V1_SIZE
+
+HeaderTags = collections.namedtuple(
+    'HeaderTags', 'title artist album genre track')
+
+TAG_HEADER_SIZE = 10
+FOOTER_SIZE = 10
+MPEG_HEADER_SIZE = 4
+
+FLAG_EXT_HEADER = 1 << 6
+FLAG_FOOTER = 1 << 4
+
+# The frames read, by major version
+V22_FRAMES = (
+    (b'TT2', 'title'), (b'TP1', 'artist'), (b'TAL', 'album'),
+    (b'TCO', 'genre'), (b'TRK', 'track'))
+V23_FRAMES = (
+    (b'TIT2', 'title'), (b'TPE1', 'artist'), (b'TALB', 'album'),
+    (b'TCON', 'genre'), (b'TRCK', 'track'))
+
+# The bytes a frame id starts with, of which hsaudiotag needs three
+FRAME_ID_BYTES = frozenset(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789')
+
+ENCODINGS = ('latin_1', 'utf_16', 'utf_16_be', 'utf_8')
+BOM_LE = b'\xff\xfe'
+BOM_BE = b'\xfe\xff'
+
+NUMERIC_GENRE = re.compile(r'^\(?(\d{1,3})')
+
+
+def _size(data, syncsafe=True):
+    '''Return an ID3 size field, read as hsaudiotag does.'''
+    if len(data) != 4:
+        return 0
+    if syncsafe:
+        return (data[0] * 0x200000) + (data[1] * 0x4000) + \
+            (data[2] * 0x80) + data[3]
+    return int.from_bytes(data, 'big', signed=True)
+
+
+def _decode(data):
+    '''Return the text of a text frame's data, or None if it is empty.'''
+    if not len(data):
+        return None
+    encoding = data[0]
+    if encoding >= len(ENCODINGS):
+        return ''
+    text = data[1:]
+    if encoding == 1:
+        # Stray byte order marks are dropped, and a missing one taken to
+        # be little endian
+        bom = bytes(text[:2])
+        if bom in (BOM_LE, BOM_BE):
+            text = bom + bytes(text[2:]).replace(BOM_BE, b'').replace(
+                BOM_LE, b'')
+        else:
+            text = BOM_LE + bytes(text)
+    try:
+        text = str(text, ENCODINGS[encoding])
+    except UnicodeDecodeError:
+        try:
+            text = str(bytes(text) + b'\0', ENCODINGS[encoding])
+        except UnicodeDecodeError:
+            text = ''
+    return text.replace('\0', '\n').strip().replace(
+        '\n', ' ').replace('\r', ' ')
+
+
+def _genre(text):
+    match = NUMERIC_GENRE.match(text)
+    if match:
+        return genre_by_index(int(match.group(1)))
+    return text
+
+
+def _track(text):
+    # Either a number or <track>/<tracks>
+    try:
+        return int(text)
+    except ValueError:
+        if '/' in text:
+            return _track(text.split('/')[0])
+        return 0
+
+
+def _id3v1_field(data):
+    return str(data, 'latin_1').split('\0')[0].rstrip().replace(
+        '\n', ' ').replace('\r', ' ')
+
+
+class HeaderReader(object):
+    '''
+    Reads the tags of mp3 files through a buffer reused for every file.
+    '''
+
+    def __init__(self, size=HEADER_SIZE):
+        '''
+        Args:
+            size (int): The size of the buffer, and so of the head of each
+                file read at once; grown if a larger frame is read.
+        '''
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._fp = None
+        self._file_size = 0
+        # The part of the file in the buffer
+        self._start = 0
+        self._end = 0
+
+    def _read(self, offset, length):
+        '''
+        Return a memoryview of length bytes of the file from offset, read
+        into the buffer if they are not already in it. Fewer bytes are
+        returned at the end of the file.
+        '''
+        length = max(min(length, self._file_size - offset), 0)
+        if offset < self._start or offset + length > self._end:
+            if length > len(self._buffer):
+                self._buffer = bytearray(length)
+                self._view = memoryview(self._buffer)
+            self._fp.seek(offset)
+            count = self._fp.readinto(self._view) or 0
+            self._start = offset
+            self._end = offset + count
+        return self._view[offset - self._start:offset - self._start + length]
+
+    def _frames(self, version, start, end, syncsafe):
+        '''
+        Walk the frames of an ID3v2 tag, as hsaudiotag does.
+
+        Returns:
+            A dictionary of (start, end) of the data of the frames read, by
+            field name; whether any frame but the last is larger than 127
+            bytes; and the size of the last frame (or None).
+        '''
+        if version == 2:
+            frame_ids, id_size, header_size = V22_FRAMES, 3, 6
+        else:
+            frame_ids, id_size, header_size = V23_FRAMES, 4, 10
+        frames = {}
+        had_large = False
+        last_size = None
+        position = start
+        while True:
+            # A header cut short by the end of the tag ends the frames,
+            # unless only (version 2.3 and later) the flags are missing
+            header = self._read(position, min(header_size, end - position))
+            if len(header) < id_size + (3 if version == 2 else 4):
+                break
+            if not (header[0] in FRAME_ID_BYTES and
+                    header[1] in FRAME_ID_BYTES and
+                    header[2] in FRAME_ID_BYTES):
+                break
+            if version == 2:
+                size = int.from_bytes(header[3:6], 'big')
+            else:
+                size = _size(header[4:8], syncsafe)
+            if size == 0:
+                break
+            if last_size is not None and last_size > 0x7f:
+                had_large = True
+            last_size = size
+            data_start = min(position + header_size, end)
+            # A negative size reads to the end of the tag
+            data_end = end if size < 0 else min(data_start + size, end)
+            frame_id = header[:id_size]
+            for wanted, name in frame_ids:
+                if frame_id == wanted:
+                    frames[name] = (data_start, data_end)
+                    break
+            position = data_end
+        return frames, had_large, last_size
+
+    def _id3v2(self, header):
+        '''Return the HeaderTags of an ID3v2 tag, or None.'''
+        version = header[3]
+        flags = header[5]
+        tag_size = TAG_HEADER_SIZE + _size(header[6:10])
+        end = min(tag_size, self._file_size)
+        if flags & FLAG_FOOTER:
+            tag_size += FOOTER_SIZE
+
+        start = TAG_HEADER_SIZE
+        if flags & FLAG_EXT_HEADER:
+            size = _size(self._read(start, min(4, end - start)), version > 3)
+            start = end if size < 4 else min(start + size, end)
+
+        frames, had_large, last_size = self._frames(
+            version, start, end, version > 3)
+        if (version == 4 and not had_large and
+                last_size is not None and last_size > 0x7f):
+            # Probably written by iTunes, with sizes that are not syncsafe
+            frames, had_large, last_size = self._frames(
+                version, start, end, False)
+
+        values = {}
+        for name in HeaderTags._fields:
+            if name in frames:
+                data_start, data_end = frames[name]
+                text = _decode(self._read(data_start, data_end - data_start))
+                if text is None:
+                    # hsaudiotag fails on an empty text frame
+                    return None
+                values[name] = text
+            else:
+                values[name] = ''
+        # Checked last, as the audio usually follows the last frame read
+        if not self._audio_at(tag_size):
+            return None
+        return HeaderTags(
+            values['title'],
+            values['artist'],
+            values['album'],
+            _genre(values['genre']),
+            _track(values['track']))
+
+    def _id3v1(self):
+        '''Return the HeaderTags of an ID3v1 tag, or empty ones.'''
+        if self._file_size < ID3V1_SIZE:
+            return HeaderTags('', '', '', '', 0)
+        tag = self._read(self._file_size - ID3V1_SIZE, ID3V1_SIZE)
+        if tag[:3] != b'TAG':
+            return HeaderTags('', '', '', '', 0)
+        track = 0
+        if (tag[125] == 0 and tag[126] != 0) or \
+                (tag[125] == 0x20 and tag[126] != 0x20):
+            # Version 1.1
+            track = min(tag[126], 99)
+        return HeaderTags(
+            _id3v1_field(tag[3:33]),
+            _id3v1_field(tag[33:63]),
+            _id3v1_field(tag[63:93]),
+            genre_by_index(tag[127]),
+            track)
+
+    def _audio_at(self, offset):
+        '''Return True if hsaudiotag finds an MPEG frame at offset.'''
+        header = self._read(offset, MPEG_HEADER_SIZE)
+        if len(header) < MPEG_HEADER_SIZE:
+            return False
+        return MpegFrameHeader(int.from_bytes(header, 'big')).valid
+
+    def read(self, fullname, fp):
+        '''
+        Return the HeaderTags of an mp3 file, or None if they should be
+        read by hsaudiotag.
+
+        Args:
+            fullname (str): The name of the file.
+            fp (file): The file opened for binary reading, positioned
+                anywhere; it needs seek and readinto.
+        '''
+        if not fullname.lower().endswith('.mp3'):
+            return None
+        self._fp = fp
+        self._file_size = fp.seek(0, os.SEEK_END)
+        self._start = self._end = 0
+        try:
+            header = self._read(0, TAG_HEADER_SIZE)
+            if header[:3] == b'ID3':
+                if len(header) < TAG_HEADER_SIZE:
+                    # hsaudiotag fails on a truncated tag header
+                    return None
+                if header[3]:
+                    return self._id3v2(header)
+            if self._file_size >= FOOTER_SIZE:
+                footer = self._read(
+                    self._file_size - FOOTER_SIZE, FOOTER_SIZE)
+                if footer[:3] == b'3DI' and footer[3]:
+                    # An appended ID3v2 tag
+                    return None
+            if not self._audio_at(0):
+                return None
+            return self._id3v1()
+        finally:
+            self._fp = None
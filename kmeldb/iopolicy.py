@@ -0,0 +1,182 @@
+'''
+I/O policies for reading the tags of media files.
+
+Tag readers only need the first few KB of a file, and its last 128 bytes
+when it has an ID3v1 tag, but the kernel's read-ahead on USB mass storage
+fetches far more, and a full scan fills the page cache with files that will
+not be read again. The policies are:
+
+    default  Buffered reads through open(), with the kernel's read-ahead.
+    fadvise  As default, but the kernel is told that reads are random (no
+             read-ahead), asked to fetch the head and the ID3v1 tail up
+             front, and told to drop the file's pages once read.
+    pread    As fadvise, but reads are made with os.pread, at an offset,
+             into a buffer reused for every file (no seeks, and no read
+             buffer allocated per file).
+    header   As pread, but the ID3 tags of mp3 files are parsed in place
+             in a buffer reused for every file, and only the fields the
+             database needs are decoded (see kmeldb.id3).
+
+Where posix_fadvise is not available, the advice is left out.
+
+This module defines the following classes:
+    PreadFile
+    AdvisedFile
+    IOPolicy
+'''
+
+import os
+
+POLICIES = ('default', 'fadvise', 'pread', 'header')
+
+# The head of a file asked for up front, which holds an ID3v2 tag (unless
+# it has a large picture) and the first MPEG frame, or a WMA header
+HEADER_SIZE = 16 * 1024
+
+# An ID3v1 tag is the last 128 bytes of a file
+ID3V1_SIZE = 128
+
+HAVE_FADVISE = hasattr(os, 'posix_fadvise')
+
+
+class PreadFile(object):
+    '''
+    A read only binary file object that reads with os.pread into a buffer
+    shared with other PreadFiles.
+    '''
+
+    def __init__(self, fd, buffer):
+        '''
+        Args:
+            fd (int): An open file descriptor, closed with the PreadFile.
+            buffer (bytearray): Read into. A read larger than it (e.g. of
+                a whole file) is made into a buffer of its own, so that one
+                large file does not keep the shared buffer large.
+        '''
+        self._fd = fd
+        self._buffer = buffer
+        self._size = os.fstat(fd).st_size
+        self._position = 0
+
+    def fileno(self):
+        return self._fd
+
+    def read(self, size=-1):
+        remaining = max(self._size - self._position, 0)
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        if size > len(self._buffer):
+            data = os.pread(self._fd, size, self._position)
+            self._position += len(data)
+            return data
+        view = memoryview(self._buffer)[:size]
+        count = os.preadv(self._fd, [view], self._position)
+        self._position += count
+        return bytes(view[:count])
+
+    def readinto(self, buffer):
+        count = os.preadv(self._fd, [buffer], self._position)
+        self._position += count
+        return count
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise OSError('Invalid seek to {}'.format(offset))
+        self._position = offset
+        return offset
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class AdvisedFile(object):
+    '''
+    Wraps a binary file object, telling the kernel that reads will be
+    random and which parts will be read, and dropping the file's pages from
+    the page cache when it is closed.
+    '''
+
+    def __init__(self, fp):
+        self._fp = fp
+        fd = fp.fileno()
+        size = os.fstat(fd).st_size
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_RANDOM)
+        os.posix_fadvise(fd, 0, HEADER_SIZE, os.POSIX_FADV_WILLNEED)
+        if size > HEADER_SIZE:
+            os.posix_fadvise(
+                fd, size - ID3V1_SIZE, ID3V1_SIZE, os.POSIX_FADV_WILLNEED)
+
+    def fileno(self):
+        return self._fp.fileno()
+
+    def read(self, size=-1):
+        return self._fp.read(size)
+
+    def readinto(self, buffer):
+        return self._fp.readinto(buffer)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._fp.seek(offset, whence)
+
+    def tell(self):
+        return self._fp.tell()
+
+    def close(self):
+        try:
+            os.posix_fadvise(self._fp.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class IOPolicy(object):
+    '''Opens media files for their tags to be read under one policy.'''
+
+    def __init__(self, name='default'):
+        if name not in POLICIES:
+            raise ValueError('Unknown I/O policy: {}'.format(name))
+        self.name = name
+        # Shared by the files opened under the pread policy
+        self._buffer = bytearray(HEADER_SIZE)
+        # Parses the tags of mp3 files under the header policy
+        self.header_reader = None
+        if name == 'header':
+            from .id3 import HeaderReader
+            self.header_reader = HeaderReader()
+
+    def open(self, fullname):
+        '''Return a binary file object to read the tags of a media file.'''
+        if self.name in ('pread', 'header'):
+            fp = PreadFile(os.open(fullname, os.O_RDONLY), self._buffer)
+        else:
+            fp = open(fullname, 'rb')
+        if self.name == 'default' or not HAVE_FADVISE:
+            return fp
+        try:
+            return AdvisedFile(fp)
+        except OSError:
+            fp.close()
+            raise
+
+    def __str__(self):
+        return self.name
@@ -3,6 +3,8 @@ import os
 import struct
 from hsaudiotag import auto
 
+from kmeldb import tags
+from kmeldb.iopolicy import IOPolicy
 from kmeldb.MediaFile import MediaFile, valid_media_files
 from kmeldb.playlist import playlist, valid_media_playlists
 
@@ -20,19 +22,73 @@ log = logging.getLogger(__name__)
 
 class DirWalker(object):
 
-    def __init__(self, topdir, playlists, media_files):
+    def __init__(
+            self,
+            topdir,
+            playlists,
+            media_files,
+            scan_stats=None,
+            progress=None,
+            seed=None,
+            schedule=None,
+            io_policy=None):
         self._topdir = topdir
         self._playlists = playlists
         self._media_files = media_files
 
+        # Optional kmeldb.scan_stats.ScanStats for I/O accounting
+        self._scan_stats = scan_stats
+
+        # Optional kmeldb.progress.ProgressReporter
+        self._progress = progress
+
+        # Optional kmeldb.seed.DatabaseSeed of tags from a previous database
+        self._seed = seed
+
+        # The order of tag reads, one of kmeldb.schedule.SCHEDULES. Under
+        # the physical schedule, media files wait here until the walk ends
+        self._pending = [] if schedule == 'physical' else None
+
+        # How media files are opened, one of kmeldb.iopolicy.POLICIES
+        self._io_policy = None if io_policy is None else IOPolicy(io_policy)
+
         self._file_index = -1
         self._playlist_index = -1
         self._paths = {}
         self._buffer = bytearray(vfat_ioctl.BUFFER_SIZE)
 
+    def read_tags(self, fullname):
+        '''Read the tags of a media file.'''
+        if self._scan_stats is not None:
+            return self._scan_stats.read_tags(fullname, self._io_policy)
+        if self._io_policy is None:
+            return auto.File(fullname)
+        with self._io_policy.open(fullname) as fp:
+            return tags.read_tags(
+                fullname, fp, self._io_policy.header_reader)
+
     def walk(self):
         for root, dirs, files, rootfd in os.fwalk(self._topdir):
             self.get_directory_entries(root, rootfd, files)
+        if self._pending:
+            self.read_scheduled()
+
+    def read_scheduled(self):
+        '''
+        Read the tags of the media files waiting to be read, in physical
+        order, then add them all in directory order.
+        '''
+        from kmeldb.schedule import physical_order
+
+        pending, self._pending = self._pending, []
+        unread = [entry for entry, metadata in pending if metadata is None]
+        read = {}
+        for entry in physical_order(unread, lambda entry: entry[1]):
+            read[entry[0]] = self.read_tags(entry[1])
+        for entry, metadata in pending:
+            if metadata is None:
+                metadata = read[entry[0]]
+            self.add_media_file(entry, metadata)
 
     def get_directory_entries(self, root, rootfd, files):
 
@@ -56,6 +112,8 @@ class DirWalker(object):
                 rootfd,
                 vfat_ioctl.VFAT_IOCTL_READDIR_BOTH,
                 self._buffer)
+            if self._scan_stats is not None:
+                self._scan_stats.ioctl_calls += 1
 
             # Have we finished?
             if result < 1:
@@ -80,90 +138,201 @@ class DirWalker(object):
 
             # Don't process . or ..
             if (filename != '.') and (filename != '..'):
-                fullname = os.path.join(root, filename)
-                # Check whether it's a directory
-                if os.path.isdir(fullname):
-                    # Create the _paths entry, add following os.sep
-                    self._paths[os.path.relpath(fullname, self._topdir)] = {
-                        'shortname': os.path.join(
-                            current_path_shortname, shortname, '')}
-                else:
-                    if filename.lower().endswith(valid_media_files):
-                        self._file_index += 1
-                        print('Files: {}, Playlists: {}'.format(
-                            self._file_index + 1,
-                            self._playlist_index + 1), end='\r')
-
-                        title = ""
-                        performer = ""
-                        album = ""
-                        genre = ""
-
-                        # If there is no ID3 information:
-                        #
-                        # Title <- filename without extension
-                        # Album <- parent directory
-                        # Performer <- grandparent directory
-                        # Genre <- 0
-                        metadata = auto.File(fullname)
-                        title = metadata.title
-                        if title == "":
-                            title = filename.split(".")[0]
-
-                        # KMEL seems to remove all but the first performer
-                        # if there is a '/' in this field.
-                        # To be compatible, we'll do the same.
-                        # TODO: Remove this restriction after compatibility
-                        # testing.
-                        performer = metadata.artist
-                        performer = performer.split('/')[0]
-                        if performer == "":
-                            # KMEL seems to use the grandparent directory if the
-                            # performer is empty.
-                            try:
-                                performer = os.path.basename(os.path.split(relative_path)[0])
-                            except:
-                                performer = ""
-
-                        album = metadata.album
-                        if album == "":
-                            # KMEL seems to use the parent directory if the album
-                            # is empty.
-                            album = os.path.basename(relative_path)
-
-                        genre = metadata.genre
-                        if genre == "":
-                            pass
-
-                        track = metadata.track
-
-                        if hasattr(metadata, 'disc'):
-                            disc = metadata.disc
-                        else:
-                            disc = 0
-
-                        mf = MediaFile(
-                            index=self._file_index,
-                            fullname=fullname,
-                            shortdir=self._paths[relative_path]['shortname'],
-                            shortfile=shortname,
-                            longdir='{}{}{}'.format(
-                                os.sep, relative_path, os.sep),
-                            longfile=filename,
-                            title=title,
-                            performer=performer,
-                            album=album,
-                            genre=genre,
-                            tracknumber=track,
-                            discnumber=disc)
-
-                        self._media_files.append(mf)
-
-                        log.debug(mf)
-
-                    elif filename.lower().endswith(valid_media_playlists):
-                        self._playlist_index += 1
-                        print('Files: {}, Playlists: {}'.format(
-                            self._file_index + 1,
-                            self._playlist_index + 1), end='\r')
-                        self._playlists.append(playlist(fullname))
+                self.add_entry(
+                    root, relative_path, current_path_shortname, filename,
+                    shortname)
+
+    def add_entry(
+            self, root, relative_path, current_path_shortname, filename,
+            shortname):
+        '''
+        Add a directory entry, given both its names: a directory is
+        remembered for its short name, a media file or playlist is added.
+        '''
+        fullname = os.path.join(root, filename)
+        if self._scan_stats is not None:
+            self._scan_stats.stat_calls += 1
+        # Check whether it's a directory
+        if os.path.isdir(fullname):
+            # Create the _paths entry, add following os.sep
+            self._paths[os.path.relpath(fullname, self._topdir)] = {
+                'shortname': os.path.join(
+                    current_path_shortname, shortname, '')}
+        else:
+            if filename.lower().endswith(valid_media_files):
+                self._file_index += 1
+                if self._progress is not None:
+                    self._progress.update(
+                        self._file_index + 1,
+                        self._playlist_index + 1)
+
+                # Only the seed is used now, if reads are scheduled
+                metadata = None
+                if self._seed is not None:
+                    metadata = self._seed.tags(
+                        fullname,
+                        '{}{}{}'.format(os.sep, relative_path, os.sep),
+                        filename)
+                entry = (
+                    self._file_index, fullname, relative_path, filename,
+                    self._paths[relative_path]['shortname'], shortname)
+                if self._pending is not None:
+                    self._pending.append((entry, metadata))
+                    return
+                if metadata is None:
+                    metadata = self.read_tags(fullname)
+                self.add_media_file(entry, metadata)
+
+            elif filename.lower().endswith(valid_media_playlists):
+                self._playlist_index += 1
+                if self._progress is not None:
+                    self._progress.update(
+                        self._file_index + 1,
+                        self._playlist_index + 1)
+                self._playlists.append(playlist(fullname))
+
+    def add_media_file(self, entry, metadata):
+        '''
+        Add a media file, given its directory entry (index, full name,
+        relative path, long name, short directory and short name) and
+        its tags.
+        '''
+        index, fullname, relative_path, filename, shortdir, shortname = entry
+
+        title = ""
+        performer = ""
+        album = ""
+        genre = ""
+
+        # If there is no ID3 information:
+        #
+        # Title <- filename without extension
+        # Album <- parent directory
+        # Performer <- grandparent directory
+        # Genre <- 0
+        title = metadata.title
+        if title == "":
+            title = filename.split(".")[0]
+
+        # KMEL seems to remove all but the first performer
+        # if there is a '/' in this field.
+        # To be compatible, we'll do the same.
+        # TODO: Remove this restriction after compatibility
+        # testing.
+        performer = metadata.artist
+        performer = performer.split('/')[0]
+        if performer == "":
+            # KMEL seems to use the grandparent directory if the
+            # performer is empty.
+            try:
+                performer = os.path.basename(os.path.split(relative_path)[0])
+            except:
+                performer = ""
+
+        album = metadata.album
+        if album == "":
+            # KMEL seems to use the parent directory if the album
+            # is empty.
+            album = os.path.basename(relative_path)
+
+        genre = metadata.genre
+        if genre == "":
+            pass
+
+        track = metadata.track
+
+        if hasattr(metadata, 'disc'):
+            disc = metadata.disc
+        else:
+            disc = 0
+
+        mf = MediaFile(
+            index=index,
+            fullname=fullname,
+            shortdir=shortdir,
+            shortfile=shortname,
+            longdir='{}{}{}'.format(
+                os.sep, relative_path, os.sep),
+            longfile=filename,
+            title=title,
+            performer=performer,
+            album=album,
+            genre=genre,
+            tracknumber=track,
+            discnumber=disc)
+
+        self._media_files.append(mf)
+
+        log.debug(mf)
+
+
+class VfatDirectory(object):
+    '''
+    An open directory on a vfat file system, from which both names of its
+    entries are read with the ioctl, including entries created since it
+    was opened.
+    '''
+
+    def __init__(self, path):
+        self._fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        self._buffer = bytearray(vfat_ioctl.BUFFER_SIZE)
+        self._seen = {}
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def entries(self):
+        '''
+        Generate (long name, short name) for the entries after the last
+        one read, in directory order, leaving out . and ..
+        '''
+        while True:
+            result = fcntl.ioctl(
+                self._fd, vfat_ioctl.VFAT_IOCTL_READDIR_BOTH, self._buffer)
+            if result < 1:
+                return
+            sl, sn, ll, ln = struct.unpack(
+                vfat_ioctl.BUFFER_FORMAT, self._buffer)
+            shortname = sn[:sl].decode()
+            if ll > 0:
+                filename = ln[:ll].decode()
+            else:
+                filename = shortname
+            if (filename != '.') and (filename != '..'):
+                self._seen[filename] = shortname
+                yield filename, shortname
+
+    def short_name(self, filename):
+        '''
+        Return the short name of an entry, or None if there is none. New
+        entries are usually appended, so only those after the last one
+        read are read; the directory is read again from the start if the
+        entry reused the slot of a deleted one.
+        '''
+        if filename in self._seen:
+            return self._seen[filename]
+        for name, shortname in self.entries():
+            if name == filename:
+                return shortname
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        for name, shortname in self.entries():
+            if name == filename:
+                return shortname
+        return None
+
+
+def read_directory(path):
+    '''
+    Return a list of (long name, short name) for the entries of a directory
+    on a vfat file system, in directory order, leaving out . and ..
+    '''
+    with VfatDirectory(path) as directory:
+        return list(directory.entries())
@@ -20,16 +20,38 @@ log = logging.getLogger(__name__)
 
 class DirWalker(object):
 
-    def __init__(self, topdir, playlists, media_files):
+    def __init__(
+            self,
+            topdir,
+            playlists,
+            media_files,
+            scan_stats=None,
+            progress=None,
+            seed=None):
         self._topdir = topdir
         self._playlists = playlists
         self._media_files = media_files
 
+        # Optional kmeldb.scan_stats.ScanStats for I/O accounting
+        self._scan_stats = scan_stats
+
+        # Optional kmeldb.progress.ProgressReporter
+        self._progress = progress
+
+        # Optional kmeldb.seed.DatabaseSeed of tags from a previous database
+        self._seed = seed
+
         self._file_index = -1
         self._playlist_index = -1
         self._paths = {}
         self._buffer = bytearray(vfat_ioctl.BUFFER_SIZE)
 
+    def read_tags(self, fullname):
+        '''Read the tags of a media file.'''
+        if self._scan_stats is None:
+            return auto.File(fullname)
+        return self._scan_stats.read_tags(fullname)
+
     def walk(self):
         for root, dirs, files in os.walk(self.topdir):
             rootfd = open(root, 'r')
@@ -58,6 +80,8 @@ class DirWalker(object):
                 rootfd,
                 vfat_ioctl.VFAT_IOCTL_READDIR_BOTH,
                 self._buffer)
+            if self._scan_stats is not None:
+                self._scan_stats.ioctl_calls += 1
 
             # Have we finished?
             if result < 1:
@@ -83,6 +107,8 @@ class DirWalker(object):
             # Don't process . or ..
             if (filename != '.') and (filename != '..'):
                 fullname = os.path.join(root, filename)
+                if self._scan_stats is not None:
+                    self._scan_stats.stat_calls += 1
                 # Check whether it's a directory
                 if os.path.isdir(fullname):
                     # Create the _paths entry, add following os.sep
@@ -92,9 +118,10 @@ class DirWalker(object):
                 else:
                     if filename.lower().endswith(valid_media_files):
                         self._file_index += 1
-                        print('Files: {}, Playlists: {}'.format(
-                            self._file_index + 1,
-                            self._playlist_index + 1), end='\r')
+                        if self._progress is not None:
+                            self._progress.update(
+                                self._file_index + 1,
+                                self._playlist_index + 1)
 
                         title = ""
                         performer = ""
@@ -107,7 +134,14 @@ class DirWalker(object):
                         # Album <- parent directory
                         # Performer <- grandparent directory
                         # Genre <- 0
-                        metadata = auto.File(fullname)
+                        metadata = None
+                        if self._seed is not None:
+                            metadata = self._seed.tags(
+                                fullname,
+                                '{}{}{}'.format(os.sep, relative_path, os.sep),
+                                filename)
+                        if metadata is None:
+                            metadata = self.read_tags(fullname)
                         title = metadata.title
                         if title == "":
                             title = filename.split(".")[0]
@@ -165,7 +199,8 @@ class DirWalker(object):
 
                     elif filename.lower().endswith(valid_media_playlists):
                         self._playlist_index += 1
-                        print('Files: {}, Playlists: {}'.format(
-                            self._file_index + 1,
-                            self._playlist_index + 1), end='\r')
+                        if self._progress is not None:
+                            self._progress.update(
+                                self._file_index + 1,
+                                self._playlist_index + 1)
                         self._playlists.append(playlist(fullname))
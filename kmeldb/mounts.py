@@ -1,44 +1,204 @@
+'''
+Discovery of mounted FAT file systems.
+
+On Linux the mount table is read from /proc/self/mountinfo. The parsed
+table is cached, and only read again once the kernel reports (by POLLPRI
+on the open file) that something has been mounted or unmounted, so asking
+for the FAT mounts repeatedly is cheap. Elsewhere, psutil is used if it is
+installed, and the output of mount(8) otherwise.
+
+This module defines the following classes:
+    MountInfo
+    MountTable
+'''
+
 import os
-try:
+import re
+import select
+from collections import namedtuple
+
+# psutil is only imported if it is needed, i.e. without mountinfo. None
+# until then.
+HAVE_PSUTIL = None
+
+
+def have_psutil():
+    '''Return whether psutil can be imported.'''
+    global HAVE_PSUTIL
+    if HAVE_PSUTIL is None:
+        try:
+            import psutil  # noqa: F401
+        except ImportError:
+            HAVE_PSUTIL = False
+        else:
+            HAVE_PSUTIL = True
+    return HAVE_PSUTIL
+
+MOUNTINFO = '/proc/self/mountinfo'
+
+# File system types that support the VFAT short name ioctl
+FAT_TYPES = ('vfat', 'msdos', 'fat')
+
+MountInfo = namedtuple('MountInfo', [
+    'mount_id', 'parent_id', 'device', 'root', 'mountpoint', 'options',
+    'fstype', 'source', 'super_options'])
+
+
+# Spaces, tabs, newlines and backslashes in paths are escaped as \ooo
+_ESCAPE = re.compile(r'\\([0-7]{3})')
+
+
+def _unescape(field):
+    return _ESCAPE.sub(lambda m: chr(int(m.group(1), 8)), field)
+
+
+# A line of mount(8) output: "device on mountpoint type fstype (options)" on
+# Linux, and "device on mountpoint (fstype, options)" on macOS
+_MOUNT_LINE = re.compile(
+    r'^(?P<device>.+?) on (?P<mountpoint>.+?)'
+    r'(?: type (?P<fstype>\S+))? \((?P<options>[^)]*)\)$')
+
+
+def parse_mount(text):
+    '''
+    Return (mountpoint, fstype, device) for each line of mount(8) output.
+    '''
+    mounts = []
+    for line in text.splitlines():
+        match = _MOUNT_LINE.match(line.strip())
+        if match is None:
+            continue
+        fstype = match.group('fstype')
+        if fstype is None:
+            fstype = match.group('options').split(',')[0].strip()
+        mounts.append(
+            (match.group('mountpoint'), fstype, match.group('device')))
+    return mounts
+
+
+def parse_mountinfo(text):
+    '''Return a list of MountInfo, one per line of mountinfo text.'''
+    mounts = []
+    for line in text.splitlines():
+        fields = line.split(' ')
+        try:
+            # Optional fields end with a lone '-'
+            separator = fields.index('-', 6)
+            mounts.append(MountInfo(
+                mount_id=int(fields[0]),
+                parent_id=int(fields[1]),
+                device=fields[2],
+                root=_unescape(fields[3]),
+                mountpoint=_unescape(fields[4]),
+                options=fields[5],
+                fstype=fields[separator + 1],
+                source=_unescape(fields[separator + 2]),
+                super_options=fields[separator + 3]))
+        except (ValueError, IndexError):
+            continue
+    return mounts
+
+
+class MountTable(object):
+    '''The mount table, read again only when it has changed.'''
+
+    def __init__(self, filename=MOUNTINFO):
+        self._fd = os.open(filename, os.O_RDONLY)
+        self._poll = select.poll()
+        self._poll.register(self._fd, select.POLLPRI | select.POLLERR)
+        self._mounts = None
+        self.reads = 0
+
+    def close(self):
+        if self._fd is not None:
+            self._poll.unregister(self._fd)
+            os.close(self._fd)
+            self._fd = None
+
+    def _read(self):
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        chunks = []
+        while True:
+            chunk = os.read(self._fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        self._mounts = parse_mountinfo(
+            b''.join(chunks).decode('utf-8', 'replace'))
+        self.reads += 1
+
+    def wait(self, timeout=None):
+        '''
+        Wait up to timeout seconds for the mount table to change. Returns
+        True if it has changed since it was last read.
+        '''
+        events = self._poll.poll(None if timeout is None else timeout * 1000)
+        if events:
+            # Mark the cache stale; the event itself has been consumed
+            self._mounts = None
+            return True
+        return False
+
+    def mounts(self):
+        '''Return a list of MountInfo for the current mounts.'''
+        if self._mounts is None or self.wait(0):
+            self._read()
+        return self._mounts
+
+    def fat_mounts(self):
+        '''Return a list of MountInfo for the mounted FAT file systems.'''
+        return [m for m in self.mounts() if m.fstype in FAT_TYPES]
+
+
+_mount_table = None
+
+
+def mount_table():
+    '''
+    Return the shared MountTable, or None if there is no mountinfo file.
+    '''
+    global _mount_table
+    if _mount_table is None and os.path.exists(MOUNTINFO):
+        _mount_table = MountTable()
+    return _mount_table
+
+
+def psutil_fat_mounts():
+    '''
+    Return (mountpoint, fstype, device) for the FAT mounts psutil reports.
+    '''
     import psutil
-except ImportError:
-    HAVE_PSUTIL = False
-else:
-    HAVE_PSUTIL = True
+    return [(part.mountpoint, part.fstype, part.device)
+            for part in psutil.disk_partitions()
+            if part.fstype.lower() in FAT_TYPES]
 
 
 def get_fat_mounts():
 
     fat_mounts = []
 
-    if HAVE_PSUTIL:
-        partitions = psutil.disk_partitions()
-        for part in partitions:
-            if 'fat' in part.fstype.lower() or 'msdos' in part.fstype.lower():
-                fat_mounts.append((part.mountpoint, part.fstype, part.device))
+    table = mount_table()
+    if table is not None:
+        for mount in table.fat_mounts():
+            fat_mounts.append((mount.mountpoint, mount.fstype, mount.source))
+    elif have_psutil():
+        fat_mounts = psutil_fat_mounts()
     else:
         mounts = os.popen('mount')
-        for line in mounts.readlines():
-            # device, ign1, mountpoint, ign2, filesystem, options = line.split()
-            parts = line.split()
-            device = parts[0]
-            mountpoint = parts[2]
-            if 'fat' in line or 'msdos' in line:
-                fat_mounts.append((mountpoint, 'vfat', device))
+        fat_mounts = [
+            mount for mount in parse_mount(mounts.read())
+            if mount[1].lower() in FAT_TYPES]
         mounts.close()
     return fat_mounts
 
 
 def main():
-    global HAVE_PSUTIL
-
     mounts1 = get_fat_mounts()
     for mount in mounts1:
         print(mount)
 
-    if HAVE_PSUTIL:
-        HAVE_PSUTIL = False
-        mounts2 = get_fat_mounts()
+    if have_psutil():
+        mounts2 = psutil_fat_mounts()
         for mount in mounts2:
             print(mount)
 
@@ -0,0 +1,390 @@
+'''
+Planning the size of a database before it is built.
+
+The database stores its counts, title numbers and the offsets within its
+index and sub-index tables as unsigned 16 bit values, and the offsets of
+its tables as unsigned 32 bit values. A library too large for these is
+otherwise only found out by a struct.error from the writer, once the tags
+of every media file have been read.
+
+plan_location walks a location for its media files and playlists without
+reading any tags, builds the indices in memory and checks the counts
+against the limits of the format. If they fit, the database is written to a
+sink that keeps nothing but its size, giving the exact size of every table
+and of the database, or else every table with a field that would overflow.
+Nothing is written to the location. A location that is not on vfat is
+planned with the short names predicted for it (see kmeldb.staging), so that
+a staging tree can be sized before it is copied to a stick.
+
+Without its tags, a media file is given what KMEL falls back on: its file
+name as the title, its parent directory as the album, its grandparent
+directory as the performer and no genre. The number of titles is exact,
+but the number of genres, performers and albums (and the sizes that depend
+on them) are estimates, unless the tags are taken from a DatabaseSeed of
+the previous database. Only the media files not in the seed are then
+estimated (see CapacityPlan.estimated).
+
+Run as a script, it plans the given locations and exits non-zero if any
+would exceed a limit:
+
+    python3 -m kmeldb.planner /media/usb
+
+This module defines the following classes:
+    Limit
+    PlanningSeed
+    CapacityPlan
+'''
+
+import os
+import re
+import sys
+import json
+import time
+import errno
+import struct
+import logging
+import argparse
+
+from .KenwoodDatabase import KenwoodDatabase
+from .build import scan_location, _copy_for_writer
+from .seed import SeededTags, load_seed
+from .stats import DatabaseStats
+from .collation import COLLATIONS
+
+log = logging.getLogger(__name__)
+
+# The largest values of the unsigned 16 and 32 bit fields of the format
+U16_MAX = 0xFFFF
+U32_MAX = 0xFFFFFFFF
+
+# The counts stored in the header, with the attribute of a KenwoodDatabase
+# holding each
+COUNTS = (
+    ('titles', 'number_of_entries'),
+    ('genres', 'number_of_genres'),
+    ('performers', 'number_of_performers'),
+    ('albums', 'number_of_albums'),
+    ('playlists', 'number_of_playlists'))
+
+
+class Limit(object):
+    '''A limit of the format that a database would exceed.'''
+
+    def __init__(self, name, value, maximum):
+        '''
+        Args:
+            name (str): The count, or the table with the field, that is
+                too large.
+            value (int): The value, or None if it is not known.
+            maximum (int): The largest value the field can hold.
+        '''
+        self.name = name
+        self.value = value
+        self.maximum = maximum
+
+    def as_dict(self):
+        return {'name': self.name, 'value': self.value, 'max': self.maximum}
+
+    def __str__(self):
+        if self.value is None:
+            return '{}: a value exceeds {}'.format(self.name, self.maximum)
+        return '{}: {} exceeds {}'.format(self.name, self.value, self.maximum)
+
+
+class PlanningSeed(object):
+    '''
+    Stands in for a DatabaseSeed in a scan, so that no tags are read.
+
+    Media files are given the tags in seed (a DatabaseSeed) if they are
+    there, and empty tags otherwise.
+    '''
+
+    def __init__(self, seed=None):
+        self._seed = seed
+
+        # The full names of the media files given seeded tags
+        self.reused = set()
+        self.reread = 0
+
+        # The number of media files given empty tags
+        self.estimated = 0
+
+    def tags(self, fullname, longdir, longfile):
+        '''Return the SeededTags for a media file.'''
+        if self._seed is not None:
+            tags = self._seed.tags(fullname, longdir, longfile)
+            if tags is not None:
+                self.reused.add(fullname)
+                return tags
+        self.estimated += 1
+        return SeededTags('', '', '', '', 0)
+
+    def reconcile(self, media_files, read_tags):
+        '''Track and disc numbers do not change the plan, so do nothing.'''
+
+
+class _SizingFile(object):
+    '''A binary file object that keeps only its size and position.'''
+
+    def __init__(self):
+        self.size = 0
+        self._position = 0
+
+    def write(self, data):
+        self._position += len(data)
+        if self._position > self.size:
+            self.size = self._position
+        return len(data)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self._position = offset
+        return offset
+
+    def tell(self):
+        return self._position
+
+
+class _SizingStats(DatabaseStats):
+    '''
+    DatabaseStats that note each table with a field too large for the
+    format, and go on to the next table rather than stopping at the first.
+    '''
+
+    def __init__(self):
+        super().__init__()
+        self.exceeded = []
+
+    def record(self, name, group, db_file, write, entries=0):
+        try:
+            super().record(name, group, db_file, write, entries)
+        except struct.error as e:
+            # The fixups write some tables again
+            if name not in [limit.name for limit in self.exceeded]:
+                self.exceeded.append(Limit(name, None, _maximum(e)))
+
+
+def _maximum(error):
+    '''Return the largest value a struct.error says a field can hold.'''
+    match = re.search(r'<= (\d+)', str(error))
+    return int(match.group(1)) if match else U16_MAX
+
+
+class CapacityPlan(object):
+    '''The size of the database of a location, and the limits it exceeds.'''
+
+    def __init__(self, path):
+        self.path = path
+        self.titles = 0
+        self.genres = 0
+        self.performers = 0
+        self.albums = 0
+        self.playlists = 0
+
+        # The number of media files whose tags were not known
+        self.estimated = 0
+
+        # The PhaseStats of each table, in file order, and the size of the
+        # database, if it can be written
+        self.tables = []
+        self.size = None
+
+        # The Limits exceeded
+        self.exceeded = []
+        self.elapsed = 0.0
+
+    @property
+    def ok(self):
+        '''bool: whether the database can be written.'''
+        return not self.exceeded
+
+    def as_dict(self):
+        '''Return the plan as a dictionary suitable for JSON.'''
+        return {
+            'path': self.path,
+            'ok': self.ok,
+            'titles': self.titles,
+            'genres': self.genres,
+            'performers': self.performers,
+            'albums': self.albums,
+            'playlists': self.playlists,
+            'estimated': self.estimated,
+            'bytes': self.size,
+            'elapsed': self.elapsed,
+            'tables': [{
+                'name': t.name,
+                'group': t.group,
+                'bytes': t.size,
+                'entries': t.entries} for t in self.tables],
+            'exceeded': [limit.as_dict() for limit in self.exceeded]}
+
+    def to_json(self, **kwargs):
+        '''Return the plan as a JSON string.'''
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def __str__(self):
+        lines = ['{}: {} titles{}, {} genres, {} performers, {} albums, '
+                 '{} playlists ({:.3f}s)'.format(
+                     self.path,
+                     self.titles,
+                     ' ({} without tags)'.format(self.estimated)
+                     if self.estimated else '',
+                     self.genres,
+                     self.performers,
+                     self.albums,
+                     self.playlists,
+                     self.elapsed)]
+        for table in self.tables:
+            lines.append('  {:12s} {:28s} {:10d} bytes {:7d} entries'.format(
+                table.group, table.name, table.size, table.entries))
+        if self.size is not None:
+            lines.append('  {:12s} {:28s} {:10d} bytes'.format(
+                'total', '', self.size))
+        if self.ok:
+            lines.append('  ok')
+        for limit in self.exceeded:
+            lines.append('  EXCEEDED {}'.format(limit))
+        return '\n'.join(lines)
+
+
+def plan_database(
+        media_files, playlists=(), collation=None, split_albums=False,
+        path=None):
+    '''
+    Plan the database for media files, without writing it.
+
+    Args:
+        media_files (iterable of MediaFile): The media files, which are not
+            modified.
+        playlists (iterable): Objects with a title and the list of their
+            media_files.
+        collation, split_albums: As for kmeldb.build.write_database.
+        path (str): The location, for the report.
+
+    Returns:
+        A CapacityPlan.
+    '''
+    start = time.monotonic()
+    plan = CapacityPlan(path)
+
+    tracks, lists = _copy_for_writer(media_files, playlists)
+    stats = _SizingStats()
+    sink = _SizingFile()
+    database = KenwoodDatabase(
+        None, stats=stats, db_file=sink, collation=collation,
+        split_albums=split_albums)
+    database.create_indices(tracks, lists)
+
+    for name, attribute in COUNTS:
+        value = getattr(database, attribute)
+        setattr(plan, name, value)
+        if value > U16_MAX:
+            plan.exceeded.append(Limit(name, value, U16_MAX))
+
+    # The counts come first, so nothing else can be written without them
+    if plan.ok:
+        database.write_tables()
+        plan.exceeded.extend(stats.exceeded)
+        if plan.ok:
+            plan.tables = [
+                p for p in stats.phases if p.group != stats.FIXUP_GROUP]
+            plan.size = sink.size
+            if plan.size > U32_MAX:
+                plan.exceeded.append(Limit('bytes', plan.size, U32_MAX))
+
+    plan.elapsed = time.monotonic() - start
+    return plan
+
+
+def plan_location(
+        path, seed=None, collation=None, split_albums=False,
+        walker_class=None):
+    '''
+    Plan the database for a directory tree, reading no tags.
+
+    Args:
+        path (str): The top of the directory tree, e.g. a mount point.
+        seed (DatabaseSeed): If given, tags are taken from it.
+        collation, split_albums: As for kmeldb.build.write_database.
+        walker_class (callable): As for kmeldb.build.scan_location. By
+            default, the short names are read if path is on vfat, and
+            predicted as kmeldb.staging would create them otherwise.
+
+    Returns:
+        A CapacityPlan.
+    '''
+    start = time.monotonic()
+    planning_seed = PlanningSeed(seed)
+    try:
+        scanned = scan_location(
+            path, seed=planning_seed, walker_class=walker_class)
+    except OSError as e:
+        # Only vfat has the short names of its entries to read
+        if walker_class is not None or e.errno != errno.ENOTTY:
+            raise
+        from .staging import StagingWalker
+        log.info('{} is not vfat, predicting short names'.format(path))
+        planning_seed = PlanningSeed(seed)
+        scanned = scan_location(
+            path, seed=planning_seed, walker_class=StagingWalker)
+    plan = plan_database(
+        scanned.media_files, scanned.playlists, collation=collation,
+        split_albums=split_albums, path=path)
+    plan.estimated = planning_seed.estimated
+    plan.elapsed = time.monotonic() - start
+    return plan
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Plan the size of Kenwood databases without writing '
+                    'them.')
+    parser.add_argument(
+        '--json',
+        action='store_true',
+        help='write the plans as JSON lines')
+    parser.add_argument(
+        '--seed',
+        action='store_true',
+        help="take tags from each location's existing database")
+    parser.add_argument(
+        '--collation',
+        choices=COLLATIONS,
+        help='the alphabetical order of the database')
+    parser.add_argument(
+        '--split-albums',
+        action='store_true',
+        help='keep albums of the same name in different directories apart')
+    parser.add_argument(
+        'paths',
+        nargs='+',
+        metavar='PATH',
+        help='location(s) to plan')
+    args = parser.parse_args(argv)
+
+    if args.collation == 'locale':
+        import locale
+        locale.setlocale(locale.LC_COLLATE, '')
+
+    status = 0
+    for path in args.paths:
+        seed = None
+        if args.seed:
+            seed = load_seed(os.path.join(path, 'kenwood.dap', 'kenwood.dap'))
+        plan = plan_location(
+            path, seed=seed, collation=args.collation,
+            split_albums=args.split_albums)
+        if args.json:
+            print(plan.to_json())
+        else:
+            print(plan)
+        if not plan.ok:
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -23,8 +23,6 @@ This module defines the following classes:
 
 import os
 import logging
-import configparser
-import urllib.parse
 from .BaseIndexEntry import BaseIndexEntry
 
 log = logging.getLogger(__name__)
@@ -73,6 +71,10 @@ PLS_SECTION = 'playlist'
 class PLSPlaylistFile(PlaylistFile):
 
     def read(self):
+        # Only needed when there are playlists to read
+        import configparser
+        import urllib.parse
+
         cfg_parser = configparser.ConfigParser(interpolation=None)
 
         f = open(self.fullname, 'r')
@@ -0,0 +1,122 @@
+'''
+Profiling hooks for DapGen runs.
+
+A Profiler wraps each phase of a run (scanning a media location, writing its
+database) in cProfile and/or tracemalloc, and writes the results into a
+directory. Files are named after the mount point, the time the Profiler was
+created and the phase, e.g.:
+
+    media_usb_20160416-101500_scan.pstats
+    media_usb_20160416-101500_scan_mem.txt
+
+The .pstats files can be examined with the pstats module or any tool that
+reads them (snakeviz, gprof2dot, ...).
+
+tracemalloc, and the peak it records, are process wide, so the memory
+profile of a phase includes everything allocated by other threads while it
+runs. Only one location should be profiled at a time.
+
+This module defines the following classes:
+    Profiler
+'''
+
+import os
+import re
+import time
+import logging
+
+log = logging.getLogger(__name__)
+
+PROFILE_MODES = ('cpu', 'mem', 'both')
+
+
+class Profiler(object):
+    '''Profiles the phases of a run for a single media location.'''
+
+    def __init__(self, mode, directory, location, top=25):
+        '''
+        Args:
+            mode (str): One of 'cpu', 'mem' or 'both'.
+            directory (str): The directory in which to write the results.
+            location (str): The path being processed, used to name files.
+            top (int): The number of allocation sites to report.
+        '''
+        if mode not in PROFILE_MODES:
+            raise ValueError('Unknown profile mode: {}'.format(mode))
+
+        self.cpu = mode in ('cpu', 'both')
+        self.mem = mode in ('mem', 'both')
+        self.directory = directory
+        self.top = top
+
+        name = re.sub(r'[^A-Za-z0-9_.-]+', '_', location).strip('_')
+        self.prefix = '{}_{}'.format(
+            name or 'root',
+            time.strftime('%Y%m%d-%H%M%S'))
+
+        # The files written, in order
+        self.files = []
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def _path(self, phase, suffix):
+        return os.path.join(
+            self.directory,
+            '{}_{}{}'.format(self.prefix, phase, suffix))
+
+    def run(self, phase, function, *args, **kwargs):
+        '''Call function(*args, **kwargs) under the profiler(s).
+
+        Returns whatever function returns. Results are written even if
+        function raises.
+        '''
+        profile = None
+        if self.cpu:
+            import cProfile
+            profile = cProfile.Profile()
+
+        if self.mem:
+            import tracemalloc
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+
+        try:
+            if profile is None:
+                return function(*args, **kwargs)
+            return profile.runcall(function, *args, **kwargs)
+        finally:
+            if profile is not None:
+                path = self._path(phase, '.pstats')
+                profile.dump_stats(path)
+                self.files.append(path)
+                log.info('CPU profile for {} written to {}'.format(
+                    phase, path))
+
+            if self.mem:
+                after = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+                if started_tracing:
+                    tracemalloc.stop()
+                path = self._path(phase, '_mem.txt')
+                self._write_allocations(
+                    path, phase, before, after, current, peak)
+                self.files.append(path)
+                log.info('Memory profile for {} written to {}'.format(
+                    phase, path))
+
+    def _write_allocations(self, path, phase, before, after, current, peak):
+        '''Write the top allocation sites for the phase to path.'''
+        differences = after.compare_to(before, 'lineno')
+        with open(path, 'w') as f:
+            f.write('Phase: {}\n'.format(phase))
+            f.write('Traced memory: current {} bytes, peak {} bytes\n'.format(
+                current, peak))
+            f.write(
+                '\nTop {} allocation sites (growth during phase):\n'.format(
+                    self.top))
+            for stat in differences[:self.top]:
+                f.write('{}\n'.format(stat))
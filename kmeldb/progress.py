@@ -0,0 +1,146 @@
+'''
+Rate limited progress reporting for the media file scanner.
+
+The scanner calls ProgressReporter.update for every file it finds; output is
+only produced when the refresh interval has elapsed. Human readable output
+goes to a terminal only, and is suppressed when the stream is not a TTY (so
+piped logs stay clean). Optionally, progress is also written as JSON lines to
+a second stream for machine consumption.
+
+This module defines the following classes:
+    ProgressReporter
+'''
+
+import os
+import sys
+import json
+import time
+import struct
+import threading
+import logging
+
+from . import constants
+
+log = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 0.1
+
+
+def expected_total(db_filename):
+    '''
+    Return the number of titles in an existing database, or None.
+
+    Used as the expected total when re-scanning a location, so an ETA can be
+    given. Only the header of the database is read.
+    '''
+    try:
+        with open(db_filename, 'rb') as f:
+            header = f.read(constants.OFFSETS_OFFSET)
+    except (IOError, OSError):
+        return None
+    if len(header) < 0x0a or header[:4] != b'KWDB':
+        return None
+    return struct.unpack_from('<H', header, 0x08)[0]
+
+
+class ProgressReporter(object):
+    '''Reports scanning progress at most once per interval.'''
+
+    # Reporters for concurrent scans may share a JSON stream
+    _json_lock = threading.Lock()
+
+    def __init__(
+            self,
+            label='',
+            stream=None,
+            json_stream=None,
+            interval=DEFAULT_INTERVAL,
+            total=None,
+            quiet=False):
+        '''
+        Args:
+            label (str): A label for the location being scanned.
+            stream (file): Where to write human readable progress. Defaults
+                to sys.stdout. Nothing is written unless it is a TTY.
+            json_stream (file): If given, progress is written here as JSON
+                lines.
+            interval (float): The minimum time between updates, in seconds.
+            total (int): The number of files expected, if known.
+            quiet (bool): Never write human readable progress, e.g. when
+                several locations are being scanned at once.
+        '''
+        if stream is None:
+            stream = sys.stdout
+        self._label = label
+        self._stream = stream if stream.isatty() and not quiet else None
+        self._json_stream = json_stream
+        self._interval = interval
+        self._total = total
+
+        self._files = 0
+        self._playlists = 0
+        self._start = time.monotonic()
+        self._next = self._start + interval
+
+    @property
+    def enabled(self):
+        '''bool: whether any output will be produced.'''
+        return self._stream is not None or self._json_stream is not None
+
+    def update(self, files, playlists):
+        '''Record the current counts, reporting them if it is time to.'''
+        self._files = files
+        self._playlists = playlists
+        now = time.monotonic()
+        if now >= self._next:
+            self._next = now + self._interval
+            self._report(now, 'progress')
+
+    def finish(self):
+        '''Report the final counts.'''
+        self._report(time.monotonic(), 'done')
+        if self._stream is not None:
+            self._stream.write('\n')
+            self._stream.flush()
+
+    def _report(self, now, event):
+        elapsed = now - self._start
+        rate = self._files / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if self._total and rate > 0 and self._files < self._total:
+            eta = (self._total - self._files) / rate
+
+        if self._stream is not None:
+            line = '{}Files: {}, Playlists: {}, {:.1f} files/s'.format(
+                '{}: '.format(self._label) if self._label else '',
+                self._files,
+                self._playlists,
+                rate)
+            if eta is not None:
+                line += ', ETA {:.0f}s'.format(eta)
+            # Pad to overwrite any longer previous line
+            self._stream.write('\r{:79s}'.format(line))
+            self._stream.flush()
+
+        if self._json_stream is not None:
+            line = json.dumps({
+                'event': event,
+                'location': self._label,
+                'files': self._files,
+                'playlists': self._playlists,
+                'elapsed': elapsed,
+                'rate': rate,
+                'total': self._total,
+                'eta': eta}) + '\n'
+            try:
+                with self._json_lock:
+                    self._json_stream.write(line)
+                    self._json_stream.flush()
+            except (IOError, OSError) as e:
+                log.warning('Progress stream failed, disabling: {}'.format(e))
+                self._json_stream = None
+
+
+def open_progress_fd(fd):
+    '''Return a line buffered text stream for the given file descriptor.'''
+    return os.fdopen(fd, 'w', buffering=1, closefd=False)
@@ -0,0 +1,171 @@
+'''
+Browse queries over the sub-index tables of a Kenwood database.
+
+The sub-indices hold the browse paths used by the head unit, as chains of
+tables of (number, offset, count, 0) rows:
+
+    genre -> performers -> albums -> titles   (sub 0, 1, 2, 3)
+    genre -> albums -> titles                 (sub 4, 5, 6)
+    performer -> albums -> titles             (sub 7, 8, 9)
+    genre -> performers -> titles             (sub 10, 11, 12)
+
+Genre and performer rows start at number 1 (number 0 holds the files
+without a genre or performer, and is not in the sub-indices), so the row
+for a genre or performer is found directly. Rows within a genre or
+performer are in ascending order and are found by binary search. Every
+query therefore reads only the rows on its path and the titles it returns;
+the main index is never scanned.
+
+Queries return tuples of title, album or performer numbers, which can be
+looked up with the DatabaseReader.
+
+This module defines the following classes:
+    DatabaseQuery
+'''
+
+import logging
+
+from . import constants
+
+log = logging.getLogger(__name__)
+
+
+class DatabaseQuery(object):
+    '''Answers browse queries using a kmeldb.reader.DatabaseReader.'''
+
+    def __init__(self, reader):
+        self.reader = reader
+
+    def _top_row(self, table, number, kind):
+        '''Return the row of a genre or performer table for number.'''
+        if number == 0:
+            raise ValueError(
+                '{} 0 is not in the sub-indices'.format(kind))
+        row = self.reader.sub_index_row(table, number - 1)
+        if row[0] != number:
+            raise ValueError('Sub-index {} row for {} {} holds {}'.format(
+                table, kind.lower(), number, row[0]))
+        return row
+
+    def _find_row(self, table, start, count, number):
+        '''
+        Binary search rows start to start + count of a table for number.
+        Returns the row, or None.
+        '''
+        low = start
+        high = start + count
+        while low < high:
+            middle = (low + high) // 2
+            row = self.reader.sub_index_row(table, middle)
+            if row[0] < number:
+                low = middle + 1
+            elif row[0] > number:
+                high = middle
+            else:
+                return row
+        return None
+
+    def _numbers(self, table, row):
+        '''Return the numbers of the rows a row points to in table.'''
+        return tuple(
+            r[0] for r in self.reader.sub_index_rows(
+                table, row[1], row[1] + row[2]))
+
+    def _titles(self, table, row):
+        '''Return the titles a row points to in a title table.'''
+        if row is None:
+            return ()
+        return self.reader.sub_index_shorts(table, row[1], row[2])
+
+    # Genre
+
+    def performers_for_genre(self, genre):
+        '''Return the performer numbers with titles in the genre.'''
+        return self._numbers(
+            constants.sub_1_genre_performer_albums,
+            self._top_row(constants.sub_0_genre_performers, genre, 'Genre'))
+
+    def albums_for_genre(self, genre):
+        '''Return the album numbers with titles in the genre.'''
+        return self._numbers(
+            constants.sub_5_genre_album_titles,
+            self._top_row(constants.sub_4_genre_albums, genre, 'Genre'))
+
+    def titles_for_genre(self, genre):
+        '''Return the titles in the genre, in album order.'''
+        return self.reader.genre(genre).titles
+
+    def titles_for_genre_album(self, genre, album):
+        '''Return the titles of the album that are in the genre.'''
+        row = self._top_row(constants.sub_4_genre_albums, genre, 'Genre')
+        return self._titles(
+            constants.sub_6_genre_titles,
+            self._find_row(
+                constants.sub_5_genre_album_titles, row[1], row[2], album))
+
+    def _genre_performer_row(self, genre, performer):
+        row = self._top_row(constants.sub_0_genre_performers, genre, 'Genre')
+        return self._find_row(
+            constants.sub_1_genre_performer_albums,
+            row[1], row[2], performer)
+
+    def albums_for_genre_performer(self, genre, performer):
+        '''Return the albums of the performer that are in the genre.'''
+        row = self._genre_performer_row(genre, performer)
+        if row is None:
+            return ()
+        return self._numbers(
+            constants.sub_2_genre_performer_album_titles, row)
+
+    def titles_for_genre_performer(self, genre, performer):
+        '''Return the titles of the performer that are in the genre.'''
+        row = self._top_row(constants.sub_10_genre_performers, genre, 'Genre')
+        return self._titles(
+            constants.sub_12_genre_ordered_titles,
+            self._find_row(
+                constants.sub_11_genre_performer_titles,
+                row[1], row[2], performer))
+
+    def titles_for_genre_performer_album(self, genre, performer, album):
+        '''Return the titles of the performer's album in the genre.'''
+        row = self._genre_performer_row(genre, performer)
+        if row is None:
+            return ()
+        return self._titles(
+            constants.sub_3_genre_ordered_titles,
+            self._find_row(
+                constants.sub_2_genre_performer_album_titles,
+                row[1], row[2], album))
+
+    # Performer
+
+    def albums_for_performer(self, performer):
+        '''Return the album numbers with titles by the performer.'''
+        return self._numbers(
+            constants.sub_8_performer_album_titles,
+            self._top_row(
+                constants.sub_7_performer_albums, performer, 'Performer'))
+
+    def titles_for_performer(self, performer):
+        '''Return the titles by the performer, in album order.'''
+        return self.reader.performer(performer).titles
+
+    def titles_for_performer_album(self, performer, album):
+        '''Return the titles of the album by the performer.'''
+        row = self._top_row(
+            constants.sub_7_performer_albums, performer, 'Performer')
+        return self._titles(
+            constants.sub_9_performer_titles,
+            self._find_row(
+                constants.sub_8_performer_album_titles,
+                row[1], row[2], album))
+
+    # Album and playlist
+
+    def titles_for_album(self, album):
+        '''Return the titles of the album, in disc and track order.'''
+        return self.reader.album(album).titles
+
+    def titles_for_playlist(self, playlist):
+        '''Return the titles of the playlist, in playlist order.'''
+        return self.reader.playlist(playlist).titles
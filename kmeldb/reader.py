@@ -0,0 +1,322 @@
+'''
+A lazy, memory-mapped reader for Kenwood database files.
+
+Opening a database only reads the header and the offsets table; entries are
+unpacked, and their strings decoded, when they are asked for. This makes it
+cheap to open a large database to answer a handful of questions, e.g.:
+
+    with DatabaseReader('/media/usb/kenwood.dap/kenwood.dap') as db:
+        print(db.title_count, db.title(42).title, db.album(3).name)
+
+This module defines the following classes:
+    TitleEntry
+    IndexEntry
+    DatabaseReader
+'''
+
+import mmap
+import struct
+import logging
+
+from . import constants
+from .MainIndexEntry import MainIndexEntry
+from .BaseIndexEntry import BaseIndexEntry
+
+log = logging.getLogger(__name__)
+
+SIGNATURE = b'KWDB'
+
+# The counts and entry sizes follow the signature block
+COUNTS_OFFSET = 0x08
+
+OFFSETS_FORMAT = '<{}I'.format(constants.end_offsets)
+
+# The signature, counts and offsets
+HEADER_SIZE = constants.OFFSETS_OFFSET + struct.calcsize(OFFSETS_FORMAT)
+
+# The sub-index starts with a relative offset, followed by one
+# (offset, size, count) entry per sub-index table
+SUB_INDEX_FORMAT = '<{}'.format('IHH' * constants.end_subindex_offsets)
+SUB_INDEX_ROW_FORMAT = '<HHHH'
+
+
+class TitleEntry(object):
+    '''One entry of the main index. Strings are decoded on first access.'''
+
+    def __init__(self, reader, number, values):
+        self._reader = reader
+        self._values = values
+        self.number = number
+        self.genre = values[0]
+        self.performer = values[1]
+        self.album = values[2]
+
+    def _string(self, index, table, encoding):
+        # Lengths include the terminating null character
+        length, char_length, offset = self._values[index:index + 3]
+        return self._reader.string(
+            table, offset, length - char_length, encoding)
+
+    @property
+    def title(self):
+        return self._string(
+            7, constants.title_offset, constants.STRING_ENCODING)
+
+    @property
+    def shortdir(self):
+        return self._string(10, constants.shortdir_offset, 'ascii')
+
+    @property
+    def shortfile(self):
+        return self._string(13, constants.shortfile_offset, 'ascii')
+
+    @property
+    def longdir(self):
+        return self._string(
+            16, constants.longdir_offset, constants.STRING_ENCODING)
+
+    @property
+    def longfile(self):
+        return self._string(
+            19, constants.longfile_offset, constants.STRING_ENCODING)
+
+    def __str__(self):
+        return "Title {}- '{}'; genre {}; performer {}; album {}".format(
+            self.number, self.title, self.genre, self.performer, self.album)
+
+
+class IndexEntry(object):
+    '''
+    One entry of the genre, performer, album or playlist index.
+
+    The name and title numbers are read on first access; number_of_titles
+    is available without reading either.
+    '''
+
+    def __init__(self, reader, number, values, name_table, title_table):
+        self._reader = reader
+        self._name_table = name_table
+        self._title_table = title_table
+        self.number = number
+        self._name_length = values[0]
+        self._name_char_length = values[1]
+        self._name_offset = values[2]
+        self.number_of_titles = values[4]
+        self._titles_offset = values[5]
+
+    @property
+    def name(self):
+        return self._reader.string(
+            self._name_table,
+            self._name_offset,
+            self._name_length - self._name_char_length,
+            constants.STRING_ENCODING)
+
+    @property
+    def titles(self):
+        '''tuple: the numbers of the titles in this entry.'''
+        return self._reader.shorts(
+            self._title_table, self._titles_offset, self.number_of_titles)
+
+    def __len__(self):
+        return self.number_of_titles
+
+    def __str__(self):
+        return "{} {}- '{}'; titles {}".format(
+            self.__class__.__name__, self.number, self.name,
+            self.number_of_titles)
+
+
+class DatabaseReader(object):
+    '''Random access to a kenwood.dap file through a memory map.'''
+
+    def __init__(self, filename):
+        '''
+        Args:
+            filename (str): The path to the kenwood.dap file.
+
+        Raises:
+            ValueError: if the file is not a Kenwood database.
+        '''
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        try:
+            header = self._file.read(4)
+            if header != SIGNATURE:
+                raise ValueError(
+                    '{} is not a Kenwood database'.format(filename))
+            self._map = mmap.mmap(
+                self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            size = len(self._map)
+            if size < HEADER_SIZE:
+                self._map.close()
+                raise ValueError(
+                    '{} is truncated: {} bytes, not {} for the header'.format(
+                        filename, size, HEADER_SIZE))
+        except Exception:
+            self._file.close()
+            raise
+
+        (self.title_count,
+         self.title_entry_size,
+         self.genre_count,
+         self.genre_entry_size,
+         self.performer_count,
+         self.performer_entry_size,
+         self.album_count,
+         self.album_entry_size,
+         self.playlist_count,
+         self.playlist_entry_size) = struct.unpack_from(
+            '<10H', self._map, COUNTS_OFFSET)
+
+        self.offsets = struct.unpack_from(
+            OFFSETS_FORMAT, self._map, constants.OFFSETS_OFFSET)
+        size = len(self._map)
+        for table, offset in enumerate(self.offsets):
+            if offset > size:
+                self.close()
+                raise ValueError(
+                    '{}: offset {} of table {} is beyond the end of the file '
+                    '({} bytes)'.format(filename, offset, table, size))
+
+        # Read on first use
+        self._sub_index = None
+
+    def close(self):
+        '''Release the memory map and close the file.'''
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.title_count
+
+    @property
+    def buffer(self):
+        '''The memory map of the whole file (read only).'''
+        return self._map
+
+    def string(self, table, offset, length, encoding):
+        '''Decode length bytes at offset within the given table.'''
+        start = self.offsets[table] + offset
+        return self._map[start:start + length].decode(encoding)
+
+    def shorts(self, table, offset, count):
+        '''Return a tuple of count short ints at offset within a table.'''
+        return struct.unpack_from(
+            '<{}H'.format(count), self._map, self.offsets[table] + offset)
+
+    def sub_index(self, table):
+        '''Return the (offset, size, count) of a sub-index table.'''
+        if self._sub_index is None:
+            values = struct.unpack_from(
+                SUB_INDEX_FORMAT,
+                self._map,
+                self.offsets[constants.sub_index_offset] +
+                struct.calcsize('<I'))
+            self._sub_index = [
+                values[index:index + 3]
+                for index in range(0, len(values), 3)]
+        return self._sub_index[table]
+
+    def sub_index_row(self, table, row):
+        '''
+        Return row of a sub-index table of four short ints: the number of
+        the item, an offset into the next table, a count and zero.
+        '''
+        offset, size, count = self.sub_index(table)
+        if not 0 <= row < count:
+            raise IndexError('Sub-index {} row {} out of range'.format(
+                table, row))
+        return struct.unpack_from(
+            SUB_INDEX_ROW_FORMAT, self._map, offset + row * size)
+
+    def sub_index_rows(self, table, start, stop):
+        '''Return a list of rows start to stop of a sub-index table.'''
+        offset, size, count = self.sub_index(table)
+        stop = min(stop, count)
+        if start >= stop:
+            return []
+        return list(struct.iter_unpack(
+            SUB_INDEX_ROW_FORMAT,
+            self._map[offset + start * size:offset + stop * size]))
+
+    def sub_index_shorts(self, table, start, count):
+        '''Return count short ints from start of a sub-index title table.'''
+        offset = self.sub_index(table)[0]
+        return struct.unpack_from(
+            '<{}H'.format(count), self._map, offset + start * 2)
+
+    def _check(self, number, count, kind):
+        if not 0 <= number < count:
+            raise IndexError('{} {} out of range'.format(kind, number))
+
+    def title(self, number):
+        '''Return the TitleEntry for the given title number.'''
+        self._check(number, self.title_count, 'Title')
+        return TitleEntry(self, number, struct.unpack_from(
+            MainIndexEntry.FORMAT,
+            self._map,
+            self.offsets[constants.main_index_offset] +
+            number * self.title_entry_size))
+
+    def _index_entry(self, number, count, entry_size, index_table,
+                     name_table, title_table, kind):
+        self._check(number, count, kind)
+        return IndexEntry(
+            self,
+            number,
+            struct.unpack_from(
+                BaseIndexEntry.FORMAT,
+                self._map,
+                self.offsets[index_table] + number * entry_size),
+            name_table,
+            title_table)
+
+    def genre(self, number):
+        '''Return the IndexEntry for the given genre number.'''
+        return self._index_entry(
+            number, self.genre_count, self.genre_entry_size,
+            constants.genre_index_offset,
+            constants.genre_name_offset,
+            constants.genre_title_offset,
+            'Genre')
+
+    def performer(self, number):
+        '''Return the IndexEntry for the given performer number.'''
+        return self._index_entry(
+            number, self.performer_count, self.performer_entry_size,
+            constants.performer_index_offset,
+            constants.performer_name_offset,
+            constants.performer_title_offset,
+            'Performer')
+
+    def album(self, number):
+        '''Return the IndexEntry for the given album number.'''
+        return self._index_entry(
+            number, self.album_count, self.album_entry_size,
+            constants.album_index_offset,
+            constants.album_name_offset,
+            constants.album_title_offset,
+            'Album')
+
+    def playlist(self, number):
+        '''Return the IndexEntry for the given playlist number.'''
+        return self._index_entry(
+            number, self.playlist_count, self.playlist_entry_size,
+            constants.playlist_index_offset,
+            constants.playlist_name_offset,
+            constants.playlist_title_offset,
+            'Playlist')
+
+    def titles(self):
+        '''Iterate over all the TitleEntry objects in index order.'''
+        for number in range(self.title_count):
+            yield self.title(number)
@@ -0,0 +1,274 @@
+'''
+I/O accounting for the media file scanner.
+
+A ScanStats instance can be handed to a DirWalker, which will then count the
+ioctl and stat calls it makes, and read the tags of each media file through a
+CountingFile so that the number of bytes read and the time taken can be
+recorded per file. Where Linux reports it, the number of bytes the read
+caused to be fetched from the device (including read-ahead) is recorded too.
+
+This module defines the following classes:
+    CountingFile
+    FileStats
+    ScanStats
+'''
+
+import os
+import json
+import math
+import time
+
+from .tags import read_tags
+
+# Per thread I/O counters (Linux)
+THREAD_IO = '/proc/thread-self/io'
+
+# Upper bounds (in seconds) of the latency histogram buckets. The last bucket
+# holds everything slower.
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5,
+    1.0)
+
+
+class CountingFile(object):
+    '''Wraps a binary file object, counting reads, seeks and bytes read.'''
+
+    def __init__(self, fp):
+        self._fp = fp
+        self.bytes_read = 0
+        self.reads = 0
+        self.seeks = 0
+
+    def read(self, size=-1):
+        data = self._fp.read(size)
+        self.reads += 1
+        self.bytes_read += len(data)
+        return data
+
+    def readinto(self, buffer):
+        count = self._fp.readinto(buffer)
+        self.reads += 1
+        self.bytes_read += count
+        return count
+
+    def seek(self, offset, whence=0):
+        self.seeks += 1
+        return self._fp.seek(offset, whence)
+
+    def tell(self):
+        return self._fp.tell()
+
+    def close(self):
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class FileStats(object):
+    '''The I/O performed while reading the tags of one media file.'''
+
+    def __init__(
+            self, fullname, size, bytes_read, reads, seeks, latency,
+            device_bytes=None):
+        self.fullname = fullname
+        self.size = size
+        self.bytes_read = bytes_read
+        self.reads = reads
+        self.seeks = seeks
+        self.latency = latency
+        self.device_bytes = device_bytes
+
+    def as_dict(self):
+        return {
+            'file': self.fullname,
+            'size': self.size,
+            'bytes_read': self.bytes_read,
+            'reads': self.reads,
+            'seeks': self.seeks,
+            'latency': self.latency,
+            'device_bytes': self.device_bytes}
+
+    def __str__(self):
+        return '{:10.6f}s {:10d} of {:10d} bytes {:5d} reads {}'.format(
+            self.latency,
+            self.bytes_read,
+            self.size,
+            self.reads,
+            self.fullname)
+
+
+def device_bytes_read():
+    '''
+    Return the number of bytes this thread has caused to be fetched from
+    storage, or None if it is not known.
+    '''
+    try:
+        with open(THREAD_IO, 'rb') as f:
+            for line in f:
+                if line.startswith(b'read_bytes:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def percentile(ordered, fraction):
+    '''Return the nearest-rank percentile of an ordered list.'''
+    if not ordered:
+        return 0.0
+    rank = int(math.ceil(fraction * len(ordered))) - 1
+    return ordered[min(max(rank, 0), len(ordered) - 1)]
+
+
+class ScanStats(object):
+    '''Collects the I/O accounting for a scan.'''
+
+    def __init__(self):
+        # Counted by the DirWalker
+        self.ioctl_calls = 0
+        self.stat_calls = 0
+
+        # One FileStats per media file
+        self.files = []
+
+        # The name of the kmeldb.iopolicy policy the tags were read under
+        self.io_policy = 'default'
+
+    def read_tags(self, fullname, io_policy=None):
+        '''
+        Read the tags for a media file, recording the I/O involved. The
+        file is opened by io_policy (an IOPolicy), if given.
+        '''
+        start = time.perf_counter()
+        before = device_bytes_read()
+        if io_policy is None:
+            raw = open(fullname, 'rb')
+        else:
+            raw = io_policy.open(fullname)
+            self.io_policy = io_policy.name
+        size = os.fstat(raw.fileno()).st_size
+        with CountingFile(raw) as fp:
+            metadata = read_tags(
+                fullname, fp,
+                None if io_policy is None else io_policy.header_reader)
+        after = device_bytes_read()
+        self.files.append(FileStats(
+            fullname,
+            size,
+            fp.bytes_read,
+            fp.reads,
+            fp.seeks,
+            time.perf_counter() - start,
+            None if before is None or after is None else after - before))
+        return metadata
+
+    @property
+    def bytes_read(self):
+        '''int: the total number of bytes read by the tag readers.'''
+        return sum(f.bytes_read for f in self.files)
+
+    @property
+    def device_bytes(self):
+        '''
+        int: the total number of bytes fetched from the device, or None if
+        it is not known.
+        '''
+        known = [f.device_bytes for f in self.files
+                 if f.device_bytes is not None]
+        if self.files and not known:
+            return None
+        return sum(known)
+
+    def latencies(self):
+        '''Return the per-file latencies in ascending order.'''
+        return sorted(f.latency for f in self.files)
+
+    def percentiles(self):
+        '''Return a dictionary of the p50, p95 and p99 latencies.'''
+        ordered = self.latencies()
+        return {
+            'p50': percentile(ordered, 0.50),
+            'p95': percentile(ordered, 0.95),
+            'p99': percentile(ordered, 0.99)}
+
+    def histogram(self):
+        '''Return a list of (upper bound, count) latency buckets.
+
+        The upper bound of the last bucket is None.
+        '''
+        counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        for f in self.files:
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if f.latency < bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[-1] += 1
+        return list(zip(LATENCY_BUCKETS + (None,), counts))
+
+    def slowest(self, count=20):
+        '''Return the count slowest files, slowest first.'''
+        return sorted(
+            self.files, key=lambda f: f.latency, reverse=True)[:count]
+
+    def as_dict(self):
+        '''Return the report as a dictionary suitable for JSON.'''
+        return {
+            'media_files': len(self.files),
+            'ioctl_calls': self.ioctl_calls,
+            'stat_calls': self.stat_calls,
+            'bytes_read': self.bytes_read,
+            'io_policy': self.io_policy,
+            'device_bytes': self.device_bytes,
+            'latency': self.percentiles(),
+            'histogram': [
+                {'below': bound, 'count': count}
+                for bound, count in self.histogram()],
+            'slowest': [f.as_dict() for f in self.slowest()],
+            'files': [f.as_dict() for f in self.files]}
+
+    def to_json(self, **kwargs):
+        '''Return the report as a JSON string.'''
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def __str__(self):
+        number_of_files = len(self.files)
+        lines = [
+            'Media files: {}'.format(number_of_files),
+            'ioctl calls: {}, stat calls: {}'.format(
+                self.ioctl_calls, self.stat_calls),
+            'Bytes read: {} ({:.0f} per file)'.format(
+                self.bytes_read,
+                self.bytes_read / number_of_files if number_of_files else 0)]
+        if self.device_bytes is not None:
+            lines.append(
+                'Bytes from the device ({} I/O): {} ({:.0f} per file)'.format(
+                    self.io_policy,
+                    self.device_bytes,
+                    self.device_bytes / number_of_files
+                    if number_of_files else 0))
+
+        latency = self.percentiles()
+        lines.append('Latency p50 {:.6f}s, p95 {:.6f}s, p99 {:.6f}s'.format(
+            latency['p50'], latency['p95'], latency['p99']))
+
+        lines.append('Latency histogram:')
+        for bound, count in self.histogram():
+            if bound is None:
+                label = '>= {:.4f}s'.format(LATENCY_BUCKETS[-1])
+            else:
+                label = '<  {:.4f}s'.format(bound)
+            lines.append('  {:12s} {}'.format(label, count))
+
+        lines.append('Slowest files:')
+        for f in self.slowest():
+            lines.append('  {}'.format(f))
+
+        return '\n'.join(lines)
@@ -0,0 +1,92 @@
+'''
+Ordering of tag reads by where the files are on the device.
+
+Reading tags in directory order makes the device seek back and forth
+across the volume, which is slow on USB flash and very slow on spinning
+drives. Under the physical schedule the media files of a location are
+collected first, and their tags read in order of the physical offset of
+their first block: from FIEMAP where the file system supports it (vfat,
+ext4 and most others), from FIBMAP where that is allowed (it needs
+CAP_SYS_RAWIO), and otherwise by inode number, which most file systems
+allocate roughly in disk order. The results are put back in directory
+order, so the database is the same under either schedule.
+
+This module defines no classes.
+'''
+
+import os
+import struct
+
+SCHEDULES = ('directory', 'physical')
+
+# From linux/fs.h and linux/fiemap.h
+FS_IOC_FIEMAP = 0xC020660B
+FIBMAP = 1
+
+# struct fiemap, followed by one struct fiemap_extent
+FIEMAP_FORMAT = '=QQIIII'
+FIEMAP_EXTENT_FORMAT = '=QQQQQIIII'
+FIEMAP_SIZE = struct.calcsize(FIEMAP_FORMAT)
+FIEMAP_EXTENT_SIZE = struct.calcsize(FIEMAP_EXTENT_FORMAT)
+
+
+def _fiemap(fd):
+    '''Return the physical offset of the first extent, or None.'''
+    import fcntl
+    request = bytearray(FIEMAP_SIZE + FIEMAP_EXTENT_SIZE)
+    # All of the file, one extent
+    struct.pack_into(
+        FIEMAP_FORMAT, request, 0, 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0)
+    fcntl.ioctl(fd, FS_IOC_FIEMAP, request)
+    mapped_extents = struct.unpack_from(FIEMAP_FORMAT, request)[3]
+    if mapped_extents == 0:
+        return None
+    return struct.unpack_from(
+        FIEMAP_EXTENT_FORMAT, request, FIEMAP_SIZE)[1]
+
+
+def _fibmap(fd, block_size):
+    '''Return the physical offset of the first block, or None.'''
+    import fcntl
+    block = struct.unpack(
+        'i', fcntl.ioctl(fd, FIBMAP, struct.pack('i', 0)))[0]
+    if block == 0:
+        return None
+    return block * block_size
+
+
+def physical_location(fullname):
+    '''
+    Return a sort key for where a file is on its device: (0, offset) if its
+    physical offset is known, and (1, inode number) otherwise.
+    '''
+    fd = os.open(fullname, os.O_RDONLY)
+    try:
+        st = os.fstat(fd)
+        for method in (_fiemap, lambda fd: _fibmap(fd, st.st_blksize)):
+            try:
+                offset = method(fd)
+            except (OSError, ImportError):
+                continue
+            if offset is not None:
+                return (0, offset)
+        return (1, st.st_ino)
+    finally:
+        os.close(fd)
+
+
+def physical_order(items, fullname=lambda item: item):
+    '''
+    Return items sorted by the physical location of the file named by
+    fullname(item). Files that cannot be opened go last, in the order
+    given.
+    '''
+    keyed = []
+    for position, item in enumerate(items):
+        try:
+            key = physical_location(fullname(item))
+        except OSError:
+            key = (2, 0)
+        keyed.append((key, position, item))
+    keyed.sort(key=lambda k: k[:2])
+    return [item for _, _, item in keyed]
@@ -0,0 +1,229 @@
+'''
+Seeding a scan from the database already on a location.
+
+A database written by DapGen holds the title, performer, album and genre of
+every media file, keyed by its long directory and file name. When a
+location is scanned again, a DatabaseSeed loaded from the previous database
+can supply those tags for unchanged files, so that only new or changed
+files have their tags read.
+
+The database does not record file sizes or modification times, so they
+are written next to it, to seed.json in its directory (see
+write_file_stats), when it is built. A file is taken to be unchanged if its
+size and modification time are those recorded, and it was last modified
+before the database was written (allowing for the two second resolution of
+FAT time stamps). So a file replaced by a re-tagged copy that kept its
+own, older, time stamps (e.g. by rsync -a or cp -p) is read again. The
+database must pass kmeldb.fsck, and have its record, to be used.
+
+Track and disc numbers are not stored either. A seeded file is given its
+position within its album in the previous database as its track number,
+which keeps the album order of the previous build. If a new or changed file
+joins an album, the track and disc numbers of the seeded files in that
+album are read from the files themselves (see DatabaseSeed.reconcile).
+
+The seed must be loaded before the database is rewritten; it keeps no
+reference to the file.
+
+This module defines the following classes:
+    SeededTags
+    DatabaseSeed
+'''
+
+import os
+import json
+import logging
+
+from .fsck import fsck
+from .reader import DatabaseReader
+
+log = logging.getLogger(__name__)
+
+# FAT modification times are stored to the nearest two seconds
+FAT_MTIME_RESOLUTION = 2.0
+
+# The record of the size and modification time of each media file, in the
+# directory of the database
+FILE_STATS_FILE = 'seed.json'
+FILE_STATS_VERSION = 1
+
+
+class SeededTags(object):
+    '''The tags of a media file, as recorded in a previous database.
+
+    Has the attributes of the hsaudiotag auto.File that the directory
+    walkers use.
+    '''
+
+    def __init__(self, title, artist, album, genre, track, disc=0):
+        self.title = title
+        self.artist = artist
+        self.album = album
+        self.genre = genre
+        self.track = track
+        self.disc = disc
+
+
+class DatabaseSeed(object):
+    '''The tags of the media files in a previous database.'''
+
+    def __init__(self, tags, mtime, files):
+        '''
+        Args:
+            tags (dict): SeededTags keyed by (long directory, long file).
+            mtime (float): The modification time of the database.
+            files (dict): The (size, modification time) of each media file
+                when the database was written, keyed as tags.
+        '''
+        self._tags = tags
+        self._mtime = mtime
+        self._files = files
+
+        # The full names of the media files given seeded tags
+        self.reused = set()
+        self.reread = 0
+
+    def __len__(self):
+        return len(self._tags)
+
+    def tags(self, fullname, longdir, longfile):
+        '''
+        Return the SeededTags for a media file, or None if the file is not
+        in the previous database or may have changed since it was written.
+        '''
+        tags = self._tags.get((longdir, longfile))
+        recorded = self._files.get((longdir, longfile))
+        if tags is None or recorded is None:
+            return None
+        try:
+            st = os.stat(fullname)
+        except OSError:
+            return None
+        if (st.st_size, st.st_mtime) != recorded:
+            return None
+        if st.st_mtime + FAT_MTIME_RESOLUTION > self._mtime:
+            return None
+        self.reused.add(fullname)
+        return tags
+
+    def reconcile(self, media_files, read_tags):
+        '''
+        Read the track and disc numbers of the seeded media files in any
+        album that also has new or changed files.
+
+        Args:
+            media_files (List[MediaFile]): The media files found by the scan.
+            read_tags (callable): Returns an auto.File like object for a
+                full file name.
+        '''
+        mixed = set(
+            mf.album for mf in media_files if mf.fullname not in self.reused)
+        for mf in media_files:
+            if mf.album in mixed and mf.fullname in self.reused:
+                metadata = read_tags(mf.fullname)
+                mf.tracknumber = metadata.track
+                mf.discnumber = getattr(metadata, 'disc', 0)
+                self.reused.discard(mf.fullname)
+                self.reread += 1
+
+
+def _file_stats_filename(db_filename):
+    return os.path.join(os.path.dirname(db_filename), FILE_STATS_FILE)
+
+
+def write_file_stats(db_filename, media_files, source=None):
+    '''
+    Record the size and modification time of each media file next to the
+    database in db_filename, for load_seed.
+
+    Args:
+        db_filename (str): The database, written for the media files.
+        media_files (iterable of MediaFile): The media files.
+        source (str): If given, the media files were found under source and
+            have been copied to the location of the database, where their
+            copies are recorded.
+    '''
+    location = os.path.dirname(os.path.dirname(db_filename))
+    files = []
+    for mf in media_files:
+        fullname = mf.fullname
+        if source is not None:
+            fullname = os.path.join(
+                location, os.path.relpath(fullname, source))
+        try:
+            st = os.stat(fullname)
+        except OSError:
+            continue
+        files.append([
+            mf.longdir.rstrip('\x00'), mf.longfile.rstrip('\x00'),
+            st.st_size, st.st_mtime])
+    with open(_file_stats_filename(db_filename), 'w', encoding='utf-8') as f:
+        json.dump(
+            {'version': FILE_STATS_VERSION, 'files': files},
+            f, ensure_ascii=False)
+
+
+def read_file_stats(db_filename):
+    '''
+    Return the (size, modification time) of each media file recorded by
+    write_file_stats, keyed by (long directory, long file).
+
+    Raises:
+        OSError: If there is no record.
+        ValueError, KeyError: If the record cannot be read.
+    '''
+    with open(_file_stats_filename(db_filename), encoding='utf-8') as f:
+        document = json.load(f)
+    if document.get('version') != FILE_STATS_VERSION:
+        raise ValueError('Unsupported file record version: {}'.format(
+            document.get('version')))
+    return {
+        (longdir, longfile): (size, mtime)
+        for longdir, longfile, size, mtime in document['files']}
+
+
+def load_seed(db_filename):
+    '''
+    Return a DatabaseSeed for an existing database, or None if there is no
+    usable database.
+    '''
+    try:
+        mtime = os.stat(db_filename).st_mtime
+    except OSError:
+        return None
+
+    result = fsck(db_filename)
+    if not result.ok:
+        log.warning('Not seeding from {}:\n{}'.format(db_filename, result))
+        return None
+
+    try:
+        files = read_file_stats(db_filename)
+    except (OSError, ValueError, KeyError) as e:
+        log.warning('Not seeding from {}, no record of its files: {}'.format(
+            db_filename, e))
+        return None
+
+    tags = {}
+    with DatabaseReader(db_filename) as reader:
+        genres = [reader.genre(n).name for n in range(reader.genre_count)]
+        performers = [
+            reader.performer(n).name for n in range(reader.performer_count)]
+        albums = [reader.album(n).name for n in range(reader.album_count)]
+
+        # Titles are listed in disc and track order within their album
+        tracks = {}
+        for number in range(reader.album_count):
+            for position, title in enumerate(reader.album(number).titles):
+                tracks[title] = position + 1
+
+        for entry in reader.titles():
+            tags[(entry.longdir, entry.longfile)] = SeededTags(
+                title=entry.title,
+                artist=performers[entry.performer],
+                album=albums[entry.album],
+                genre=genres[entry.genre],
+                track=tracks.get(entry.number, 0))
+
+    log.info('Seeded {} media files from {}'.format(len(tags), db_filename))
+    return DatabaseSeed(tags, mtime, files)
@@ -0,0 +1,200 @@
+'''
+Prediction of the short (8.3) names the Linux vfat driver creates.
+
+When a file or directory is created on a vfat file system, the driver
+derives a short name from the long name (see vfat_create_shortname in
+fs/fat/namei_vfat.c): a basis name of up to eight characters and an
+extension of up to three, upper cased, with spaces and dots left out and
+the characters "[];,+=" (and any the codepage cannot represent) replaced
+by "_". A long name that is already a valid 8.3 name is used as it is.
+Otherwise a numeric tail ~1 to ~9 is added, trying each in turn until the
+name is not used by an existing entry of the directory. So, given the order
+in which the entries of a directory are created, their short names can be
+predicted.
+
+The prediction assumes the default mount options (shortname=mixed,
+codepage=437, numtail). Some names cannot be predicted: past ~9 the driver
+uses a tail derived from the time, and the upper casing of non-ASCII
+characters depends on the codepage tables. These are returned as None.
+
+This module defines the following classes:
+    ShortNameDirectory
+'''
+
+CODEPAGE = 'cp437'
+
+# Left out of short names
+SKIP_CHARS = ' .'
+
+# Replaced by '_' in short names
+REPLACE_CHARS = '[];,+='
+
+# Not allowed in long names
+BAD_CHARS = '*?<>|":/\\'
+
+# The highest numeric tail that is tried in turn
+MAX_NUMTAIL = 9
+
+
+class _Info(object):
+    '''What has been seen of the characters of a basis name or extension.'''
+
+    def __init__(self):
+        self.valid = True
+        self.lower = True
+        self.upper = True
+        self.exact = True
+
+
+def _shortname_char(ch, info):
+    '''
+    Return the short name character for ch ('' if it is left out), and
+    update info, as to_shortname_char does.
+    '''
+    if ch in SKIP_CHARS:
+        info.valid = False
+        return ''
+    if ch in REPLACE_CHARS:
+        info.valid = False
+        return '_'
+    try:
+        byte = ch.encode(CODEPAGE)[0]
+    except UnicodeEncodeError:
+        info.valid = False
+        # Outside the BMP, each half of the surrogate pair gives a '_'
+        if ord(ch) > 0xffff:
+            info.exact = False
+        return '_'
+    if byte >= 0x7f:
+        info.lower = False
+        info.upper = False
+        # Upper cased by the codepage's own table
+        info.exact = False
+        return ch
+    upper = ch.upper()
+    if upper.isalpha():
+        if upper == ch:
+            info.lower = False
+        else:
+            info.upper = False
+    return upper
+
+
+def basis_name(longname):
+    '''
+    Return the basis name and extension of the short name for longname,
+    and whether longname is itself a valid short name.
+
+    Returns:
+        (base, ext, is_shortname, exact), where exact is False if the
+        names may not be what the driver makes of longname.
+
+    Raises:
+        ValueError: If longname is not a valid vfat name.
+    '''
+    # Trailing dots are not stored
+    name = longname.rstrip('.')
+    if not name or len(name) > 255 or any(c in BAD_CHARS for c in name):
+        raise ValueError('Invalid vfat name: {!r}'.format(longname))
+
+    # The extension follows the last dot, unless only dots and spaces
+    # come before it
+    dot = name.rfind('.')
+    if dot == -1 or not name[:dot].strip(SKIP_CHARS):
+        stem, extension = name, ''
+    else:
+        stem, extension = name[:dot], name[dot + 1:]
+
+    is_shortname = True
+    base_info = _Info()
+    base = ''
+    for position, ch in enumerate(stem):
+        base += _shortname_char(ch, base_info)
+        if len(base) >= 8:
+            if position + 1 < len(stem):
+                is_shortname = False
+            break
+    if not base:
+        raise ValueError('Invalid vfat name: {!r}'.format(longname))
+
+    ext_info = _Info()
+    ext = ''
+    for position, ch in enumerate(extension):
+        ext += _shortname_char(ch, ext_info)
+        if len(ext) >= 3:
+            if position + 1 < len(extension):
+                is_shortname = False
+            break
+
+    is_shortname = is_shortname and base_info.valid and ext_info.valid
+    return base, ext, is_shortname, base_info.exact and ext_info.exact
+
+
+def _form(base, ext):
+    '''Return the directory entry form of a short name, e.g. 'ABC     MP3'.'''
+    return base.ljust(8) + ext.ljust(3)
+
+
+def display_name(form):
+    '''Return the short name of a directory entry form, e.g. 'ABC.MP3'.'''
+    base = form[:8].rstrip()
+    ext = form[8:].rstrip()
+    if ext:
+        return '{}.{}'.format(base, ext)
+    return base
+
+
+def entry_form(shortname):
+    '''Return the directory entry form of a short name, e.g. 'ABC.MP3'.'''
+    base, _, ext = shortname.upper().partition('.')
+    return _form(base, ext)
+
+
+class ShortNameDirectory(object):
+    '''
+    The names of the entries of a directory, in the order they were
+    created, from which the short name of the next entry is predicted.
+    '''
+
+    def __init__(self):
+        self._forms = set()
+        self._names = set()
+
+    def reserve(self, longname, shortname):
+        '''Record an existing entry, with its (actual) short name.'''
+        self._names.add(longname.lower())
+        self._forms.add(entry_form(shortname))
+
+    def add(self, longname):
+        '''
+        Record a new entry, returning its short name, e.g. 'LONGFI~1.MP3',
+        or None if it cannot be predicted.
+
+        Raises:
+            ValueError: If longname is not a valid vfat name.
+            FileExistsError: If an entry of the same name (ignoring case),
+                or with longname as its short name, already exists.
+        '''
+        if longname.lower() in self._names:
+            raise FileExistsError(
+                'Name already used: {!r}'.format(longname))
+        base, ext, is_shortname, exact = basis_name(longname)
+        self._names.add(longname.lower())
+        if not exact:
+            return None
+
+        form = _form(base, ext)
+        if is_shortname:
+            if form in self._forms:
+                raise FileExistsError(
+                    'Short name already used: {!r}'.format(longname))
+            self._forms.add(form)
+            return display_name(form)
+
+        base = base[:6]
+        for tail in range(1, MAX_NUMTAIL + 1):
+            form = _form('{}~{}'.format(base, tail), ext)
+            if form not in self._forms:
+                self._forms.add(form)
+                return display_name(form)
+        return None
@@ -0,0 +1,565 @@
+'''
+Building databases for a staging tree, and copying both to a stick.
+
+The short names in a database are normally read from the mounted stick,
+one ioctl per directory entry, so the files must be copied before the slow
+device is scanned. Instead, a staging tree on any (fast, local) file system
+can be scanned with the short names predicted (see kmeldb.shortnames) for
+the order in which its entries will be created. The database is built
+before anything is copied; the tree is then copied to the stick in exactly
+that order, and the database and a manifest of the entries and their
+predicted short names are written to its kenwood.dap directory.
+
+Names that cannot be predicted are read from the stick once copied, and
+the database is rebuilt with them. The verification mode reads back every
+short name and compares it with the manifest.
+
+Alternatively, sync copies the tree first, reading the tags of each media
+file from the data as it is copied, and the short name of each entry from
+the stick as soon as it is created, so that nothing is read twice:
+
+    python3 -m kmeldb.staging stage /srv/staging /media/usb --verify
+    python3 -m kmeldb.staging sync /srv/library /media/usb
+    python3 -m kmeldb.staging verify /media/usb
+
+The stick must be empty, apart from the kenwood.dap directory, so that
+nothing already on it changes the names or the order of the entries.
+
+This module defines the following classes:
+    StagingWalker
+    SyncWalker
+    StageResult
+    Mismatch
+'''
+
+import io
+import os
+import sys
+import json
+import shutil
+import struct
+import logging
+import argparse
+import functools
+import contextlib
+from collections import namedtuple
+
+from .build import scan_location, write_database
+from .iopolicy import HEADER_SIZE, ID3V1_SIZE
+from .MediaFile import valid_media_files
+from .linux_dir_parser import DirWalker, VfatDirectory, read_directory
+from .seed import write_file_stats
+from .shortnames import ShortNameDirectory
+from .tags import read_tags
+
+log = logging.getLogger(__name__)
+
+DATABASE_DIRECTORY = 'kenwood.dap'
+DATABASE_FILE = 'kenwood.dap'
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_VERSION = 1
+
+# Files are copied by sync in chunks of this size
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# The GUID of the ASF Header Object, at the start of a WMA file
+ASF_HEADER_ID = (
+    b'\x30\x26\xb2\x75\x8e\x66\xcf\x11'
+    b'\xa6\xd9\x00\xaa\x00\x62\xce\x6c')
+
+StageResult = namedtuple('StageResult', [
+    'build', 'entries', 'bytes_copied', 'unpredicted', 'mismatches'])
+
+Mismatch = namedtuple('Mismatch', ['path', 'predicted', 'actual'])
+
+
+class StagingWalker(DirWalker):
+    '''
+    A DirWalker for a tree on any file system, using the short names
+    predicted for its entries. Each directory's entries are created in
+    name order, and each entry is appended to the manifest (a list of
+    dictionaries of its relative path, whether it is a directory and its
+    short name, or None if it cannot be predicted).
+    '''
+
+    def __init__(self, topdir, playlists, media_files, manifest=None,
+                 **kwargs):
+        super().__init__(topdir, playlists, media_files, **kwargs)
+        self.manifest = [] if manifest is None else manifest
+
+    @contextlib.contextmanager
+    def directory(self, relative_path):
+        '''
+        Yield a function that creates an entry of a directory, given its
+        name and whether it is a directory, and returns its short name.
+        Entries are only predicted here, not created.
+        '''
+        names = ShortNameDirectory()
+        yield lambda filename, is_dir: names.add(filename)
+
+    def walk(self):
+        for root, dirs, files in os.walk(self._topdir):
+            relative_path = os.path.relpath(root, self._topdir)
+            with self.directory(relative_path) as create:
+                if relative_path == '.':
+                    # The database directory is created first, and not
+                    # copied
+                    for names in (dirs, files):
+                        if DATABASE_DIRECTORY in names:
+                            names.remove(DATABASE_DIRECTORY)
+                    create(DATABASE_DIRECTORY, True)
+                    self._paths[relative_path] = {'shortname': '/'}
+
+                # Directories are walked in the order they are created
+                dirs.sort()
+                subdirs = set(dirs)
+
+                current_path_shortname = \
+                    self._paths[relative_path]['shortname']
+                for filename in sorted(dirs + files):
+                    shortname = create(filename, filename in subdirs)
+                    self.manifest.append({
+                        'path': os.path.normpath(
+                            os.path.join(relative_path, filename)),
+                        'dir': filename in subdirs,
+                        'short': shortname})
+                    self.add_entry(
+                        root, relative_path, current_path_shortname,
+                        filename, shortname or '')
+
+
+class _Excerpt(object):
+    '''
+    A read only binary file object holding the head and tail of a file,
+    with zeros in between, from which its tags can be read.
+    '''
+
+    def __init__(self, head, tail, size):
+        self._head = head
+        self._tail = tail
+        self._size = size
+        self._position = 0
+
+    def read(self, size=-1):
+        end = self._size
+        if size is not None and size >= 0:
+            end = min(end, self._position + size)
+        parts = []
+        tail_start = self._size - len(self._tail)
+        position = self._position
+        while position < end:
+            if position < len(self._head):
+                part = self._head[position:min(end, len(self._head))]
+            elif position >= tail_start:
+                part = self._tail[position - tail_start:end - tail_start]
+            else:
+                part = bytes(min(end, tail_start) - position)
+            parts.append(part)
+            position += len(part)
+        self._position = max(self._position, end)
+        return b''.join(parts)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError('Negative seek position {}'.format(offset))
+        self._position = offset
+        return offset
+
+    def tell(self):
+        return self._position
+
+
+def _id3v2_size(head):
+    '''Return the size of the ID3v2 tag at the start of head, or 0.'''
+    if len(head) < 10 or head[:3] != b'ID3':
+        return 0
+    return 10 + (
+        (head[6] & 0x7f) << 21 | (head[7] & 0x7f) << 14 |
+        (head[8] & 0x7f) << 7 | head[9] & 0x7f)
+
+
+def _asf_header_size(head):
+    '''Return the size of the WMA header at the start of head, or 0.'''
+    if len(head) < 24 or head[:16] != ASF_HEADER_ID:
+        return 0
+    return struct.unpack_from('<Q', head, 16)[0]
+
+
+def _copy_media(fsrc, fdst):
+    '''
+    Copy a media file in chunks, keeping only what its tags are read from:
+    the head (with any ID3v2 tag or WMA header, however large, and what
+    follows it) and the ID3v1 sized tail. Returns an _Excerpt of the file.
+    '''
+    head = bytearray()
+    tail = b''
+    wanted = None
+    size = 0
+    while True:
+        chunk = fsrc.read(COPY_CHUNK_SIZE)
+        if not chunk:
+            break
+        fdst.write(chunk)
+        if wanted is None:
+            wanted = (
+                _id3v2_size(chunk) + _asf_header_size(chunk) + HEADER_SIZE)
+        if len(head) < wanted:
+            head += chunk[:wanted - len(head)]
+        if len(chunk) >= ID3V1_SIZE:
+            tail = chunk[-ID3V1_SIZE:]
+        else:
+            tail = (tail + chunk)[-ID3V1_SIZE:]
+        size += len(chunk)
+    return _Excerpt(bytes(head), tail, size)
+
+
+class SyncWalker(StagingWalker):
+    '''
+    A StagingWalker that copies each entry to a vfat target as it goes,
+    reading its short name from the target as soon as it is created. The
+    tags of each media file are read from its head and tail, kept as it
+    is copied in chunks, so each file is read once, and the target not at
+    all.
+    '''
+
+    def __init__(self, topdir, playlists, media_files, target=None,
+                 directory_class=None, **kwargs):
+        super().__init__(topdir, playlists, media_files, **kwargs)
+        self._target = target
+        if directory_class is None:
+            directory_class = VfatDirectory
+        self._directory_class = directory_class
+        self._copied = None
+        self.bytes_copied = 0
+
+    def read_tags(self, fullname):
+        '''Read the tags of a media file from the data just copied.'''
+        copied_name, excerpt = self._copied or (None, None)
+        if copied_name != os.path.normpath(fullname):
+            return super().read_tags(fullname)
+        self._copied = None
+        return read_tags(
+            fullname, excerpt,
+            None if self._io_policy is None else self._io_policy.header_reader)
+
+    @contextlib.contextmanager
+    def directory(self, relative_path):
+        path = os.path.normpath(os.path.join(self._target, relative_path))
+        with self._directory_class(path) as directory:
+
+            def create(filename, is_dir):
+                src = os.path.join(self._topdir, relative_path, filename)
+                dst = os.path.join(path, filename)
+                if is_dir:
+                    if not os.path.isdir(dst):
+                        os.mkdir(dst)
+                else:
+                    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                        if filename.lower().endswith(valid_media_files):
+                            excerpt = _copy_media(fsrc, fdst)
+                            self._copied = (os.path.normpath(src), excerpt)
+                        else:
+                            shutil.copyfileobj(fsrc, fdst, COPY_CHUNK_SIZE)
+                        self.bytes_copied += fdst.tell()
+                    _copy_times(os.stat(src), dst)
+                return directory.short_name(filename)
+
+            yield create
+
+
+def apply_short_names(source, manifest, media_files):
+    '''
+    Set the short directory and file names of media files (found under
+    source) from the manifest.
+    '''
+    shortnames = {entry['path']: entry['short'] for entry in manifest}
+    for mf in media_files:
+        path = os.path.relpath(mf.fullname, source)
+        directory, filename = os.path.split(path)
+        shortdir = '/'
+        prefix = ''
+        for part in directory.split(os.sep) if directory else ():
+            prefix = os.path.join(prefix, part)
+            shortdir = os.path.join(shortdir, shortnames[prefix], '')
+        mf.shortdir = shortdir
+        mf.shortfile = shortnames[path]
+
+
+def read_manifest(target):
+    '''Return the manifest written to target by stage.'''
+    filename = os.path.join(target, DATABASE_DIRECTORY, MANIFEST_FILE)
+    with open(filename, encoding='utf-8') as f:
+        document = json.load(f)
+    if document.get('version') != MANIFEST_VERSION:
+        raise ValueError('Unsupported manifest version: {}'.format(
+            document.get('version')))
+    return document['entries']
+
+
+def write_manifest(target, manifest):
+    filename = os.path.join(target, DATABASE_DIRECTORY, MANIFEST_FILE)
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(
+            {'version': MANIFEST_VERSION, 'entries': manifest},
+            f, ensure_ascii=False, indent=1)
+
+
+def verify(target, manifest=None):
+    '''
+    Compare the short names in the manifest with those on target, read
+    with the vfat ioctl. Returns a list of Mismatch, with an actual name of
+    None for entries missing from target.
+    '''
+    if manifest is None:
+        manifest = read_manifest(target)
+
+    directories = {}
+    for entry in manifest:
+        directory, filename = os.path.split(entry['path'])
+        directories.setdefault(directory, []).append((filename, entry))
+
+    mismatches = []
+    for directory, entries in directories.items():
+        try:
+            actual = dict(read_directory(os.path.join(target, directory)))
+        except FileNotFoundError:
+            actual = {}
+        for filename, entry in entries:
+            shortname = actual.get(filename)
+            if shortname != entry['short']:
+                mismatches.append(
+                    Mismatch(entry['path'], entry['short'], shortname))
+    return mismatches
+
+
+def _copy(source, target, manifest):
+    '''
+    Create the entries of the manifest under target, in order. Returns the
+    number of bytes copied.
+    '''
+    bytes_copied = 0
+    for entry in manifest:
+        src = os.path.join(source, entry['path'])
+        dst = os.path.join(target, entry['path'])
+        if entry['dir']:
+            os.mkdir(dst)
+            continue
+        shutil.copyfile(src, dst)
+        st = os.stat(src)
+        bytes_copied += st.st_size
+        _copy_times(st, dst)
+    return bytes_copied
+
+
+def _copy_times(st, dst):
+    '''Set the access and modification times of dst to those of st.'''
+    try:
+        os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+    except OSError:
+        # Not allowed for files owned by another user, e.g. on vfat
+        pass
+
+
+def stage(source, target, verify_names=False, stats=None, progress=None,
+          collation=None, split_albums=False):
+    '''
+    Build a database for source with predicted short names, then copy
+    source and the database to target.
+
+    Args:
+        source (str): The staging tree.
+        target (str): The mount point of the (empty) vfat stick.
+        verify_names (bool): If set, every short name is read back from
+            target, and the database rebuilt if any was mispredicted.
+        stats (DatabaseStats): If given, the database build is recorded.
+        progress (ProgressReporter): If given, scanning progress is
+            reported.
+        collation, split_albums: As for kmeldb.build.write_database.
+
+    Returns:
+        A StageResult.
+
+    Raises:
+        ValueError: If target is not empty, or a name cannot be created on
+            vfat.
+        FileExistsError: If two names in a directory of source clash on
+            vfat (e.g. differ only in case).
+    '''
+    source = os.path.abspath(source)
+    if any(name != DATABASE_DIRECTORY for name in os.listdir(target)):
+        raise ValueError('{} is not empty'.format(target))
+
+    manifest = []
+    scanned = scan_location(
+        source,
+        progress=progress,
+        walker_class=functools.partial(StagingWalker, manifest=manifest))
+    media_files = scanned.media_files
+    playlists = scanned.playlists
+    unpredicted = [e['path'] for e in manifest if e['short'] is None]
+
+    write = functools.partial(
+        write_database, stats=stats, collation=collation,
+        split_albums=split_albums)
+
+    # Everything is checked before the stick is written to
+    database = io.BytesIO()
+    build = write(media_files, database, playlists)
+
+    db_directory = os.path.join(target, DATABASE_DIRECTORY)
+    if not os.path.isdir(db_directory):
+        os.mkdir(db_directory)
+    bytes_copied = _copy(source, target, manifest)
+
+    mismatches = []
+    if verify_names or unpredicted:
+        mismatches = verify(target, manifest)
+        missing = [m.path for m in mismatches if m.actual is None]
+        if missing:
+            raise OSError('Not found after copying: {}'.format(
+                ', '.join(missing)))
+        if mismatches:
+            actual = {m.path: m.actual for m in mismatches}
+            for entry in manifest:
+                entry['short'] = actual.get(entry['path'], entry['short'])
+            apply_short_names(source, manifest, media_files)
+            database = io.BytesIO()
+            build = write(media_files, database, playlists)
+        # Names that could not be predicted are not mispredictions
+        mismatches = [m for m in mismatches if m.predicted is not None]
+        for m in mismatches:
+            log.warning('Mispredicted short name for {}: {} is {}'.format(
+                m.path, m.predicted, m.actual))
+
+    db_filename = os.path.join(db_directory, DATABASE_FILE)
+    with open(db_filename, 'wb') as f:
+        f.write(database.getvalue())
+    write_manifest(target, manifest)
+    write_file_stats(db_filename, media_files, source)
+
+    return StageResult(
+        build=build._replace(scan_time=scanned.elapsed),
+        entries=len(manifest),
+        bytes_copied=bytes_copied,
+        unpredicted=unpredicted,
+        mismatches=mismatches)
+
+
+def sync(source, target, stats=None, progress=None, directory_class=None,
+         io_policy=None, collation=None, split_albums=False):
+    '''
+    Copy source to target, reading the tags of each media file from the
+    data copied and the short name of each entry as it is created, then
+    write the database for target.
+
+    Args:
+        source (str): The tree to copy.
+        target (str): The mount point of the (empty) vfat stick.
+        stats (DatabaseStats): If given, the database build is recorded.
+        progress (ProgressReporter): If given, progress is reported.
+        directory_class (callable): Opens a directory of target to read
+            short names from, by default a VfatDirectory.
+        io_policy (str): As for kmeldb.build.scan_location; only the header
+            policy changes how the tags are parsed.
+        collation, split_albums: As for kmeldb.build.write_database.
+
+    Returns:
+        A StageResult, with the short names read in the manifest.
+    '''
+    source = os.path.abspath(source)
+    if any(name != DATABASE_DIRECTORY for name in os.listdir(target)):
+        raise ValueError('{} is not empty'.format(target))
+
+    manifest = []
+    walkers = []
+
+    def walker_class(*args, **kwargs):
+        walker = SyncWalker(
+            *args, manifest=manifest, target=target,
+            directory_class=directory_class, **kwargs)
+        walkers.append(walker)
+        return walker
+
+    scanned = scan_location(
+        source, progress=progress, walker_class=walker_class,
+        io_policy=io_policy)
+    db_filename = os.path.join(target, DATABASE_DIRECTORY, DATABASE_FILE)
+    build = write_database(
+        scanned.media_files,
+        db_filename,
+        scanned.playlists,
+        stats=stats,
+        collation=collation,
+        split_albums=split_albums)
+    write_manifest(target, manifest)
+    write_file_stats(db_filename, scanned.media_files, source)
+
+    return StageResult(
+        build=build._replace(scan_time=scanned.elapsed),
+        entries=len(manifest),
+        bytes_copied=walkers[0].bytes_copied,
+        unpredicted=[],
+        mismatches=[])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Copy a tree to a vfat stick, with its database.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    stage_parser = commands.add_parser(
+        'stage', help='build the database and copy the tree')
+    stage_parser.add_argument(
+        '--verify',
+        action='store_true',
+        help='read back every short name after copying')
+    stage_parser.add_argument('source', help='the staging tree')
+    stage_parser.add_argument('target', help='the mount point of the stick')
+
+    sync_parser = commands.add_parser(
+        'sync', help='copy the tree, reading tags and short names as it goes')
+    sync_parser.add_argument('source', help='the tree to copy')
+    sync_parser.add_argument('target', help='the mount point of the stick')
+
+    verify_parser = commands.add_parser(
+        'verify', help='compare the manifest with the short names on a stick')
+    verify_parser.add_argument('target', help='the mount point of the stick')
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command in ('stage', 'sync'):
+            if args.command == 'stage':
+                result = stage(args.source, args.target, args.verify)
+            else:
+                result = sync(args.source, args.target)
+            print('Copied {} entries ({} bytes); {} titles, {} playlists'
+                  .format(result.entries, result.bytes_copied,
+                          result.build.titles, result.build.playlists))
+            if result.unpredicted:
+                print('Read {} unpredictable short names from {}'.format(
+                    len(result.unpredicted), args.target))
+            mismatches = result.mismatches
+        else:
+            mismatches = verify(args.target)
+    except (IOError, OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    for m in mismatches:
+        print('{}: predicted {}, actual {}'.format(
+            m.path, m.predicted, m.actual))
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+'''
+Timing and size instrumentation for database builds.
+
+A DatabaseStats instance can be handed to a KenwoodDatabase, which will then
+record the elapsed time, the number of bytes emitted and the number of
+entries for each of the tables it writes.
+
+This module defines the following classes:
+    PhaseStats
+    DatabaseStats
+'''
+
+import json
+import time
+
+
+class PhaseStats(object):
+    '''The measurements taken for a single phase of a database build.'''
+
+    def __init__(self, name, group, elapsed, size, entries):
+        '''Store the measurements.
+
+        Args:
+            name (str): The name of the phase (usually the table name).
+            group (str): The group the phase belongs to (main, genre, ...).
+            elapsed (float): The wall clock time taken, in seconds.
+            size (int): The number of bytes written to the database.
+            entries (int): The number of entries written.
+        '''
+        self.name = name
+        self.group = group
+        self.elapsed = elapsed
+        self.size = size
+        self.entries = entries
+
+    def as_dict(self):
+        '''Return the measurements as a dictionary.'''
+        return {
+            'name': self.name,
+            'group': self.group,
+            'elapsed': self.elapsed,
+            'bytes': self.size,
+            'entries': self.entries}
+
+    def __str__(self):
+        return '{:12s} {:28s} {:10.6f}s {:10d} bytes {:7d} entries'.format(
+            self.group,
+            self.name,
+            self.elapsed,
+            self.size,
+            self.entries)
+
+
+class DatabaseStats(object):
+    '''
+    Collects a PhaseStats for each phase of a database build, in the order
+    in which the phases were run.
+    '''
+
+    # Phases in this group re-write data that has already been counted.
+    FIXUP_GROUP = 'fixup'
+
+    def __init__(self):
+        self.phases = []
+
+    def record(self, name, group, db_file, write, entries=0):
+        '''Call write(), recording how long it took and how much it wrote.
+
+        Args:
+            name (str): The name of the phase.
+            group (str): The group the phase belongs to.
+            db_file (file): The file being written, used to count bytes.
+            write (callable): The function that performs the phase.
+            entries (int or callable): The number of entries written, or a
+                callable returning it once the phase has completed.
+        '''
+        start_offset = db_file.tell()
+        start = time.perf_counter()
+        write()
+        elapsed = time.perf_counter() - start
+        if callable(entries):
+            entries = entries()
+        self.phases.append(PhaseStats(
+            name,
+            group,
+            elapsed,
+            db_file.tell() - start_offset,
+            entries))
+
+    def record_elapsed(self, name, group, function, entries=0):
+        '''Call function(), recording how long it took.
+
+        Used for phases that do not write to the database.
+        '''
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        if callable(entries):
+            entries = entries()
+        self.phases.append(PhaseStats(name, group, elapsed, 0, entries))
+        return result
+
+    @property
+    def elapsed(self):
+        '''float: the total time spent in all recorded phases.'''
+        return sum(p.elapsed for p in self.phases)
+
+    @property
+    def size(self):
+        '''int: the number of bytes in the database (re-writes excluded).'''
+        return sum(
+            p.size for p in self.phases if p.group != self.FIXUP_GROUP)
+
+    def groups(self):
+        '''Return a dictionary of per-group totals, in phase order.'''
+        totals = {}
+        for phase in self.phases:
+            if phase.group not in totals:
+                totals[phase.group] = {
+                    'elapsed': 0.0, 'bytes': 0, 'entries': 0}
+            totals[phase.group]['elapsed'] += phase.elapsed
+            totals[phase.group]['bytes'] += phase.size
+            totals[phase.group]['entries'] += phase.entries
+        return totals
+
+    def slowest(self, count=5):
+        '''Return the count slowest phases, slowest first.'''
+        return sorted(
+            self.phases, key=lambda p: p.elapsed, reverse=True)[:count]
+
+    def as_dict(self):
+        '''Return the report as a dictionary suitable for JSON.'''
+        return {
+            'elapsed': self.elapsed,
+            'bytes': self.size,
+            'groups': self.groups(),
+            'phases': [p.as_dict() for p in self.phases]}
+
+    def to_json(self, **kwargs):
+        '''Return the report as a JSON string.'''
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def __str__(self):
+        lines = [str(p) for p in self.phases]
+        lines.append('{:12s} {:28s} {:10.6f}s {:10d} bytes'.format(
+            'total', '', self.elapsed, self.size))
+        return '\n'.join(lines)
@@ -0,0 +1,59 @@
+'''
+Reading of tags from media files.
+
+hsaudiotag's auto.File picks a decoder from the file extension when given a
+path, but tries every decoder in turn when given a file object. TagFile
+restores the extension based choice for file objects, so that wrapped or
+instrumented file objects can be used without extra reads.
+
+A kmeldb.id3.HeaderReader, if given, reads the tags of mp3 files in place
+instead, and TagFile only those it leaves to hsaudiotag.
+
+This module defines the following classes:
+    TagFile
+'''
+
+import os
+from hsaudiotag import auto
+
+
+class TagFile(auto.File):
+    '''An auto.File that reads the tags through an open file object.'''
+
+    def __init__(self, fp, fullname):
+        '''
+        Args:
+            fp (file): An open binary file object for the media file.
+            fullname (str): The name of the file, used to choose a decoder.
+        '''
+        self._set_invalid_attrs()
+        f = None
+        extension = os.path.splitext(fullname)[1][1:].lower()
+        if extension in auto.EXT2CLASS:
+            f = auto.EXT2CLASS[extension](fp)
+            if not f.valid:
+                f = None
+        if f is None:
+            fp.seek(0)
+            f = self._guess_class(fp)
+        if f is not None:
+            self._set_attrs(f)
+
+
+def read_tags(fullname, fp=None, header_reader=None):
+    '''Return an auto.File like object holding the tags for a media file.
+
+    Args:
+        fullname (str): The path to the media file.
+        fp (file): If given, the tags are read through this file object.
+        header_reader (HeaderReader): If given with fp, reads the tags of
+            mp3 files.
+    '''
+    if fp is None:
+        return auto.File(fullname)
+    if header_reader is not None:
+        metadata = header_reader.read(fullname, fp)
+        if metadata is not None:
+            return metadata
+        fp.seek(0)
+    return TagFile(fp, fullname)
@@ -0,0 +1,153 @@
+'''
+Watching for media locations to appear or change.
+
+A Watcher polls for FAT mounts (or checks a fixed list of paths) and calls
+a build function for each location when it first appears, and again when
+its contents change. Changes are detected from the modification times of
+the directories under the location, which change whenever a file is added,
+removed or renamed. A rebuild waits until the directories have stopped
+changing for a while, so that a sync in progress is not built half way
+through.
+
+The kenwood.dap directory is left out of the signature, so that writing
+the database does not itself trigger a rebuild.
+
+This module defines the following classes:
+    Watcher
+'''
+
+import os
+import time
+import logging
+
+log = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 2.0
+DEFAULT_DEBOUNCE = 5.0
+
+# The directory holding the database, ignored when looking for changes
+DATABASE_DIRECTORY = 'kenwood.dap'
+
+
+def directory_signature(path):
+    '''
+    Return a dictionary of the modification time of each directory under
+    path (including path itself), keyed by directory.
+    '''
+    signature = {}
+    pending = [path]
+    while pending:
+        directory = pending.pop()
+        try:
+            signature[directory] = os.stat(directory).st_mtime_ns
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if (entry.is_dir(follow_symlinks=False) and
+                            entry.name != DATABASE_DIRECTORY):
+                        pending.append(entry.path)
+        except OSError:
+            # Removed while being walked, or the device went away
+            continue
+    return signature
+
+
+class _Location(object):
+    '''The state of a watched location.'''
+
+    def __init__(self, signature, changed):
+        self.signature = signature
+        self.changed = changed
+        self.pending = True
+
+
+class Watcher(object):
+    '''Calls a build function when media locations appear or change.'''
+
+    def __init__(
+            self,
+            build,
+            locations,
+            interval=DEFAULT_INTERVAL,
+            debounce=DEFAULT_DEBOUNCE,
+            clock=time.monotonic,
+            sleep=time.sleep):
+        '''
+        Args:
+            build (callable): Called with the path of a location to build.
+            locations (callable): Returns the paths to watch, e.g. the
+                mount points of the FAT mounts. Paths that do not exist
+                are ignored.
+            interval (float): The time between polls, in seconds.
+            debounce (float): How long a location's directories must be
+                unchanged before it is rebuilt, in seconds.
+            clock (callable): Returns the current time in seconds.
+            sleep (callable): Waits for the given number of seconds, or
+                less if something may have changed (e.g. MountTable.wait).
+        '''
+        self._build = build
+        self._locations = locations
+        self._interval = interval
+        self._debounce = debounce
+        self._clock = clock
+        self._sleep = sleep
+
+        self._watched = {}
+        self.builds = 0
+
+    def poll(self):
+        '''
+        Check the locations once, building any that have appeared, or that
+        changed and have since settled. Returns the paths built.
+        '''
+        now = self._clock()
+        present = [p for p in self._locations() if os.path.isdir(p)]
+
+        for path in list(self._watched):
+            if path not in present:
+                log.info('No longer watching {}'.format(path))
+                del self._watched[path]
+
+        built = []
+        for path in present:
+            signature = directory_signature(path)
+            location = self._watched.get(path)
+            if location is None:
+                # Newly mounted locations are built straight away
+                log.info('Watching {}'.format(path))
+                location = self._watched[path] = _Location(signature, None)
+            elif signature != location.signature:
+                log.debug('{} changed'.format(path))
+                location.signature = signature
+                location.changed = now
+                location.pending = True
+                continue
+
+            if location.pending and (
+                    location.changed is None or
+                    now - location.changed >= self._debounce):
+                location.pending = False
+                database = os.path.join(path, DATABASE_DIRECTORY)
+                created = not os.path.isdir(database)
+                self._build(path)
+                self.builds += 1
+                built.append(path)
+                # Changes made during the build are left to the next poll,
+                # against the signature taken before it. Only creating the
+                # database directory changes a directory in the signature.
+                if created and os.path.isdir(database):
+                    try:
+                        location.signature[path] = os.stat(path).st_mtime_ns
+                    except OSError:
+                        pass
+        return built
+
+    def run(self, iterations=None):
+        '''
+        Poll until interrupted, or for the given number of iterations.
+        '''
+        count = 0
+        while iterations is None or count < iterations:
+            self.poll()
+            count += 1
+            if iterations is None or count < iterations:
+                self._sleep(self._interval)
@@ -1,6 +1,10 @@
+import os
 import string
 import random
+import struct
 from kmeldb import MediaFile
+from kmeldb.KenwoodDatabase import KenwoodDatabase
+from kmeldb.playlist import PlaylistFile
 from pprint import pprint
 
 
@@ -134,6 +138,22 @@ def single_performer(
     return media_files
 
 
+def cds_with_playlist():
+    '''
+    Returns the media files of two albums of three tracks, A and B, and a
+    playlist of the fifth and second of them.
+    '''
+    media_files = multiple_cds(['A', 'B'], 3, 1, [0, 3])
+    playlist = PlaylistFile('/music/Favourites.pls')
+    playlist.title = 'Favourites'
+    playlist.media_filenames.extend(
+        [media_files[4].fullname, media_files[1].fullname])
+    for mf in media_files:
+        if mf.fullname in playlist.media_filenames:
+            playlist.add_media_file(mf)
+    return media_files, playlist
+
+
 def random_string(length, suffix=''):
     return ''.join(
         random.choice(
@@ -215,3 +235,107 @@ def random_tracks():
     # Now need to sort media files by album, disc and track to re-index
     # for album in sorted(ALBUM_FILES.keys(), key=str.lower):
     #     print(album)
+
+
+def write_random_database(directory, seed=1):
+    '''
+    Writes a database of random tracks (see random_tracks) to kenwood.dap in
+    directory, and returns its file name.
+    '''
+    random.seed(seed)
+    random_tracks()
+    db = KenwoodDatabase(directory)
+    db.write_db(FILE_LIST, [])
+    db.finalise()
+    return os.path.join(directory, 'kenwood.dap')
+
+
+# An MPEG 1 layer III frame header (128kbps, 44.1kHz, no padding) and the
+# size of the frame it introduces.
+MPEG_FRAME_HEADER = b'\xff\xfb\x90\x64'
+MPEG_FRAME_SIZE = 417
+
+
+def id3v2_tag(title='', artist='', album='', genre='', track='', disc=''):
+    '''
+    Returns an ID3v2.3 tag containing latin-1 text frames for the given
+    values. Empty values are omitted.
+    '''
+    frames = b''
+    for frame_id, value in (
+            (b'TIT2', title),
+            (b'TPE1', artist),
+            (b'TALB', album),
+            (b'TCON', genre),
+            (b'TRCK', track),
+            (b'TPOS', disc)):
+        if value:
+            data = b'\x00' + value.encode('latin_1')
+            frames += frame_id + struct.pack('>IH', len(data), 0) + data
+
+    size = len(frames)
+    syncsafe = bytes([
+        (size >> 21) & 0x7f,
+        (size >> 14) & 0x7f,
+        (size >> 7) & 0x7f,
+        size & 0x7f])
+    return b'ID3\x03\x00\x00' + syncsafe + frames
+
+
+# The GUIDs of the ASF objects written by write_wma
+ASF_HEADER_ID = bytes.fromhex('3026b2758e66cf11a6d900aa0062ce6c')
+ASF_DATA_ID = bytes.fromhex('3626b2758e66cf11a6d900aa0062ce6c')
+ASF_CONTENT_DESCRIPTION_ID = bytes.fromhex('3326b2758e66cf11a6d900aa0062ce6c')
+ASF_EXTENDED_CONTENT_DESCRIPTION_ID = bytes.fromhex(
+    '40a4d0d207e3d21197f000a0c95ea850')
+ASF_PADDING_ID = bytes.fromhex('74d40618dfca0945a4ba9aabcb96aae8')
+
+
+def _asf_object(object_id, data):
+    return object_id + struct.pack('<Q', 24 + len(data)) + data
+
+
+def _asf_string(value):
+    return (value + '\0').encode('utf_16_le')
+
+
+def write_wma(path, title='', artist='', album='', genre='', track='',
+              padding=0):
+    '''
+    Writes a WMA file whose ASF header holds the title and artist in a
+    content description, then padding bytes, then the album, genre and
+    track in an extended content description, followed by an empty data
+    object.
+    '''
+    strings = [_asf_string(title), _asf_string(artist), b'', b'', b'']
+    content = _asf_object(
+        ASF_CONTENT_DESCRIPTION_ID,
+        struct.pack('<5H', *[len(s) for s in strings]) + b''.join(strings))
+    fields = [(name, _asf_string(value)) for name, value in (
+        ('WM/AlbumTitle', album),
+        ('WM/Genre', genre),
+        ('WM/TrackNumber', track)) if value]
+    extended = struct.pack('<H', len(fields))
+    for name, value in fields:
+        name = _asf_string(name)
+        extended += struct.pack('<H', len(name)) + name
+        extended += struct.pack('<HH', 0, len(value)) + value
+    objects = [
+        content,
+        _asf_object(ASF_PADDING_ID, bytes(padding)),
+        _asf_object(ASF_EXTENDED_CONTENT_DESCRIPTION_ID, extended)]
+    header = struct.pack('<IBB', len(objects), 1, 2) + b''.join(objects)
+    with open(path, 'wb') as f:
+        f.write(_asf_object(ASF_HEADER_ID, header))
+        f.write(_asf_object(ASF_DATA_ID, bytes(26)))
+
+
+def write_mp3(path, number_of_frames=10, **tags):
+    '''
+    Writes an mp3 file consisting of an ID3v2.3 tag (see id3v2_tag) followed
+    by silent MPEG frames.
+    '''
+    frame = MPEG_FRAME_HEADER + bytes(MPEG_FRAME_SIZE - len(MPEG_FRAME_HEADER))
+    with open(path, 'wb') as f:
+        f.write(id3v2_tag(**tags))
+        f.write(frame * number_of_frames)
@@ -1,10 +1,42 @@
 #!/usr/bin/env python3
 
+import random
 import unittest
 from kmeldb import AlbumIndexEntry
+from kmeldb.MediaFile import MediaFile
 from tests.create_media_files import single_cd
 
 
+def media_file(index, tracknumber, discnumber):
+    return MediaFile(
+        index=index,
+        fullname='fullname_{}'.format(index),
+        shortdir='shortdir',
+        shortfile='shortfile_{}'.format(index),
+        longdir='performer/album',
+        longfile='{} - Title.mp3'.format(index),
+        title='Title {}'.format(index),
+        performer='performer',
+        album='album',
+        genre='genre',
+        tracknumber=tracknumber,
+        discnumber=discnumber)
+
+
+def probed_slots(titles):
+    '''Place titles by probing one disc at a time, as earlier versions.'''
+    discs_and_tracks = {}
+    for title in titles:
+        discnumber = title.discnumber
+        while title.tracknumber in discs_and_tracks.get(discnumber, {}):
+            discnumber += 1
+        discs_and_tracks.setdefault(
+            discnumber, {})[title.tracknumber] = title.index
+    return [discs_and_tracks[d][t]
+            for d in sorted(discs_and_tracks)
+            for t in sorted(discs_and_tracks[d])]
+
+
 class TestAlbum(unittest.TestCase):
 
     def test_single_cd(self):
@@ -109,3 +141,21 @@ class TestAlbum(unittest.TestCase):
         self.assertEqual(number_of_tracks, len(album._discs_and_tracks[1]))
         self.assertEqual(number_of_tracks, len(album._discs_and_tracks[2]))
         self.assertEqual(number_of_tracks, len(album._discs_and_tracks[3]))
+
+    def test_same_as_probing(self):
+        rng = random.Random(1)
+        for _ in range(500):
+            titles = [
+                media_file(index, rng.randint(0, 12), rng.randint(0, 3))
+                for index in range(rng.randint(1, 60))]
+            album = AlbumIndexEntry.AlbumIndexEntry(
+                name='album', titles=titles, number=1)
+            self.assertEqual(probed_slots(titles), album.title_numbers)
+
+    def test_many_untracked_titles(self):
+        # Each title takes the next disc, without probing the earlier ones
+        titles = [media_file(index, 0, 1) for index in range(5000)]
+        album = AlbumIndexEntry.AlbumIndexEntry(
+            name='album', titles=titles, number=1)
+        self.assertEqual(list(range(5000)), album.title_numbers)
+        self.assertEqual(5000, len(album._discs_and_tracks))
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from kmeldb.KenwoodDatabase import KenwoodDatabase
+from kmeldb.build import build_database, write_database
+from kmeldb.fsck import fsck
+from tests import create_media_files as cmf
+
+
+class TestBuild(unittest.TestCase):
+
+    def setUp(self):
+        self.media_files, self.playlist = cmf.cds_with_playlist()
+        self.indices = [mf.index for mf in self.media_files]
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def build(self):
+        out = io.BytesIO()
+        result = build_database(self.media_files, out, [self.playlist])
+        return result, out.getvalue()
+
+    def test_same_as_writer(self):
+        db = KenwoodDatabase(self.tmpdir.name)
+        db.write_db(list(cmf.multiple_cds(['A', 'B'], 3, 1, [0, 3])), [])
+        db.finalise()
+        with open(os.path.join(self.tmpdir.name, 'kenwood.dap'), 'rb') as f:
+            expected = f.read()
+
+        out = io.BytesIO()
+        result = build_database(self.media_files, out)
+        self.assertEqual(expected, out.getvalue())
+        self.assertEqual(len(expected), result.bytes_written)
+        self.assertEqual(len(self.media_files), result.titles)
+
+    def test_file_output(self):
+        result, data = self.build()
+        filename = os.path.join(self.tmpdir.name, 'kenwood.dap')
+        write_database(self.media_files, filename, [self.playlist])
+        with open(filename, 'rb') as f:
+            self.assertEqual(data, f.read())
+        self.assertTrue(fsck(filename).ok)
+        self.assertEqual(1, result.playlists)
+
+    def test_media_files_unchanged(self):
+        self.build()
+        self.assertEqual(self.indices, [mf.index for mf in self.media_files])
+
+    def test_repeatable(self):
+        first = self.build()[1]
+        self.assertEqual(first, self.build()[1])
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(
+                lambda _: self.build()[1], range(8)))
+        self.assertEqual([first] * 8, results)
+
+    def test_split_albums(self):
+        media_files = cmf.single_cd('Greatest Hits', 3, 1, performer='A')
+        media_files.extend(
+            cmf.single_cd('Greatest Hits', 3, 1, offset=3, performer='B'))
+
+        # With the null album
+        merged = build_database(media_files, io.BytesIO())
+        self.assertEqual(2, merged.albums)
+
+        filename = os.path.join(self.tmpdir.name, 'kenwood.dap')
+        split = build_database(media_files, filename, split_albums=True)
+        self.assertEqual(3, split.albums)
+        self.assertEqual(6, split.titles)
+        self.assertTrue(fsck(filename).ok)
+
+    def test_scan_missing(self):
+        with self.assertRaises(OSError):
+            build_database(
+                os.path.join(self.tmpdir.name, 'missing'), io.BytesIO())
+
+
+if __name__ == '__main__':
+    unittest.main()
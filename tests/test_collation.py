@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+import io
+import unittest
+from kmeldb.collation import Collator, COLLATIONS
+from kmeldb.KenwoodDatabase import KenwoodDatabase
+from kmeldb.MediaFile import MediaFile
+
+NAMES = [
+    'By The Hand Of My Father',
+    'Bäpa',
+    "Banks of Newfoundland",
+    'bapa',
+    "B'apa",
+    'Zoë',
+    'zoo',
+]
+
+
+class TestCollator(unittest.TestCase):
+
+    def test_legacy(self):
+        collator = Collator()
+        self.assertEqual(
+            sorted(NAMES, key=str.lower), sorted(NAMES, key=collator.key))
+        self.assertEqual(
+            sorted(NAMES, key=lambda t: t.lower().replace("'", '')),
+            sorted(NAMES, key=collator.title_key))
+
+    def test_fold(self):
+        collator = Collator('fold')
+        self.assertEqual([
+            'Banks of Newfoundland',
+            "B'apa",
+            'bapa',
+            'Bäpa',
+            'By The Hand Of My Father',
+            'Zoë',
+            'zoo',
+        ], sorted(NAMES, key=collator.key))
+        self.assertEqual(
+            sorted(NAMES, key=collator.key),
+            sorted(NAMES, key=collator.title_key))
+        self.assertLess(collator.key('Straße'), collator.key('Strasse y'))
+
+    def test_locale(self):
+        collator = Collator('locale')
+        ordered = sorted(NAMES, key=collator.key)
+        self.assertEqual(sorted(NAMES), sorted(ordered))
+        self.assertGreater(collator.key("Ba'z"), collator.key('Bab'))
+
+    def test_keys_cached(self):
+        for name in COLLATIONS:
+            collator = Collator(name)
+            key = collator.key('Bäpa')
+            self.assertIs(key, collator.key('Bäpa'))
+            self.assertIs(
+                collator.title_key('Bäpa'), collator.title_key('Bäpa'))
+
+        with self.assertRaises(ValueError):
+            Collator('ebcdic')
+
+
+class TestDatabaseCollation(unittest.TestCase):
+
+    def indices(self, collation):
+        media_files = []
+        for index, album in enumerate(NAMES):
+            media_files.append(MediaFile(
+                index=index,
+                fullname='fullname_{}'.format(index),
+                shortdir='shortdir_{}'.format(index),
+                shortfile='shortfile_{}'.format(index),
+                longdir='performer/{}'.format(album),
+                longfile='{}.mp3'.format(album),
+                title=album,
+                performer='performer',
+                album=album,
+                genre='genre',
+                tracknumber=1,
+                discnumber=1))
+        db = KenwoodDatabase(None, db_file=io.BytesIO(), collation=collation)
+        db.create_indices(media_files, [])
+        albums = [
+            a.encodedName.decode('utf_16_le').rstrip('\0')
+            for a in db.albumIndex]
+        titles = [
+            db.mainIndex[i].title.rstrip('\0')
+            for i in db.alpha_ordered_titles]
+        return albums, titles
+
+    def test_collations(self):
+        albums, titles = self.indices(None)
+        self.assertEqual(
+            [''] + sorted(NAMES, key=str.lower), albums)
+        self.assertEqual(
+            'By The Hand Of My Father', titles[titles.index('Bäpa') - 1])
+
+        albums, titles = self.indices('fold')
+        self.assertEqual(
+            [''] + sorted(NAMES, key=Collator('fold').key), albums)
+        self.assertEqual(albums[1:], titles)
+
+
+if __name__ == '__main__':
+    unittest.main()
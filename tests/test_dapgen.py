@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import subprocess
+import tempfile
+import threading
+import unittest
+import DapGen
+
+
+class TestDapGen(unittest.TestCase):
+
+    def test_group_by_device(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            first = os.path.join(tmpdir, 'first')
+            second = os.path.join(tmpdir, 'second')
+            os.mkdir(first)
+            os.mkdir(second)
+            missing = os.path.join(tmpdir, 'missing')
+
+            groups = DapGen.group_by_device([first, missing, second])
+
+        # Paths on one file system share a worker, in the order given
+        self.assertEqual([[first, second], [missing]], groups)
+
+    def test_failure_is_summarised(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            missing = os.path.join(tmpdir, 'missing')
+            summary = DapGen.process_location(
+                missing, quiet=True, writers=threading.BoundedSemaphore(1))
+
+        self.assertEqual(missing, summary['path'])
+        self.assertEqual(0, summary['files'])
+        self.assertIsNotNone(summary['error'])
+        self.assertIn('FAILED', DapGen.format_summary([summary]))
+
+    def test_heavy_imports_are_deferred(self):
+        from benchmarks.bench_startup import DEFERRED
+        result = subprocess.run(
+            [sys.executable, '-c',
+             'import sys, DapGen; '
+             'print("\\n".join(sorted(sys.modules)))'],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+            check=True)
+        imported = set(result.stdout.split())
+        self.assertEqual([], [m for m in DEFERRED if m in imported])
+
+    def test_modes_are_exclusive(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for mode in (['--watch'], ['--sync', tmpdir]):
+                result = subprocess.run(
+                    [sys.executable, 'DapGen.py', '--plan'] + mode + [tmpdir],
+                    cwd=root,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    universal_newlines=True)
+                self.assertEqual(2, result.returncode)
+                self.assertIn('not allowed with argument --plan', result.stderr)
+            # Nothing was planned or written
+            self.assertEqual([], os.listdir(tmpdir))
+
+    def test_mode_options(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            stats = os.path.join(tmpdir, 'stats.json')
+            for arguments, message in (
+                    (['--watch', '--jobs', '2'],
+                        'argument -j/--jobs: not allowed with argument '
+                        '-w/--watch'),
+                    (['--watch', '--stats', stats],
+                        'argument -s/--stats: not allowed with argument '
+                        '-w/--watch'),
+                    (['--sync', tmpdir, '--profile', 'cpu'],
+                        'argument -p/--profile: not allowed with argument '
+                        '--sync'),
+                    (['--sync', tmpdir, '--io-stats', stats],
+                        'argument --io-stats: not allowed with argument '
+                        '--sync')):
+                result = subprocess.run(
+                    [sys.executable, 'DapGen.py'] + arguments + [tmpdir],
+                    cwd=root,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    universal_newlines=True)
+                self.assertEqual(2, result.returncode)
+                self.assertIn(message, result.stderr)
+            self.assertEqual([], os.listdir(tmpdir))
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from kmeldb.KenwoodDatabase import KenwoodDatabase
+from kmeldb.MediaFile import MediaFile
+from kmeldb.diff import diff
+from tests import create_media_files as cmf
+
+
+def media_files():
+    return cmf.multiple_cds(['A', 'B', 'C'], 3, 1, [0, 3, 6])
+
+
+def retag(mf, **tags):
+    values = {
+        'index': mf.index,
+        'fullname': mf.fullname,
+        'shortdir': mf.shortdir.rstrip('\x00'),
+        'shortfile': mf.shortfile.rstrip('\x00'),
+        'longdir': mf.longdir.rstrip('\x00'),
+        'longfile': mf.longfile.rstrip('\x00'),
+        'title': mf.title.rstrip('\x00'),
+        'performer': mf.performer,
+        'album': mf.album,
+        'genre': mf.genre,
+        'tracknumber': mf.tracknumber,
+        'discnumber': mf.discnumber}
+    values.update(tags)
+    return MediaFile(**values)
+
+
+class TestDiff(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.old = self.write('old', media_files())
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, name, files, split_albums=False):
+        path = os.path.join(self.tmpdir.name, name)
+        os.mkdir(path)
+        db = KenwoodDatabase(path, split_albums=split_albums)
+        db.write_db(files, [])
+        db.finalise()
+        return os.path.join(path, 'kenwood.dap')
+
+    def test_identical(self):
+        new = self.write('new', media_files())
+        result = diff(self.old, new)
+        self.assertTrue(result.identical)
+        self.assertEqual('Databases are identical', str(result))
+
+    def test_added_and_removed(self):
+        files = media_files()
+        removed = files.pop(0)
+        files.append(retag(
+            files[0], index=9, fullname='fullname_9',
+            longfile='9 - Title.mp3', tracknumber=4))
+        new = self.write('new', files)
+        result = diff(self.old, new)
+        self.assertEqual(
+            [removed.longdir.rstrip('\x00') + removed.longfile.rstrip('\x00')],
+            result.removed)
+        self.assertEqual(['Performer A/A9 - Title.mp3'], result.added)
+        self.assertEqual(['A'], result.albums['changed'])
+        self.assertFalse(result.identical)
+
+    def test_retagged(self):
+        files = media_files()
+        files[3] = retag(files[3], album='A', genre='Genre X')
+        new = self.write('new', files)
+        result = diff(self.old, new)
+        self.assertEqual([], result.added)
+        self.assertEqual([], result.removed)
+        self.assertEqual(1, len(result.retagged))
+        path, changes = result.retagged[0]
+        self.assertEqual({'album', 'genre'}, set(changes))
+        self.assertEqual(('B', 'A'), changes['album'])
+        self.assertEqual(['Genre X'], result.genres['added'])
+        self.assertEqual(['A', 'B'], sorted(result.albums['changed']))
+
+    def test_reordered(self):
+        files = media_files()
+        files[0] = retag(files[0], tracknumber=9)
+        new = self.write('new', files)
+        result = diff(self.old, new)
+        self.assertEqual([], result.retagged)
+        self.assertEqual(['A'], result.albums['reordered'])
+        self.assertIn('reordered', result.to_json())
+
+    def test_same_name(self):
+        def greatest_hits(performers, tracks=3):
+            files = []
+            for number, performer in enumerate(performers):
+                files.extend(cmf.single_cd(
+                    'Greatest Hits', tracks, 1, offset=number * 10,
+                    performer=performer))
+            return files
+
+        old = self.write(
+            'split', greatest_hits(['First', 'Second']), split_albums=True)
+
+        # Only the second album changes
+        files = greatest_hits(['First', 'Second'])
+        files.pop()
+        new = self.write('changed', files, split_albums=True)
+        result = diff(old, new)
+        self.assertEqual(['Greatest Hits'], result.albums['changed'])
+        self.assertEqual([], result.albums['added'])
+        self.assertEqual([], result.albums['removed'])
+
+        # Another album of the same name
+        new = self.write(
+            'added', greatest_hits(['First', 'Second', 'Third']),
+            split_albums=True)
+        result = diff(old, new)
+        self.assertEqual(['Greatest Hits'], result.albums['added'])
+        self.assertEqual([], result.albums['changed'])
+        result = diff(new, old)
+        self.assertEqual(['Greatest Hits'], result.albums['removed'])
+
+        new = self.write(
+            'same', greatest_hits(['First', 'Second']), split_albums=True)
+        self.assertTrue(diff(old, new).identical)
+
+
+if __name__ == '__main__':
+    unittest.main()
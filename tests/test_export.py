@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import csv
+import json
+import tempfile
+import unittest
+from kmeldb.KenwoodDatabase import KenwoodDatabase
+from kmeldb.export import export
+from tests import create_media_files as cmf
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.media_files, playlist = cmf.cds_with_playlist()
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        db = KenwoodDatabase(self.tmpdir.name)
+        db.write_db(self.media_files, [playlist])
+        db.finalise()
+        self.filename = os.path.join(self.tmpdir.name, 'kenwood.dap')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def path(self, mf):
+        return mf.longdir.rstrip('\x00') + mf.longfile.rstrip('\x00')
+
+    def test_jsonl(self):
+        out = io.StringIO()
+        count = export(self.filename, out)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(self.media_files), count)
+        self.assertEqual(count, len(records))
+        by_file = {r['longfile']: r for r in records}
+        for mf in self.media_files:
+            record = by_file[mf.longfile.rstrip('\x00')]
+            self.assertEqual('title', record['record'])
+            self.assertEqual(mf.title.rstrip('\x00'), record['title'])
+            self.assertEqual(mf.performer, record['performer'])
+            self.assertEqual(mf.album, record['album'])
+            self.assertEqual(mf.genre, record['genre'])
+            self.assertEqual(
+                record['longdir'] + record['longfile'], record['path'])
+
+    def test_playlists(self):
+        out = io.StringIO()
+        export(self.filename, out, playlists=True)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        entries = [r for r in records if r['record'] == 'playlist']
+        self.assertEqual([0, 1], [r['position'] for r in entries])
+        self.assertEqual({'Favourites'}, {r['playlist'] for r in entries})
+        self.assertEqual(
+            [self.path(self.media_files[4]), self.path(self.media_files[1])],
+            [r['path'] for r in entries])
+
+    def test_csv(self):
+        out = io.StringIO()
+        count = export(self.filename, out, csv_format=True, playlists=True)
+        rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+        self.assertEqual(count, len(rows))
+        self.assertEqual(len(self.media_files) + 2, len(rows))
+        self.assertEqual('', rows[0]['playlist'])
+        self.assertEqual('Favourites', rows[-1]['playlist'])
+
+
+if __name__ == '__main__':
+    unittest.main()
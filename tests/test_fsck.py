@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+import os
+import struct
+import tempfile
+import unittest
+from kmeldb import constants
+from kmeldb.fsck import fsck
+from kmeldb.reader import DatabaseReader
+from tests import create_media_files as cmf
+
+
+class TestFsck(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = cmf.write_random_database(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def patch(self, offset, data):
+        with open(self.filename, 'r+b') as f:
+            f.seek(offset)
+            f.write(data)
+
+    def table(self, table):
+        with DatabaseReader(self.filename) as reader:
+            return reader.offsets[table]
+
+    def test_good_database(self):
+        result = fsck(self.filename)
+        self.assertTrue(result.ok, str(result))
+        self.assertEqual(len(cmf.FILE_LIST), result.title_count)
+
+    def test_not_a_database(self):
+        self.patch(0, b'XXXX')
+        result = fsck(self.filename)
+        self.assertFalse(result.ok)
+        self.assertEqual('header', result.problems[0].table)
+
+    def test_truncated(self):
+        with open(self.filename, 'rb') as f:
+            data = f.read()
+        for length in (4, 34):
+            with open(self.filename, 'wb') as f:
+                f.write(data[:length])
+            result = fsck(self.filename)
+            self.assertFalse(result.ok)
+            self.assertEqual('header', result.problems[0].table)
+
+    def test_offset_past_end(self):
+        self.patch(
+            constants.OFFSETS_OFFSET + 4 * constants.sub_index_offset,
+            struct.pack('<I', os.path.getsize(self.filename) + 1))
+        result = fsck(self.filename)
+        self.assertFalse(result.ok)
+        self.assertEqual('header', result.problems[0].table)
+
+    def test_missing_file(self):
+        result = fsck(os.path.join(self.tmpdir.name, 'missing.dap'))
+        self.assertFalse(result.ok)
+        self.assertEqual('file', result.problems[0].table)
+
+    def test_offsets_out_of_order(self):
+        self.patch(
+            constants.OFFSETS_OFFSET + 4 * constants.genre_index_offset,
+            struct.pack('<I', 0x100))
+        result = fsck(self.filename)
+        self.assertIn('offsets', result.counts)
+
+    def test_title_out_of_range(self):
+        # The genre of the first title
+        self.patch(
+            self.table(constants.main_index_offset),
+            struct.pack('<H', 0xffff))
+        result = fsck(self.filename)
+        self.assertIn('main_index', result.counts)
+
+    def test_unterminated_string(self):
+        with DatabaseReader(self.filename) as reader:
+            title = reader.title(0)
+            length, char_length, offset = title._values[7:10]
+        self.patch(
+            self.table(constants.title_offset) + offset + length - 2,
+            b'xx')
+        result = fsck(self.filename)
+        self.assertIn('main_index', result.counts)
+
+    def test_ordered_titles(self):
+        # Swap the first and last entries of the genre ordered titles
+        start = self.table(constants.genre_title_order_offset)
+        last = start + (len(cmf.FILE_LIST) - 1) * 2
+        with open(self.filename, 'r+b') as f:
+            f.seek(start)
+            first_title = f.read(2)
+            f.seek(last)
+            last_title = f.read(2)
+        self.patch(start, last_title)
+        self.patch(last, first_title)
+        result = fsck(self.filename)
+        self.assertIn('genre_title_order', result.counts)
+
+    def test_sub_index(self):
+        # The count of sub-index 3
+        self.patch(
+            self.table(constants.sub_index_offset) + 4 + 3 * 8 + 6,
+            struct.pack('<H', 1))
+        result = fsck(self.filename)
+        self.assertIn('sub_3', result.counts)
+
+    def test_result_json(self):
+        self.patch(
+            self.table(constants.main_index_offset),
+            struct.pack('<H', 0xffff))
+        result = fsck(self.filename)
+        report = result.as_dict()
+        self.assertFalse(report['ok'])
+        self.assertEqual(len(result.problems), len(report['problems']))
+        self.assertIn('main_index', result.to_json())
+
+
+if __name__ == '__main__':
+    unittest.main()
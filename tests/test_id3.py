@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import tempfile
+import unittest
+from kmeldb.id3 import HeaderReader, HeaderTags
+from kmeldb.iopolicy import IOPolicy
+from kmeldb.scan_stats import ScanStats
+from kmeldb.tags import read_tags
+from tests.create_media_files import \
+    MPEG_FRAME_HEADER, MPEG_FRAME_SIZE, id3v2_tag
+
+AUDIO = (MPEG_FRAME_HEADER + bytes(MPEG_FRAME_SIZE - 4)) * 3
+
+FIELDS = ('title', 'artist', 'album', 'genre', 'track')
+
+
+def syncsafe(size):
+    return bytes([
+        (size >> 21) & 0x7f, (size >> 14) & 0x7f, (size >> 7) & 0x7f,
+        size & 0x7f])
+
+
+def frame(frame_id, data, version=3):
+    if version == 2:
+        return frame_id + len(data).to_bytes(4, 'big')[1:] + data
+    if version == 4:
+        return frame_id + syncsafe(len(data)) + b'\0\0' + data
+    return frame_id + len(data).to_bytes(4, 'big') + b'\0\0' + data
+
+
+def tag(frames, version=3, flags=0):
+    data = b''.join(frames)
+    return b'ID3' + bytes([version, 0, flags]) + syncsafe(len(data)) + data
+
+
+def id3v1(title, track=0, genre=17):
+    return b'TAG' + title.encode('latin_1').ljust(30, b'\0') + \
+        bytes(30) + b'Album'.ljust(30, b'\0') + b'1999' + bytes(28) + \
+        bytes([0, track, genre])
+
+
+class TestHeaderReader(unittest.TestCase):
+
+    def setUp(self):
+        self.reader = HeaderReader()
+
+    def assertSameTags(self, data, fullname='track.mp3'):
+        '''Check the reader and hsaudiotag agree, and return the tags.'''
+        expected = read_tags(fullname, io.BytesIO(data))
+        metadata = self.reader.read(fullname, io.BytesIO(data))
+        self.assertIsNotNone(metadata)
+        for field in FIELDS:
+            self.assertEqual(
+                getattr(expected, field), getattr(metadata, field), field)
+        return metadata
+
+    def test_id3v23(self):
+        metadata = self.assertSameTags(id3v2_tag(
+            title='A Title', artist='An Artist', album='An Album',
+            genre='(17)', track='3/12', disc='1/2') + AUDIO)
+        self.assertEqual(
+            HeaderTags('A Title', 'An Artist', 'An Album', 'Rock', 3),
+            metadata)
+
+    def test_versions(self):
+        self.assertEqual('Two', self.assertSameTags(tag(
+            [frame(b'TT2', b'\0Two', 2), frame(b'TRK', b'\x007', 2)],
+            version=2) + AUDIO).title)
+        long_title = 'Four ' * 40
+        self.assertEqual(long_title.strip(), self.assertSameTags(tag(
+            [frame(b'TPE1', b'\0Artist', 4),
+             frame(b'TIT2', b'\0' + long_title.encode(), 4)],
+            version=4) + AUDIO).title)
+
+    def test_itunes_sizes(self):
+        # A v2.4 tag written with v2.3 (not syncsafe) frame sizes
+        long_title = 'Title ' * 50
+        self.assertEqual(long_title.strip(), self.assertSameTags(tag(
+            [frame(b'TALB', b'\0Album', 3),
+             frame(b'TIT2', b'\0' + long_title.encode(), 3)],
+            version=4) + AUDIO).title)
+
+    def test_encodings(self):
+        self.assertSameTags(tag([
+            frame(b'TIT2', b'\1' + '\ufeffTitr\xe9'.encode('utf_16_le')),
+            frame(b'TPE1', b'\1' + 'No BOM'.encode('utf_16_le')),
+            frame(b'TALB', b'\1\xfe\xff' + 'Album'.encode('utf_16_be') +
+                  b'\xfe\xff\0\0'),
+            frame(b'TCON', b'\2' + 'Caf\xe9'.encode('utf_16_be')),
+            frame(b'TRCK', b'\3\xd9\xa3'),
+        ]) + AUDIO)
+        self.assertSameTags(tag([
+            frame(b'TIT2', b'\3Line\nbreak\0 '),
+            frame(b'TPE1', b'\0Art\xefst'),
+            frame(b'TALB', b'\2odd'),
+            frame(b'TCON', b'\7unknown'),
+        ]) + AUDIO)
+
+    def test_frames_beyond_buffer(self):
+        picture = frame(b'APIC', bytes(40000))
+        metadata = self.assertSameTags(tag([
+            frame(b'TIT2', b'\0Before'), picture,
+            frame(b'TALB', b'\0After'), picture,
+            frame(b'TIT2', b'\0Last')]) + AUDIO)
+        self.assertEqual('Last', metadata.title)
+        self.assertEqual('After', metadata.album)
+
+        # A frame larger than the buffer grows it
+        self.assertSameTags(tag([frame(b'TIT2', b'\0' + b'x' * 20000)]) +
+                            AUDIO)
+
+    def test_extended_header_and_padding(self):
+        self.assertSameTags(tag(
+            [bytes([0, 0, 0, 10]) + bytes(6),
+             frame(b'TIT2', b'\0Extended'), bytes(100)],
+            flags=0x40) + AUDIO)
+
+    def test_id3v1(self):
+        metadata = self.assertSameTags(AUDIO + id3v1('Old', track=4))
+        self.assertEqual(HeaderTags('Old', '', 'Album', 'Rock', 4), metadata)
+
+        # An ID3v2 tag hides an ID3v1 tag
+        self.assertEqual('New', self.assertSameTags(
+            id3v2_tag(title='New') + AUDIO + id3v1('Old')).title)
+
+        # No tags at all
+        self.assertEqual(
+            HeaderTags('', '', '', '', 0), self.assertSameTags(AUDIO))
+
+    def test_left_to_hsaudiotag(self):
+        data = id3v2_tag(title='A Title') + AUDIO
+        self.assertIsNone(self.reader.read('track.wma', io.BytesIO(data)))
+        # The audio does not start right after the tag
+        self.assertIsNone(self.reader.read(
+            'track.mp3', io.BytesIO(id3v2_tag(title='A Title') + b'junk' +
+                                    AUDIO)))
+        # A text frame cut short by the end of the tag, on which
+        # hsaudiotag fails
+        self.assertIsNone(self.reader.read(
+            'track.mp3',
+            io.BytesIO(tag([frame(b'TIT2', b'\0Cut')[:10]]) + AUDIO)))
+        # A tag at the end of the file
+        self.assertIsNone(self.reader.read(
+            'track.mp3', io.BytesIO(AUDIO + b'3DI\x04' + bytes(6))))
+
+        # And the fallback gives hsaudiotag's tags
+        metadata = read_tags(
+            'track.MP3', io.BytesIO(id3v2_tag(title='Junk') + b'junk' +
+                                    AUDIO),
+            self.reader)
+        self.assertEqual('Junk', metadata.title)
+
+
+class TestHeaderPolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.fullname = os.path.join(self.tmpdir.name, 'track.mp3')
+        with open(self.fullname, 'wb') as f:
+            f.write(tag([frame(b'APIC', bytes(30000)),
+                         frame(b'TIT2', b'\0A Title')]))
+            f.write(AUDIO * 10)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_scan_stats(self):
+        stats = ScanStats()
+        metadata = stats.read_tags(self.fullname, IOPolicy('header'))
+        self.assertEqual('A Title', metadata.title)
+        # The head, and the window from the title onwards
+        self.assertEqual(2, stats.files[0].reads)
+
+
+if __name__ == '__main__':
+    unittest.main()
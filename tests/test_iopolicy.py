@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from kmeldb.iopolicy import IOPolicy, POLICIES, PreadFile
+from kmeldb.scan_stats import ScanStats
+from kmeldb.tags import read_tags
+from tests.create_media_files import write_mp3
+
+
+class TestIOPolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.fullname = os.path.join(self.tmpdir.name, 'track.mp3')
+        write_mp3(
+            self.fullname,
+            number_of_frames=100,
+            title='A Title',
+            artist='An Artist',
+            album='An Album',
+            track='3')
+        with open(self.fullname, 'rb') as f:
+            self.data = f.read()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_policies_read_the_same_tags(self):
+        for name in POLICIES:
+            with IOPolicy(name).open(self.fullname) as fp:
+                metadata = read_tags(self.fullname, fp)
+            self.assertEqual('A Title', metadata.title, name)
+            self.assertEqual('An Album', metadata.album, name)
+            self.assertEqual(3, metadata.track, name)
+
+        with self.assertRaises(ValueError):
+            IOPolicy('mmap')
+
+    def test_pread_file(self):
+        buffer = bytearray(16)
+        fd = os.open(self.fullname, os.O_RDONLY)
+        with PreadFile(fd, buffer) as fp:
+            self.assertEqual(self.data[:10], fp.read(10))
+            self.assertEqual(10, fp.tell())
+            self.assertEqual(self.data[10:100], fp.read(90))
+            fp.seek(-128, os.SEEK_END)
+            self.assertEqual(self.data[-128:], fp.read())
+            self.assertEqual(b'', fp.read(10))
+            fp.seek(5)
+            fp.seek(5, os.SEEK_CUR)
+            self.assertEqual(self.data[10:20], fp.read(10))
+            fp.seek(0)
+            self.assertEqual(self.data, fp.read(-1))
+
+        # Larger reads did not grow the shared buffer
+        self.assertEqual(16, len(buffer))
+
+    def test_scan_stats(self):
+        stats = ScanStats()
+        stats.read_tags(self.fullname, IOPolicy('pread'))
+        self.assertEqual('pread', stats.io_policy)
+        self.assertGreater(stats.files[0].bytes_read, 0)
+        self.assertIn('pread', stats.to_json())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,18 +1,112 @@
+import os
+import sys
+import types
 import unittest
+from collections import namedtuple
 from kmeldb import mounts
 
+MOUNTINFO = (
+    '22 1 8:1 / / rw,relatime shared:1 - ext4 /dev/sda1 rw\n'
+    '40 22 8:17 / /media/my\\040stick rw,nosuid shared:20 master:3 - '
+    'vfat /dev/sdb1 rw,fmask=0022\n'
+    '41 22 8:33 / /media/fat_backup rw - ext4 /dev/sdc1 rw\n'
+    'garbage\n')
+
+MOUNT = (
+    '/dev/sda1 on / type ext4 (rw,relatime)\n'
+    '/dev/sdb1 on /media/my stick type vfat (rw,fmask=0022)\n'
+    '/dev/sdc1 on /media/fat_backup type ext4 (rw)\n'
+    '/dev/disk2s1 on /Volumes/CAR (msdos, local, nodev, nosuid)\n'
+    '/dev/disk3s1 on /Volumes/FAT (exfat, local)\n'
+    'garbage\n')
+
+Partition = namedtuple('Partition', ['device', 'mountpoint', 'fstype'])
+
+PARTITIONS = [
+    Partition('/dev/sda1', '/', 'ext4'),
+    Partition('/dev/sdb1', '/media/stick', 'vfat'),
+    Partition('/dev/sdc1', '/media/big', 'exfat'),
+    Partition('/dev/disk2s1', '/Volumes/CAR', 'msdos')]
+
 
 class TestMount(unittest.TestCase):
 
+    def fake_psutil(self):
+        '''Make psutil report PARTITIONS until the test ends.'''
+        psutil = types.ModuleType('psutil')
+        psutil.disk_partitions = lambda: PARTITIONS
+        real = sys.modules.get('psutil')
+        if real is None:
+            self.addCleanup(sys.modules.pop, 'psutil', None)
+        else:
+            self.addCleanup(sys.modules.__setitem__, 'psutil', real)
+        sys.modules['psutil'] = psutil
+
+    @unittest.skipUnless(mounts.have_psutil(), 'no psutil')
     def test_mount(self):
-        mounts1 = mounts.get_fat_mounts()
-        # for mount in mounts1:
-        #     print(mount)
+        self.assertEqual(mounts.get_fat_mounts(), mounts.psutil_fat_mounts())
+
+    def test_psutil_fat_types(self):
+        self.fake_psutil()
+        # The same types as in mountinfo, so no exFAT
+        self.assertEqual(
+            [('/media/stick', 'vfat', '/dev/sdb1'),
+             ('/Volumes/CAR', 'msdos', '/dev/disk2s1')],
+            mounts.psutil_fat_mounts())
+
+    def test_psutil_fallback(self):
+        self.addCleanup(setattr, mounts, 'HAVE_PSUTIL', mounts.HAVE_PSUTIL)
+        self.addCleanup(setattr, mounts, '_mount_table', mounts._mount_table)
+        self.addCleanup(setattr, mounts, 'MOUNTINFO', mounts.MOUNTINFO)
+        self.fake_psutil()
+        mounts.HAVE_PSUTIL = True
+        mounts._mount_table = None
+        mounts.MOUNTINFO = os.path.join(os.sep, 'no', 'mountinfo')
+        self.assertEqual(
+            ['/media/stick', '/Volumes/CAR'],
+            [mountpoint for mountpoint, _, _ in mounts.get_fat_mounts()])
+
+    def test_parse_mount(self):
+        parsed = mounts.parse_mount(MOUNT)
+        self.assertEqual(5, len(parsed))
+        self.assertEqual(
+            ('/media/my stick', 'vfat', '/dev/sdb1'), parsed[1])
+        self.assertEqual(
+            ('/Volumes/CAR', 'msdos', '/dev/disk2s1'), parsed[3])
+        # Only the file system type decides what is FAT
+        self.assertEqual(
+            ['/media/my stick', '/Volumes/CAR'],
+            [m[0] for m in parsed if m[1] in mounts.FAT_TYPES])
+
+    def test_parse_mountinfo(self):
+        parsed = mounts.parse_mountinfo(MOUNTINFO)
+        self.assertEqual(3, len(parsed))
+        stick = parsed[1]
+        self.assertEqual(40, stick.mount_id)
+        self.assertEqual(22, stick.parent_id)
+        self.assertEqual('8:17', stick.device)
+        self.assertEqual('/media/my stick', stick.mountpoint)
+        self.assertEqual('vfat', stick.fstype)
+        self.assertEqual('/dev/sdb1', stick.source)
+        self.assertEqual('rw,fmask=0022', stick.super_options)
+        # Only the file system type decides what is FAT
+        self.assertEqual(
+            ['/media/my stick'],
+            [m.mountpoint for m in parsed if m.fstype in mounts.FAT_TYPES])
+
+    @unittest.skipUnless(
+        os.path.exists(mounts.MOUNTINFO), 'no /proc/self/mountinfo')
+    def test_mount_table_is_cached(self):
+        table = mounts.MountTable()
+        try:
+            first = table.mounts()
+            self.assertTrue(first)
+            self.assertIs(first, table.mounts())
+            self.assertEqual(1, table.reads)
+            self.assertFalse(table.wait(0))
+        finally:
+            table.close()
 
-        if mounts.HAVE_PSUTIL:
-            mounts.HAVE_PSUTIL = False
-            mounts2 = mounts.get_fat_mounts()
-            # for mount in mounts2:
-            #     print(mount)
 
-            self.assertEqual(mounts1, mounts2)
+if __name__ == '__main__':
+    unittest.main()
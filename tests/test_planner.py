@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import tempfile
+import unittest
+from kmeldb.build import write_database
+from kmeldb.planner import plan_database, plan_location, U16_MAX
+from kmeldb.playlist import PlaylistFile
+from kmeldb.seed import SeededTags
+from kmeldb.stats import DatabaseStats
+from tests import create_media_files as cmf
+
+
+class Seed(object):
+    '''The tags of some media files, by file name.'''
+
+    def __init__(self, tags):
+        self._tags = tags
+
+    def tags(self, fullname, longdir, longfile):
+        return self._tags.get(longfile)
+
+
+class TestPlanDatabase(unittest.TestCase):
+
+    def setUp(self):
+        self.media_files, self.playlist = cmf.cds_with_playlist()
+
+    def test_sizes_match_writer(self):
+        indices = [mf.index for mf in self.media_files]
+        plan = plan_database(self.media_files, [self.playlist])
+        self.assertEqual(indices, [mf.index for mf in self.media_files])
+        self.assertTrue(plan.ok)
+
+        stats = DatabaseStats()
+        out = io.BytesIO()
+        result = write_database(
+            self.media_files, out, [self.playlist], stats=stats)
+        self.assertEqual(len(out.getvalue()), plan.size)
+        self.assertEqual(
+            [(p.name, p.group, p.size, p.entries) for p in stats.phases
+             if p.group not in ('fixup', 'prepare')],
+            [(t.name, t.group, t.size, t.entries) for t in plan.tables])
+        self.assertEqual(plan.size, sum(t.size for t in plan.tables))
+        self.assertEqual(
+            (result.titles, result.genres, result.performers, result.albums,
+             result.playlists),
+            (plan.titles, plan.genres, plan.performers, plan.albums,
+             plan.playlists))
+
+    def test_too_many_playlists(self):
+        playlists = [self.playlist] * (U16_MAX + 1)
+        plan = plan_database(self.media_files, playlists)
+        self.assertFalse(plan.ok)
+        self.assertEqual(
+            [('playlists', U16_MAX + 1, U16_MAX)],
+            [(e.name, e.value, e.maximum) for e in plan.exceeded])
+        self.assertIsNone(plan.size)
+        self.assertIn('EXCEEDED playlists', str(plan))
+
+    def test_field_too_large(self):
+        # A genre name longer than its length can hold, and a playlist with
+        # more entries than a title list can hold
+        media_files = self.media_files + cmf.single_cd(
+            'C', 3, 1, offset=6, genre='G' * (U16_MAX // 2 + 1))
+        playlist = PlaylistFile('/music/Long.pls')
+        playlist.title = 'Long'
+        playlist._media_files = dict(
+            enumerate(media_files * (U16_MAX // 9 + 1)))
+        plan = plan_database(media_files, [playlist])
+        self.assertFalse(plan.ok)
+        # Every table that is too large is reported
+        self.assertEqual(
+            [('genre_index', None, U16_MAX),
+             ('playlist_index', None, U16_MAX)],
+            [(e.name, e.value, e.maximum) for e in plan.exceeded])
+        self.assertEqual(len(media_files), plan.titles)
+        self.assertIsNone(plan.size)
+
+
+class TestPlanLocation(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        album = os.path.join(self.tmpdir.name, 'Artist', 'Album')
+        os.makedirs(album)
+        for number in range(1, 4):
+            cmf.write_mp3(
+                os.path.join(album, '{:02d} Track.mp3'.format(number)),
+                title='Title {}'.format(number),
+                artist='Tagged Artist',
+                album='Tagged Album',
+                genre='Rock',
+                track=str(number))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_without_tags(self):
+        # Not vfat, so the short names are predicted
+        plan = plan_location(self.tmpdir.name)
+        self.assertTrue(plan.ok)
+        self.assertEqual(3, plan.titles)
+        self.assertEqual(3, plan.estimated)
+        # No tags are read: albums and performers are taken from the
+        # directories, and there is no genre
+        self.assertEqual(
+            (1, 2, 2), (plan.genres, plan.performers, plan.albums))
+        self.assertGreater(plan.size, 0)
+        # Nothing is written
+        self.assertEqual(['Artist'], os.listdir(self.tmpdir.name))
+
+    def test_with_seed(self):
+        seed = Seed({'01 Track.mp3': SeededTags(
+            'Title 1', 'Tagged Artist', 'Tagged Album', 'Rock', 1)})
+        plan = plan_location(self.tmpdir.name, seed=seed)
+        self.assertEqual(3, plan.titles)
+        self.assertEqual(2, plan.estimated)
+        self.assertEqual(
+            (2, 3, 3), (plan.genres, plan.performers, plan.albums))
+        self.assertEqual(plan.albums, plan.as_dict()['albums'])
+
+
+if __name__ == '__main__':
+    unittest.main()
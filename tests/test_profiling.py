@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+
+import os
+import pstats
+import tempfile
+import unittest
+from kmeldb.KenwoodDatabase import KenwoodDatabase
+from kmeldb.profiling import Profiler
+from tests import create_media_files as cmf
+
+
+def build(path):
+    db = KenwoodDatabase(path)
+    db.write_db(cmf.single_cd('Album 1', 10, 1), [])
+    db.finalise()
+    return db
+
+
+class TestProfiling(unittest.TestCase):
+
+    def test_both(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            profiler = Profiler('both', tmpdir, '/media/usb stick', top=5)
+            db = profiler.run('write', build, tmpdir)
+            self.assertIsInstance(db, KenwoodDatabase)
+
+            self.assertEqual(2, len(profiler.files))
+            for path in profiler.files:
+                self.assertTrue(os.path.exists(path))
+                self.assertTrue(
+                    os.path.basename(path).startswith('media_usb_stick_'))
+
+            pstats_files = [f for f in profiler.files if f.endswith('.pstats')]
+            stats = pstats.Stats(pstats_files[0])
+            self.assertTrue(any(
+                func[2] == 'write_db' for func in stats.stats))
+
+            mem_files = [f for f in profiler.files if f.endswith('_mem.txt')]
+            with open(mem_files[0]) as f:
+                self.assertIn('peak', f.read())
+
+    def test_bad_mode(self):
+        with self.assertRaises(ValueError):
+            Profiler('disk', '.', '/')
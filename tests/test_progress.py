@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import json
+import tempfile
+import unittest
+from kmeldb.progress import ProgressReporter, expected_total
+from kmeldb.KenwoodDatabase import KenwoodDatabase
+from tests.create_media_files import single_cd
+
+
+class FakeTTY(io.StringIO):
+
+    def isatty(self):
+        return True
+
+
+class TestProgress(unittest.TestCase):
+
+    def test_not_a_tty(self):
+        stream = io.StringIO()
+        progress = ProgressReporter(stream=stream, interval=0)
+        self.assertFalse(progress.enabled)
+        for index in range(10):
+            progress.update(index + 1, 0)
+        progress.finish()
+        self.assertEqual('', stream.getvalue())
+
+    def test_rate_limited(self):
+        stream = FakeTTY()
+        progress = ProgressReporter(stream=stream, interval=3600)
+        for index in range(1000):
+            progress.update(index + 1, 0)
+        # Nothing until the interval has elapsed
+        self.assertEqual('', stream.getvalue())
+        progress.finish()
+        self.assertIn('Files: 1000, Playlists: 0', stream.getvalue())
+
+    def test_json_lines(self):
+        stream = FakeTTY()
+        json_stream = io.StringIO()
+        progress = ProgressReporter(
+            label='/media/usb',
+            stream=stream,
+            json_stream=json_stream,
+            interval=0,
+            total=10)
+        for index in range(5):
+            progress.update(index + 1, 1)
+        progress.finish()
+
+        events = [json.loads(line)
+                  for line in json_stream.getvalue().splitlines()]
+        self.assertEqual(6, len(events))
+        self.assertEqual('done', events[-1]['event'])
+        self.assertEqual(5, events[-1]['files'])
+        self.assertEqual('/media/usb', events[-1]['location'])
+        self.assertEqual(10, events[-1]['total'])
+        self.assertIn('ETA', stream.getvalue())
+
+    def test_expected_total(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db = KenwoodDatabase(tmpdir)
+            db.write_db(single_cd('Album', 7, 1), [])
+            db.finalise()
+            self.assertEqual(
+                7, expected_total(os.path.join(tmpdir, 'kenwood.dap')))
+            self.assertIsNone(
+                expected_total(os.path.join(tmpdir, 'missing.dap')))
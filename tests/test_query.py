@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import tempfile
+import unittest
+from kmeldb.reader import DatabaseReader
+from kmeldb.query import DatabaseQuery
+from tests import create_media_files as cmf
+
+
+class TestQuery(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.reader = DatabaseReader(
+            cmf.write_random_database(self.tmpdir.name, seed=2))
+        self.query = DatabaseQuery(self.reader)
+
+        # The answers, the slow way
+        self.titles = [
+            (t.number, t.genre, t.performer, t.album)
+            for t in self.reader.titles()]
+
+    def tearDown(self):
+        self.reader.close()
+        self.tmpdir.cleanup()
+
+    def expected(self, field, genre=None, performer=None, album=None):
+        found = set()
+        for number, g, p, a in self.titles:
+            if genre not in (None, g) or performer not in (None, p) or \
+                    album not in (None, a):
+                continue
+            found.add({'title': number, 'performer': p, 'album': a}[field])
+        return sorted(found)
+
+    def test_genres(self):
+        for genre in range(1, self.reader.genre_count):
+            self.assertEqual(
+                self.expected('performer', genre=genre),
+                list(self.query.performers_for_genre(genre)))
+            self.assertEqual(
+                self.expected('album', genre=genre),
+                list(self.query.albums_for_genre(genre)))
+            self.assertEqual(
+                self.expected('title', genre=genre),
+                sorted(self.query.titles_for_genre(genre)))
+
+            for album in range(self.reader.album_count):
+                self.assertEqual(
+                    self.expected('title', genre=genre, album=album),
+                    sorted(self.query.titles_for_genre_album(genre, album)))
+
+            for performer in range(1, self.reader.performer_count):
+                self.assertEqual(
+                    self.expected('album', genre=genre, performer=performer),
+                    list(self.query.albums_for_genre_performer(
+                        genre, performer)))
+                self.assertEqual(
+                    self.expected('title', genre=genre, performer=performer),
+                    sorted(self.query.titles_for_genre_performer(
+                        genre, performer)))
+                for album in range(self.reader.album_count):
+                    self.assertEqual(
+                        self.expected(
+                            'title', genre=genre, performer=performer,
+                            album=album),
+                        sorted(self.query.titles_for_genre_performer_album(
+                            genre, performer, album)))
+
+    def test_performers(self):
+        for performer in range(1, self.reader.performer_count):
+            self.assertEqual(
+                self.expected('album', performer=performer),
+                list(self.query.albums_for_performer(performer)))
+            self.assertEqual(
+                self.expected('title', performer=performer),
+                sorted(self.query.titles_for_performer(performer)))
+            for album in range(self.reader.album_count):
+                self.assertEqual(
+                    self.expected('title', performer=performer, album=album),
+                    sorted(self.query.titles_for_performer_album(
+                        performer, album)))
+
+    def test_albums(self):
+        for album in range(self.reader.album_count):
+            self.assertEqual(
+                self.expected('title', album=album),
+                sorted(self.query.titles_for_album(album)))
+
+    def test_number_zero(self):
+        self.assertRaises(ValueError, self.query.performers_for_genre, 0)
+        self.assertRaises(ValueError, self.query.albums_for_performer, 0)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+import io
+import struct
+import tempfile
+import unittest
+from kmeldb import constants
+from kmeldb.reader import DatabaseReader, HEADER_SIZE, OFFSETS_FORMAT
+from tests import create_media_files as cmf
+from kmeldb.KenwoodDatabase import KenwoodDatabase
+from kmeldb.MediaFile import MediaFile
+from kmeldb.playlist import PlaylistFile
+import KenwoodDBReader
+
+
+class TestReader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = cmf.write_random_database(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_matches_parser(self):
+        parsed = KenwoodDBReader.DBfile(self.filename)
+        with DatabaseReader(self.filename) as reader:
+            self.assertEqual(len(parsed.entries), len(reader))
+            for expected in parsed.entries:
+                title = reader.title(expected.index_number)
+                self.assertEqual(expected.title, title.title)
+                self.assertEqual(expected.shortdir, title.shortdir)
+                self.assertEqual(expected.shortfile, title.shortfile)
+                self.assertEqual(expected.longdir, title.longdir)
+                self.assertEqual(expected.longfile, title.longfile)
+                self.assertEqual(
+                    (expected.genre, expected.performer, expected.album),
+                    (title.genre, title.performer, title.album))
+
+            for kind in ('genres', 'performers', 'albums'):
+                expected_entries = getattr(parsed, kind)
+                self.assertEqual(
+                    len(expected_entries),
+                    getattr(reader, kind[:-1] + '_count'))
+                for expected in expected_entries:
+                    entry = getattr(reader, kind[:-1])(expected.index_number)
+                    self.assertEqual(expected.name, entry.name)
+                    self.assertEqual(len(expected.titles), len(entry))
+                    self.assertEqual(tuple(expected.titles), entry.titles)
+
+    def test_selective_parse(self):
+        parsed = KenwoodDBReader.DBfile(
+            self.filename, tables=KenwoodDBReader.DUMP_TABLES['title'])
+        self.assertIn('main_index', parsed.parsed)
+        self.assertNotIn('genres', parsed.parsed)
+        self.assertFalse(hasattr(parsed, 'genres'))
+
+        out = io.StringIO()
+        parsed.show_genres(out)
+        self.assertIn('genres', parsed.parsed)
+        # A heading, one line per genre and one per title in each genre
+        number_of_genres = parsed.details[KenwoodDBReader.genre_count][0]
+        self.assertEqual(
+            2 + number_of_genres + len(parsed.entries),
+            out.getvalue().count('\n'))
+
+    def test_bulk_matches_unbulk(self):
+        # Characters outside the BMP are surrogate pairs in utf_16_le, so
+        # the title and long file tables fall back to decoding each string
+        names = [
+            ('Sonnenstrahl \U0001f3b5', 'Sonnenstrahl.mp3'),
+            ('B\u00e4pa', '\U0001f3b8 Title.mp3'),
+            ('By The Hand Of My Father', 'By The Hand.mp3')]
+        media_files = [
+            MediaFile(
+                index=index,
+                fullname='fullname_{}'.format(index),
+                shortdir='SHORTDIR',
+                shortfile='TRACK{}.MP3'.format(index),
+                longdir='Performer/Album',
+                longfile=longfile,
+                title=title,
+                performer='Performer',
+                album='Album',
+                genre='Genre',
+                tracknumber=index + 1,
+                discnumber=1)
+            for index, (title, longfile) in enumerate(names)]
+        playlist = PlaylistFile('/music/Favourites.pls')
+        playlist.title = 'Favourites \U0001f3b5'
+        for mf in media_files[::-1]:
+            playlist.media_filenames.append(mf.fullname)
+            playlist.add_media_file(mf)
+        db = KenwoodDatabase(self.tmpdir.name)
+        db.write_db(media_files, [playlist])
+        db.finalise()
+
+        dumps = []
+        entries = []
+        for bulk in (True, False):
+            parsed = KenwoodDBReader.DBfile(
+                self.filename, bulk=bulk, tables=KenwoodDBReader.TABLES)
+            out = io.StringIO()
+            parsed.show_titles(out)
+            parsed.show_genres(out)
+            parsed.show_performers(out)
+            parsed.show_albums(out)
+            parsed.show_playlists(out)
+            out.write(str(parsed))
+            dumps.append(out.getvalue())
+            entries.append([
+                (e.title, e.shortdir, e.shortfile, e.longdir, e.longfile)
+                for e in parsed.entries])
+        self.assertEqual(dumps[0], dumps[1])
+        self.assertEqual(entries[0], entries[1])
+        self.assertEqual(
+            names,
+            [(title, longfile) for title, _, _, _, longfile in entries[0]])
+
+    def test_string_table(self):
+        text = 'ab\U0001f3b5cd'
+        data = text.encode(KenwoodDBReader.STRING_ENCODING)
+        table = KenwoodDBReader.StringTable(
+            data, 0, len(data), KenwoodDBReader.STRING_ENCODING)
+        self.assertEqual('cd', table.get(8, 4))
+        self.assertEqual('\U0001f3b5', table.get(4, 4))
+        # Past the end of the table is decoded from the buffer
+        table = KenwoodDBReader.StringTable(
+            data, 0, 4, KenwoodDBReader.STRING_ENCODING)
+        self.assertEqual('\U0001f3b5cd', table.get(4, 8))
+
+    def test_bounds(self):
+        with DatabaseReader(self.filename) as reader:
+            self.assertRaises(IndexError, reader.title, len(reader))
+            self.assertRaises(IndexError, reader.genre, -1)
+            self.assertRaises(IndexError, reader.album, reader.album_count)
+
+    def test_not_a_database(self):
+        with open(self.filename, 'wb') as f:
+            f.write(b'nothing to see')
+        self.assertRaises(ValueError, DatabaseReader, self.filename)
+
+    def test_truncated(self):
+        with open(self.filename, 'rb') as f:
+            data = f.read()
+        for length in (4, 34, HEADER_SIZE - 1):
+            with open(self.filename, 'wb') as f:
+                f.write(data[:length])
+            self.assertRaises(ValueError, DatabaseReader, self.filename)
+
+        # Every offset is in the file, but the tables are not
+        with open(self.filename, 'wb') as f:
+            f.write(data[:self.last_offset(data)])
+        with DatabaseReader(self.filename):
+            pass
+        with open(self.filename, 'wb') as f:
+            f.write(data[:self.last_offset(data) - 1])
+        self.assertRaises(ValueError, DatabaseReader, self.filename)
+
+    def last_offset(self, data):
+        return max(struct.unpack_from(
+            OFFSETS_FORMAT, data, constants.OFFSETS_OFFSET))
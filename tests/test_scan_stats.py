@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from kmeldb.scan_stats import ScanStats, FileStats, percentile
+from tests.create_media_files import write_mp3
+
+
+class TestScanStats(unittest.TestCase):
+
+    def test_read_tags(self):
+        stats = ScanStats()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fullname = os.path.join(tmpdir, 'track.mp3')
+            write_mp3(
+                fullname,
+                title='A Title',
+                artist='An Artist',
+                album='An Album',
+                track='3')
+            size = os.path.getsize(fullname)
+
+            metadata = stats.read_tags(fullname)
+
+        self.assertEqual('A Title', metadata.title)
+        self.assertEqual('An Artist', metadata.artist)
+        self.assertEqual('An Album', metadata.album)
+        self.assertEqual(3, metadata.track)
+
+        self.assertEqual(1, len(stats.files))
+        self.assertEqual(size, stats.files[0].size)
+        self.assertGreater(stats.files[0].bytes_read, 0)
+        self.assertGreater(stats.files[0].reads, 0)
+        self.assertEqual(stats.files[0].bytes_read, stats.bytes_read)
+
+    def test_latency_report(self):
+        stats = ScanStats()
+        for index in range(100):
+            stats.files.append(FileStats(
+                'file_{}'.format(index), 1000, 100, 1, 0,
+                (index + 1) / 1000.0))
+
+        latency = stats.percentiles()
+        self.assertAlmostEqual(0.050, latency['p50'])
+        self.assertAlmostEqual(0.095, latency['p95'])
+        self.assertAlmostEqual(0.099, latency['p99'])
+
+        self.assertEqual(100, sum(count for _, count in stats.histogram()))
+
+        slowest = stats.slowest()
+        self.assertEqual(20, len(slowest))
+        self.assertEqual('file_99', slowest[0].fullname)
+
+        self.assertIn('p95', str(stats))
+        self.assertEqual(0.0, percentile([], 0.5))
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from kmeldb.linux_dir_parser import DirWalker
+from kmeldb.schedule import physical_location, physical_order
+from tests import create_media_files as cmf
+
+
+class TestSchedule(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filenames = []
+        # Created in reverse, so that directory and creation order differ
+        for number in range(8, 0, -1):
+            filename = '{:02d} Track.mp3'.format(number)
+            cmf.write_mp3(
+                os.path.join(self.tmpdir.name, filename),
+                title='Title {}'.format(number),
+                artist='Artist',
+                album='Album',
+                track=str(number))
+            self.filenames.insert(0, filename)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def fullname(self, filename):
+        return os.path.join(self.tmpdir.name, filename)
+
+    def test_physical_order(self):
+        fullnames = [self.fullname(f) for f in self.filenames]
+        missing = self.fullname('missing.mp3')
+        ordered = physical_order([missing] + fullnames)
+        self.assertEqual(sorted(fullnames), sorted(ordered[:-1]))
+        self.assertEqual(missing, ordered[-1])
+        keys = [physical_location(f) for f in ordered[:-1]]
+        self.assertEqual(sorted(keys), keys)
+
+    def walk(self, schedule):
+        media_files = []
+        walker = DirWalker(
+            self.tmpdir.name, [], media_files, schedule=schedule)
+        walker._paths['.'] = {'shortname': '/'}
+        for number, filename in enumerate(self.filenames):
+            walker.add_entry(
+                self.tmpdir.name, '.', '/', filename,
+                '{:08d}.MP3'.format(number))
+        if schedule == 'physical':
+            # Nothing is read until the end of the walk
+            self.assertEqual([], media_files)
+            walker.read_scheduled()
+        return media_files
+
+    def test_results_in_directory_order(self):
+        scheduled = self.walk('physical')
+        self.assertEqual(
+            [repr(mf) for mf in self.walk('directory')],
+            [repr(mf) for mf in scheduled])
+        self.assertEqual(list(range(8)), [mf.index for mf in scheduled])
+        self.assertEqual('Title 1\x00', scheduled[0].title)
+
+
+if __name__ == '__main__':
+    unittest.main()
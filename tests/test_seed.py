@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import tempfile
+import unittest
+from kmeldb.KenwoodDatabase import KenwoodDatabase
+from kmeldb.MediaFile import MediaFile
+from kmeldb.seed import (
+    FILE_STATS_FILE, SeededTags, load_seed, write_file_stats)
+from tests import create_media_files as cmf
+
+
+class TestSeed(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.media_files = cmf.multiple_cds(['A', 'B'], [3, 2], 1, [0, 3])
+        # Give the media files real files, written well before the database
+        past = time.time() - 60
+        for mf in self.media_files:
+            mf._fullname = os.path.join(self.tmpdir.name, mf.fullname)
+            with open(mf.fullname, 'wb'):
+                pass
+            os.utime(mf.fullname, (past, past))
+        db = KenwoodDatabase(self.tmpdir.name)
+        db.write_db(self.media_files, [])
+        db.finalise()
+        self.filename = os.path.join(self.tmpdir.name, 'kenwood.dap')
+        write_file_stats(self.filename, self.media_files)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def lookup(self, seed, mf):
+        return seed.tags(
+            mf.fullname, mf.longdir.rstrip('\x00'), mf.longfile.rstrip('\x00'))
+
+    def test_unchanged_files(self):
+        seed = load_seed(self.filename)
+        self.assertEqual(len(self.media_files), len(seed))
+        for mf in self.media_files:
+            tags = self.lookup(seed, mf)
+            self.assertEqual(mf.title.rstrip('\x00'), tags.title)
+            self.assertEqual(mf.performer, tags.artist)
+            self.assertEqual(mf.album, tags.album)
+            self.assertEqual(mf.genre, tags.genre)
+            # Tracks are numbered by their position in the album
+            self.assertEqual(mf.tracknumber, tags.track)
+        self.assertEqual(len(self.media_files), len(seed.reused))
+
+    def test_changed_file(self):
+        seed = load_seed(self.filename)
+        mf = self.media_files[0]
+        os.utime(mf.fullname, None)
+        self.assertIsNone(self.lookup(seed, mf))
+        self.assertNotIn(mf.fullname, seed.reused)
+
+    def test_retagged_copy(self):
+        # Copied over by rsync -a or cp -p after being re-tagged, so it is
+        # still older than the database
+        seed = load_seed(self.filename)
+        mf = self.media_files[0]
+        st = os.stat(mf.fullname)
+        with open(mf.fullname, 'wb') as f:
+            f.write(b'ID3 re-tagged')
+        os.utime(mf.fullname, (st.st_atime, st.st_mtime))
+        self.assertIsNone(self.lookup(seed, mf))
+
+        # Re-tagged in place in its padding, keeping its size
+        mf = self.media_files[1]
+        past = os.stat(mf.fullname).st_mtime - 10
+        os.utime(mf.fullname, (past, past))
+        self.assertIsNone(self.lookup(seed, mf))
+        self.assertEqual(set(), seed.reused)
+
+    def test_no_file_stats(self):
+        os.remove(os.path.join(self.tmpdir.name, FILE_STATS_FILE))
+        self.assertIsNone(load_seed(self.filename))
+
+    def test_unknown_file(self):
+        seed = load_seed(self.filename)
+        self.assertIsNone(seed.tags(
+            self.media_files[0].fullname, '/elsewhere/', 'new.mp3'))
+
+    def test_no_database(self):
+        os.remove(self.filename)
+        self.assertIsNone(load_seed(self.filename))
+
+    def test_bad_database(self):
+        with open(self.filename, 'r+b') as f:
+            f.write(b'XXXX')
+        self.assertIsNone(load_seed(self.filename))
+
+    def test_reconcile(self):
+        seed = load_seed(self.filename)
+        for mf in self.media_files:
+            self.lookup(seed, mf)
+        # A new file joins album A
+        new = MediaFile(
+            index=5, fullname='new', shortdir='', shortfile='', longdir='',
+            longfile='', title='New', performer='Performer A', album='A',
+            genre='Genre A', tracknumber=4, discnumber=1)
+
+        def read_tags(fullname):
+            return SeededTags('', '', '', '', track=7, disc=2)
+
+        seed.reconcile(self.media_files + [new], read_tags)
+        self.assertEqual(3, seed.reread)
+        for mf in self.media_files:
+            if mf.album == 'A':
+                self.assertEqual((7, 2), (mf.tracknumber, mf.discnumber))
+                self.assertNotIn(mf.fullname, seed.reused)
+            else:
+                self.assertIn(mf.fullname, seed.reused)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+import unittest
+from kmeldb.shortnames import ShortNameDirectory, basis_name
+
+
+class TestShortNames(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = ShortNameDirectory()
+
+    def test_valid_short_names(self):
+        self.assertEqual('KENWOOD.DAP', self.directory.add('kenwood.dap'))
+        self.assertEqual('README.TXT', self.directory.add('Readme.txt'))
+        self.assertEqual('TRACK', self.directory.add('TRACK'))
+
+    def test_numeric_tails(self):
+        self.assertEqual(
+            'LONGFI~1.MP3', self.directory.add('Long File Name.mp3'))
+        self.assertEqual(
+            'LONGFI~2.MP3', self.directory.add('Long File Names.mp3'))
+        self.assertEqual('LONGFI~1.WMA', self.directory.add('Long File.wma'))
+        self.assertEqual('A_B~1.MP3', self.directory.add('a+b.mp3'))
+        self.assertEqual('01-TRA~1.MP3', self.directory.add('01 - Track.mp3'))
+        self.assertEqual('ABCDEF~1.MPE', self.directory.add('abcdefgh.mpeg'))
+
+    def test_extensions(self):
+        self.assertEqual('BASHRC~1', self.directory.add('.bashrc'))
+        self.assertEqual('XTAR~1.GZ', self.directory.add('x.tar.gz'))
+        self.assertEqual(('TRACK', '', True, True), basis_name('track...'))
+
+    def test_reserved(self):
+        self.directory.reserve('Long File Name.mp3', 'LONGFI~1.MP3')
+        self.assertEqual(
+            'LONGFI~2.MP3', self.directory.add('Long File Names.mp3'))
+
+    def test_unpredictable(self):
+        for n in range(9):
+            self.assertEqual(
+                'TRACKN~{}.MP3'.format(n + 1),
+                self.directory.add('Track number {}.mp3'.format(n)))
+        self.assertIsNone(self.directory.add('Track number 9.mp3'))
+        self.assertIsNone(self.directory.add('Über.mp3'))
+        self.assertEqual('__~1.MP3', self.directory.add('日本.mp3'))
+
+    def test_clashes(self):
+        self.directory.add('Long File Name.mp3')
+        with self.assertRaises(FileExistsError):
+            self.directory.add('LONG FILE NAME.MP3')
+        with self.assertRaises(FileExistsError):
+            self.directory.add('LONGFI~1.MP3')
+        with self.assertRaises(ValueError):
+            self.directory.add('what?.mp3')
+        with self.assertRaises(ValueError):
+            self.directory.add('...')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from kmeldb.linux_dir_parser import DirWalker
+from kmeldb.reader import DatabaseReader
+from kmeldb.seed import read_file_stats
+from kmeldb.shortnames import ShortNameDirectory
+from kmeldb.iopolicy import HEADER_SIZE
+from kmeldb.staging import COPY_CHUNK_SIZE, read_manifest, stage, sync
+from kmeldb.stats import DatabaseStats
+from tests import create_media_files as cmf
+
+
+class PredictedDirectory(object):
+    '''Stands in for a VfatDirectory, with the predicted short names.'''
+
+    def __init__(self, path):
+        self.names = ShortNameDirectory()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def short_name(self, filename):
+        return self.names.add(filename)
+
+
+class TestStaging(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmpdir.name, 'source')
+        self.target = os.path.join(self.tmpdir.name, 'target')
+        os.mkdir(self.target)
+        album = os.path.join(self.source, 'The Artist', 'Second Album')
+        os.makedirs(album)
+        os.makedirs(os.path.join(self.source, 'kenwood.dap'))
+        for name in ('02 Second Track.mp3', '01 First Track.mp3', 'notes.txt'):
+            with open(os.path.join(album, name), 'wb') as f:
+                f.write(b'not really an mp3')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_stage(self):
+        result = stage(self.source, self.target)
+        self.assertEqual(2, result.build.titles)
+        self.assertEqual([], result.unpredicted)
+
+        manifest = read_manifest(self.target)
+        self.assertEqual([
+            ('The Artist', True, 'THEART~1'),
+            ('The Artist/Second Album', True, 'SECOND~1'),
+            ('The Artist/Second Album/01 First Track.mp3', False,
+             '01FIRS~1.MP3'),
+            ('The Artist/Second Album/02 Second Track.mp3', False,
+             '02SECO~1.MP3'),
+            ('The Artist/Second Album/notes.txt', False, 'NOTES.TXT')],
+            [(e['path'], e['dir'], e['short']) for e in manifest])
+        for entry in manifest:
+            self.assertTrue(
+                os.path.exists(os.path.join(self.target, entry['path'])))
+
+        filename = os.path.join(self.target, 'kenwood.dap', 'kenwood.dap')
+        with DatabaseReader(filename) as reader:
+            titles = sorted(
+                (t.shortdir, t.shortfile, t.longfile)
+                for t in reader.titles())
+        self.assertEqual([
+            ('/THEART~1/SECOND~1/', '01FIRS~1.MP3', '01 First Track.mp3'),
+            ('/THEART~1/SECOND~1/', '02SECO~1.MP3', '02 Second Track.mp3')],
+            titles)
+
+        # The copies are recorded for seeding, not the staged files
+        st = os.stat(os.path.join(
+            self.target, 'The Artist', 'Second Album', '01 First Track.mp3'))
+        self.assertEqual(
+            (st.st_size, st.st_mtime),
+            read_file_stats(filename)[
+                ('/The Artist/Second Album/', '01 First Track.mp3')])
+
+    def test_sync(self):
+        album = os.path.join(self.source, 'The Artist', 'Second Album')
+        cmf.write_mp3(
+            os.path.join(album, '03 Third Track.mp3'),
+            title='Tagged Title', artist='Tagged Artist',
+            album='Tagged Album', track='3')
+        with open(os.path.join(album, '03 Third Track.mp3'), 'rb') as f:
+            data = f.read()
+
+        result = self.sync()
+        self.assertEqual(3, result.build.titles)
+        self.assertEqual(
+            3 * len(b'not really an mp3') + len(data), result.bytes_copied)
+
+        copied = os.path.join(
+            self.target, 'The Artist', 'Second Album', '03 Third Track.mp3')
+        with open(copied, 'rb') as f:
+            self.assertEqual(data, f.read())
+        self.assertEqual(
+            '03THIR~1.MP3',
+            read_manifest(self.target)[4]['short'])
+
+        filename = os.path.join(self.target, 'kenwood.dap', 'kenwood.dap')
+        with DatabaseReader(filename) as reader:
+            titles = {t.title: t for t in reader.titles()}
+            entry = titles['Tagged Title']
+            self.assertEqual('03THIR~1.MP3', entry.shortfile)
+            self.assertEqual('/THEART~1/SECOND~1/', entry.shortdir)
+            self.assertEqual(
+                'Tagged Artist', reader.performer(entry.performer).name)
+
+    def test_sync_tags_from_copy(self):
+        album = os.path.join(self.source, 'The Artist', 'Second Album')
+        # A tag larger than the head kept for other files, and a file
+        # with only an ID3v1 tag, after more than one chunk of audio
+        cmf.write_mp3(
+            os.path.join(album, '03 Picture.mp3'),
+            title='After Picture', artist='Pictured', album='x' * 20000)
+        frame = cmf.MPEG_FRAME_HEADER + bytes(
+            cmf.MPEG_FRAME_SIZE - len(cmf.MPEG_FRAME_HEADER))
+        with open(os.path.join(album, '04 Old.mp3'), 'wb') as f:
+            f.write(frame * (COPY_CHUNK_SIZE // len(frame) + 10))
+            f.write(b'TAG' + b'Old Title'.ljust(30, b'\0') +
+                    b'Old Artist'.ljust(30, b'\0') + bytes(30) + b'1999' +
+                    bytes(30) + b'\x11')
+
+        result = self.sync()
+        self.assertEqual(4, result.build.titles)
+
+        filename = os.path.join(self.target, 'kenwood.dap', 'kenwood.dap')
+        with DatabaseReader(filename) as reader:
+            performers = {
+                t.title: reader.performer(t.performer).name
+                for t in reader.titles()}
+        self.assertEqual('Pictured', performers['After Picture'])
+        self.assertEqual('Old Artist', performers['Old Title'])
+
+    def test_sync_wma_tags_from_copy(self):
+        # The album, genre and track come after a header larger than the
+        # head kept for an mp3 without an ID3v2 tag
+        album = os.path.join(self.source, 'The Artist', 'Second Album')
+        cmf.write_wma(
+            os.path.join(album, '03 Windows.wma'),
+            title='Windows Title', artist='Windows Artist',
+            album='Windows Album', genre='Windows Genre', track='3',
+            padding=HEADER_SIZE)
+
+        self.sync()
+
+        filename = os.path.join(self.target, 'kenwood.dap', 'kenwood.dap')
+        with DatabaseReader(filename) as reader:
+            entry = {t.title: t for t in reader.titles()}['Windows Title']
+            self.assertEqual(
+                ('Windows Artist', 'Windows Album', 'Windows Genre'),
+                (reader.performer(entry.performer).name,
+                 reader.album(entry.album).name,
+                 reader.genre(entry.genre).name))
+
+    def sync(self):
+        '''Sync the source, failing if any tags are read a second time.'''
+        def read_tags(walker, fullname):
+            raise AssertionError('Read {} again'.format(fullname))
+
+        self.addCleanup(setattr, DirWalker, 'read_tags', DirWalker.read_tags)
+        DirWalker.read_tags = read_tags
+        return sync(
+            self.source, self.target, directory_class=PredictedDirectory)
+
+    def test_sync_options(self):
+        # An album of the same name by another performer
+        album = os.path.join(self.source, 'Other Artist', 'Second Album')
+        os.makedirs(album)
+        with open(os.path.join(album, '01 Other.mp3'), 'wb') as f:
+            f.write(b'not really an mp3')
+
+        stats = DatabaseStats()
+        result = sync(
+            self.source, self.target, stats=stats,
+            directory_class=PredictedDirectory, io_policy='header',
+            collation='fold', split_albums=True)
+        # The null album, and Second Album twice
+        self.assertEqual(3, result.build.albums)
+        self.assertGreater(stats.size, 0)
+
+    def test_target_not_empty(self):
+        open(os.path.join(self.target, 'other.mp3'), 'wb').close()
+        with self.assertRaises(ValueError):
+            stage(self.source, self.target)
+
+
+if __name__ == '__main__':
+    unittest.main()
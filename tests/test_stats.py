@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import tempfile
+import unittest
+from kmeldb.KenwoodDatabase import KenwoodDatabase
+from kmeldb.stats import DatabaseStats
+from tests import create_media_files as cmf
+
+
+class TestStats(unittest.TestCase):
+
+    def test_stats(self):
+        mf = cmf.multiple_cds(
+            album_names=['Album 1', 'Album 2', 'Album 3'],
+            numbers_of_tracks=10,
+            disc_numbers=1,
+            offsets=[0, 10, 20])
+
+        stats = DatabaseStats()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db = KenwoodDatabase(tmpdir, stats=stats)
+            db.write_db(mf, [])
+            db.finalise()
+            file_size = os.path.getsize(os.path.join(tmpdir, 'kenwood.dap'))
+
+        names = [p.name for p in stats.phases]
+        for name in ['indices', 'main_index', 'titles', 'genre_titles',
+                     'performer_index', 'album_titles', 'playlist_index']:
+            self.assertIn(name, names)
+        for sub in range(13):
+            self.assertIn('sub_{}'.format(sub), names)
+
+        # Re-written tables are not counted twice
+        self.assertEqual(file_size, stats.size)
+
+        phases = {p.name: p for p in stats.phases if p.group != 'fixup'}
+        self.assertEqual(30, phases['main_index'].entries)
+        self.assertEqual(30 * 64, phases['main_index'].size)
+        self.assertEqual(30 * 2, phases['alpha_title_order'].size)
+        self.assertEqual(4, phases['genre_index'].entries)
+
+        report = json.loads(stats.to_json())
+        self.assertEqual(file_size, report['bytes'])
+        self.assertIn('sub_index', report['groups'])
+
+    def test_disabled(self):
+        mf = cmf.single_cd('Album 1', 5, 1)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db = KenwoodDatabase(tmpdir)
+            db.write_db(mf, [])
+            db.finalise()
+            self.assertIsNone(db.stats)
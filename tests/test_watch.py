@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from kmeldb.watch import Watcher, directory_signature
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestWatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.location = os.path.join(self.tmpdir.name, 'stick')
+        os.mkdir(self.location)
+        self.mounted = [self.location]
+        self.built = []
+        self.clock = FakeClock()
+        self.watcher = Watcher(
+            self.build,
+            lambda: self.mounted,
+            interval=1.0,
+            debounce=3.0,
+            clock=self.clock,
+            sleep=self.clock.sleep)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def build(self, path):
+        self.built.append(path)
+        # Writing the database must not look like a change
+        database = os.path.join(path, 'kenwood.dap')
+        if not os.path.exists(database):
+            os.mkdir(database)
+        with open(os.path.join(database, 'kenwood.dap'), 'wb') as f:
+            f.write(b'KWDB')
+
+    def touch_directory(self, name):
+        directory = os.path.join(self.location, name)
+        os.mkdir(directory)
+        # Make sure the modification time moves on
+        stat = os.stat(self.location)
+        os.utime(self.location, ns=(stat.st_atime_ns,
+                                    stat.st_mtime_ns + 1000000000))
+
+    def test_signature_skips_database(self):
+        before = directory_signature(self.location)
+        self.build(self.location)
+        self.assertEqual(
+            set(before), set(directory_signature(self.location)))
+
+    def test_new_mount_is_built(self):
+        self.mounted = []
+        self.watcher.run(iterations=2)
+        self.assertEqual([], self.built)
+        self.mounted = [self.location]
+        self.watcher.run(iterations=2)
+        self.assertEqual([self.location], self.built)
+
+    def test_change_is_debounced(self):
+        self.watcher.poll()
+        self.assertEqual([self.location], self.built)
+
+        self.touch_directory('album')
+        self.watcher.poll()
+        self.clock.sleep(2.0)
+        self.watcher.poll()
+        # Not yet settled
+        self.assertEqual(1, len(self.built))
+
+        self.clock.sleep(1.0)
+        self.watcher.poll()
+        self.assertEqual(2, len(self.built))
+
+        # Nothing changed since
+        self.clock.sleep(10.0)
+        self.watcher.poll()
+        self.assertEqual(2, self.watcher.builds)
+
+    def test_change_during_build(self):
+        def build(path):
+            self.build(path)
+            if len(self.built) == 1:
+                self.touch_directory('added while building')
+
+        self.watcher._build = build
+        self.watcher.poll()
+        self.assertEqual(1, len(self.built))
+
+        # The change is seen against the signature taken before the build
+        self.watcher.poll()
+        self.clock.sleep(3.0)
+        self.watcher.poll()
+        self.assertEqual(2, len(self.built))
+
+        self.clock.sleep(10.0)
+        self.watcher.poll()
+        self.assertEqual(2, self.watcher.builds)
+
+    def test_unmount_and_remount(self):
+        self.watcher.poll()
+        self.mounted = []
+        self.watcher.poll()
+        self.mounted = [self.location]
+        self.watcher.poll()
+        self.assertEqual([self.location, self.location], self.built)
+
+
+if __name__ == '__main__':
+    unittest.main()